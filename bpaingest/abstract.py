@@ -7,6 +7,7 @@ from urllib.parse import urlparse, urljoin, quote
 from .libs import ingest_utils
 from .libs.excel_wrapper import (
     ExcelWrapper,
+    evict_workbook,
     make_field_definition as fld,
     make_skip_column as skp,
 )
@@ -92,6 +93,7 @@ class BaseMetadata:
         for error in wrapper.get_errors():
             self._logger.error(error)
         rows = list(wrapper.get_all())
+        evict_workbook(fname)
         return rows
 
     def parse_md5file_unwrapped(self, fname):
@@ -101,8 +103,9 @@ class BaseMetadata:
 
     def parse_md5file(self, fname):
         p = self.parse_md5file_unwrapped(fname)
-        for tpl in p.matches:
-            yield tpl
+        # the file is read as the matches are consumed, rather than up front
+        for match in p:
+            yield match.path, match.md5, match.groupdict()
         for tpl in p.no_match:
             self._logger.error("No match for filename: `%s'" % tpl)
 
@@ -643,6 +646,7 @@ class BaseDatasetControlContextual:
                     if field in self.contextual_linkage:
                         continue
                     row_meta[name_mapping.get(field, field)] = value
+        evict_workbook(fname)
         return dataset_metadata
 
     def filename_metadata(self, *args, **kwargs):
@@ -835,6 +839,7 @@ class BaseLibraryContextual:
                     row, library_metadata, os.path.basename(fname), wrapper.modified
                 )
 
+        evict_workbook(fname)
         return library_metadata
 
     def process_row(self, row, library_metadata, metadata_filename, metadata_modified):
@@ -0,0 +1,204 @@
+import json
+import os
+import sqlite3
+import threading
+
+from .pkgcache import search_packages
+from .util import make_logger
+
+
+logger = make_logger(__name__)
+
+MIRROR_FILENAME = "ckan-mirror.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS packages (
+    address TEXT NOT NULL,
+    id TEXT NOT NULL,
+    type TEXT NOT NULL,
+    package TEXT NOT NULL,
+    PRIMARY KEY (address, id)
+);
+CREATE INDEX IF NOT EXISTS packages_type ON packages (address, type);
+CREATE TABLE IF NOT EXISTS resources (
+    address TEXT NOT NULL,
+    id TEXT NOT NULL,
+    package_id TEXT NOT NULL,
+    PRIMARY KEY (address, id)
+);
+CREATE INDEX IF NOT EXISTS resources_package ON resources (address, package_id);
+CREATE TABLE IF NOT EXISTS refreshes (
+    address TEXT NOT NULL,
+    type TEXT NOT NULL,
+    metadata_modified TEXT NOT NULL,
+    PRIMARY KEY (address, type)
+);
+"""
+
+
+def solr_timestamp(metadata_modified):
+    """
+    CKAN's metadata_modified (e.g. 2023-05-01T01:02:03.456789) as a Solr date,
+    truncated to the millisecond
+    """
+    return metadata_modified[:23] + "Z"
+
+
+class CKANMirror:
+    """
+    a snapshot of the packages of each type in a CKAN instance, held in SQLite.
+    after the first refresh of a type, only packages modified since the previous
+    refresh are retrieved, along with a listing of package ids to drop deleted
+    packages. the snapshot is keyed by CKAN address, so several instances can be
+    mirrored in one file
+    """
+
+    def __init__(self, ckan, path):
+        self._ckan = ckan
+        self._address = getattr(ckan, "address", "")
+        self.db_path = os.path.join(path, MIRROR_FILENAME)
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(self.db_path, check_same_thread=False)
+        with self._con:
+            self._con.executescript(SCHEMA)
+
+    def close(self):
+        self._con.close()
+
+    def _store(self, packages):
+        with self._lock, self._con:
+            for package in packages:
+                self._con.execute(
+                    "DELETE FROM resources WHERE address=? AND package_id=?",
+                    (self._address, package["id"]),
+                )
+                self._con.execute(
+                    "INSERT OR REPLACE INTO packages VALUES (?, ?, ?, ?)",
+                    (
+                        self._address,
+                        package["id"],
+                        package["type"],
+                        json.dumps(package, separators=(",", ":")),
+                    ),
+                )
+                self._con.executemany(
+                    "INSERT OR REPLACE INTO resources VALUES (?, ?, ?)",
+                    (
+                        (self._address, t["id"], package["id"])
+                        for t in package.get("resources", [])
+                    ),
+                )
+
+    def _prune(self, typ, extant_ids):
+        with self._lock, self._con:
+            gone = [
+                package_id
+                for (package_id,) in self._con.execute(
+                    "SELECT id FROM packages WHERE address=? AND type=?",
+                    (self._address, typ),
+                )
+                if package_id not in extant_ids
+            ]
+            for package_id in gone:
+                self._con.execute(
+                    "DELETE FROM packages WHERE address=? AND id=?",
+                    (self._address, package_id),
+                )
+                self._con.execute(
+                    "DELETE FROM resources WHERE address=? AND package_id=?",
+                    (self._address, package_id),
+                )
+        return len(gone)
+
+    def _last_modified(self, typ):
+        row = self._con.execute(
+            "SELECT metadata_modified FROM refreshes WHERE address=? AND type=?",
+            (self._address, typ),
+        ).fetchone()
+        return row[0] if row else None
+
+    def refresh(self, typ):
+        "bring the packages of type `typ` up to date with CKAN"
+        last_modified = self._last_modified(typ)
+        packages = []
+        if last_modified is None:
+            logger.info("CKAN mirror: retrieving all packages of type: {}".format(typ))
+            search_packages(self._ckan, typ, packages.append)
+            extant_ids = set(t["id"] for t in packages)
+        else:
+            logger.info(
+                "CKAN mirror: retrieving packages of type {} modified since {}".format(
+                    typ, last_modified
+                )
+            )
+            search_packages(
+                self._ckan,
+                typ,
+                packages.append,
+                fq="metadata_modified:[{} TO *]".format(solr_timestamp(last_modified)),
+            )
+            extant_ids = set()
+            search_packages(
+                self._ckan,
+                typ,
+                lambda t: extant_ids.add(t["id"] if isinstance(t, dict) else t),
+                fl="id",
+            )
+        self._store(packages)
+        pruned = self._prune(typ, extant_ids)
+        modified = [t["metadata_modified"] for t in packages]
+        if last_modified is not None:
+            modified.append(last_modified)
+        if modified:
+            with self._lock, self._con:
+                self._con.execute(
+                    "INSERT OR REPLACE INTO refreshes VALUES (?, ?, ?)",
+                    (self._address, typ, max(modified)),
+                )
+        logger.info(
+            "CKAN mirror: {} packages of type {} updated, {} removed".format(
+                len(packages), typ, pruned
+            )
+        )
+
+    def packages(self, typ):
+        for (package,) in self._con.execute(
+            "SELECT package FROM packages WHERE address=? AND type=? ORDER BY id",
+            (self._address, typ),
+        ).fetchall():
+            yield json.loads(package)
+
+    def update(self, package):
+        "record a package as returned by CKAN after it was changed by this run"
+        self._store([package])
+
+    def show_package(self, package_id):
+        "as package_show, from the snapshot. None if the package is not mirrored"
+        row = self._con.execute(
+            "SELECT package FROM packages WHERE address=? AND id=?",
+            (self._address, package_id),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def show_resource(self, resource_id):
+        "as resource_show, from the snapshot. None if the resource is not mirrored"
+        row = self._con.execute(
+            "SELECT package_id FROM resources WHERE address=? AND id=?",
+            (self._address, resource_id),
+        ).fetchone()
+        if row is None:
+            return None
+        for resource in self.show_package(row[0])["resources"]:
+            if resource["id"] == resource_id:
+                return resource
+
+
+def make_ckan_mirror(logger, ckan, args):
+    if not args.ckan_mirror:
+        return None
+    if not args.download_path:
+        raise Exception("To use the CKAN mirror, download_path arg must also be set.")
+    os.makedirs(args.download_path, exist_ok=True)
+    mirror = CKANMirror(ckan, args.download_path)
+    logger.info("Activated CKAN mirror at {}".format(mirror.db_path))
+    return mirror
@@ -6,13 +6,16 @@ import os
 from .util import (
     make_registration_decorator,
     make_ckan_api,
+    make_legacy_size_cache_path,
     make_reuploads_cache_path,
+    make_upload_state_path,
     validate_write_reuploads_interval,
 )
 from .sync import sync_metadata
 from .schema import generate_schemas
-from .ops import print_accounts, make_organization
+from .ops import print_accounts, make_organization, set_ckan_rate_limit
 from .dump import dump_state
+from .ckanmirror import make_ckan_mirror
 from .util import make_logger
 from .genhash import genhash as genhash_fn
 from .projects import ProjectInfo
@@ -75,6 +78,24 @@ def setup_sync(subparser):
     subparser.add_argument(
         "--uploads", type=int, default=4, help="number of parallel uploads"
     )
+    subparser.add_argument(
+        "--package-threads",
+        type=int,
+        default=4,
+        help="number of packages to sync with CKAN in parallel",
+    )
+    subparser.add_argument(
+        "--ckan-rate-limit",
+        type=float,
+        default=None,
+        help="maximum requests per second to the CKAN host",
+    )
+    subparser.add_argument(
+        "--upload-order",
+        choices=("largest", "smallest", "listed"),
+        default="largest",
+        help="order in which queued resources are re-uploaded",
+    )
     subparser.add_argument(
         "--metadata-only",
         "-m",
@@ -109,7 +130,7 @@ def setup_sync(subparser):
         "--write-reuploads-interval",
         "-i",
         type=int,
-        help="write reuploads to disk interval when uploading resources (e.g., 100 means a reupload write occurs after 100 resources uploaded).",
+        help="sync the reuploads journal to disk after this many upload events (e.g., 100 means an fsync occurs after every 100 events).",
     )
     subparser.add_argument(
         "--read-reuploads",
@@ -119,6 +140,12 @@ def setup_sync(subparser):
         default=False,
         help="read reuploads from disk",
     )
+    subparser.add_argument(
+        "--upload-state-max-age",
+        type=int,
+        default=7,
+        help="abort multipart uploads not resumed and completed within this many days",
+    )
     subparser.add_argument(
         "--audit",
         action="store_const",
@@ -126,6 +153,12 @@ def setup_sync(subparser):
         default=False,
         help="verify and update audit tags on known resources",
     )
+    subparser.add_argument(
+        "--audit-manifest",
+        default=None,
+        help="with --audit, write S3 Batch Operations manifests to this directory "
+        "rather than tagging",
+    )
     subparser.add_argument(
         "-p", "--download-path", required=False, default=None, help="CKAN base url"
     )
@@ -143,6 +176,52 @@ def setup_sync(subparser):
         default=None,
         help="Process a single ticket only",
     )
+    subparser.add_argument(
+        "--ckan-mirror",
+        action="store_const",
+        const=True,
+        default=False,
+        help="keep a snapshot of CKAN in the download path, refreshed incrementally",
+    )
+    subparser.add_argument(
+        "--legacy-size-cache",
+        action="store_const",
+        const=True,
+        default=False,
+        help="keep the sizes of files in the archive in the download path between runs",
+    )
+    subparser.add_argument(
+        "--s3-index",
+        action="store_const",
+        const=True,
+        default=False,
+        help="check resources against a listing of the S3 bucket, rather than "
+        "requesting each from CKAN",
+    )
+    subparser.add_argument(
+        "--s3-inventory",
+        default=None,
+        help="with --s3-index, read the bucket's objects from this S3 Inventory "
+        "manifest.json (CSV format, downloaded) rather than listing the bucket",
+    )
+    subparser.add_argument(
+        "--fingerprints",
+        default=None,
+        help="directory to record synced objects in, so unchanged objects are skipped",
+    )
+    subparser.add_argument(
+        "--force-full-compare",
+        action="store_const",
+        const=True,
+        default=False,
+        help="compare every object with CKAN, even if unchanged since the last sync",
+    )
+    subparser.add_argument(
+        "--full-compare-days",
+        type=int,
+        default=7,
+        help="compare every object with CKAN if not done within this many days",
+    )
 
 
 def setup_hash(subparser):
@@ -158,15 +237,44 @@ def setup_hash(subparser):
         nargs="?",
         default=os.environ.get("MIRROR_PATH"),
     )
+    subparser.add_argument(
+        "--processes",
+        type=int,
+        default=4,
+        help="number of files to hash in parallel",
+    )
+    subparser.add_argument(
+        "--ckan-mirror",
+        action="store_const",
+        const=True,
+        default=False,
+        help="keep a snapshot of CKAN in the download path, refreshed incrementally",
+    )
 
 
 def setup_dump(subparser):
     subparser.add_argument("filename", help="output target")
     subparser.add_argument("--dump-re", help="restrict dump by slug", default="")
     subparser.add_argument(
-        "--sql-context", help="generate excel file from sql db if available"
+        "--sql-context", help="read contextual metadata from sql db if available"
+    )
+    subparser.add_argument(
+        "--sql-context-excel-copy",
+        help="also write an excel copy of the sql db contextual metadata",
     )
     subparser.add_argument("--validate-schema", help="validate schema if applicable")
+    subparser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of slugs to generate state for in parallel",
+    )
+    subparser.add_argument(
+        "--format",
+        choices=("json", "ndjson"),
+        default="json",
+        help="ndjson streams each data type to the output as it is generated",
+    )
     setup_ckan(subparser, required=False)
 
 
@@ -181,17 +289,34 @@ def sync(args):
     ckan = make_ckan_api(args)
 
     logger = make_cli_logger(args)
+    reuploads_path = make_reuploads_cache_path(logger, args)
     kwargs = {
         "write_reuploads": args.write_reuploads,
         "read_reuploads": args.read_reuploads,
-        "reuploads_path": make_reuploads_cache_path(logger, args),
+        "reuploads_path": reuploads_path,
+        "upload_state_path": make_upload_state_path(reuploads_path),
+        "upload_state_max_age": args.upload_state_max_age,
         "write_reuploads_interval": validate_write_reuploads_interval(logger, args),
+        "upload_order": args.upload_order,
+        "ckan_mirror": make_ckan_mirror(logger, ckan, args),
+        "fingerprints_path": args.fingerprints,
+        "force_full_compare": args.force_full_compare,
+        "full_compare_days": args.full_compare_days,
+        "package_threads": args.package_threads,
+        "audit_manifest_path": args.audit_manifest,
+        "legacy_size_cache_path": make_legacy_size_cache_path(logger, args),
+        "s3_index": args.s3_index,
+        "s3_inventory_path": args.s3_inventory,
     }
+    set_ckan_rate_limit(args.ckan_rate_limit)
     with DownloadMetadata(
         logger,
         project_cli_options[args.project_name],
         path=args.download_path,
+        incremental_fetch=args.incremental_fetch,
+        contextual_cache_path=args.contextual_cache,
     ) as dlmeta:
+        kwargs["legacy_listed_sizes"] = dlmeta.listed_sizes()
         sync_metadata(
             ckan,
             dlmeta.meta,
@@ -206,6 +331,8 @@ def sync(args):
             **kwargs,
         )
         print_accounts()
+    if kwargs["ckan_mirror"] is not None:
+        kwargs["ckan_mirror"].close()
 
 
 @register_command
@@ -225,13 +352,25 @@ def genhash(args):
     verify MD5 sums for a local (filesystem mounted) mirror of the BPA
     data, and generate expected E-Tag and SHA256 values.
     """
+    logger = make_cli_logger(args)
+    ckan_mirror = make_ckan_mirror(logger, ckan, args)
     with DownloadMetadata(
-        make_cli_logger(args),
+        logger,
         project_cli_options[args.project_name],
         path=args.download_path,
+        incremental_fetch=args.incremental_fetch,
+        contextual_cache_path=args.contextual_cache,
     ) as dlmeta:
-        genhash_fn(ckan, dlmeta.meta, args.mirror_path, num_threads=4)
+        genhash_fn(
+            ckan,
+            dlmeta.meta,
+            args.mirror_path,
+            num_threads=args.processes,
+            ckan_mirror=ckan_mirror,
+        )
         print_accounts()
+    if ckan_mirror is not None:
+        ckan_mirror.close()
 
 
 sync.setup = setup_sync
@@ -278,6 +417,19 @@ def main():
     parser.add_argument(
         "--log-level", required=False, default="INFO", choices=LOG_LEVELS.keys()
     )
+    parser.add_argument(
+        "--incremental-fetch",
+        action="store_const",
+        const=True,
+        default=False,
+        help="re-fetch metadata in the download path, downloading only changed files",
+    )
+    parser.add_argument(
+        "--contextual-cache",
+        required=False,
+        default=None,
+        help="directory to cache parsed contextual metadata in, shared between runs",
+    )
 
     subparsers = parser.add_subparsers(dest="name")
     for name, fn, setup_fn, help_text in sorted(commands()):
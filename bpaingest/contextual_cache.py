@@ -0,0 +1,165 @@
+import copy
+import functools
+import hashlib
+import os
+import pickle
+import threading
+
+_PACKAGE_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# parsed contextual metadata, shared by every DownloadMetadata in this process
+_memory_cache = {}
+_memory_cache_lock = threading.Lock()
+
+
+def _hash_file(digest, path):
+    with open(path, "rb") as fd:
+        for block in iter(lambda: fd.read(1 << 20), b""):
+            digest.update(block)
+
+
+def _source_files(path, metadata_patterns):
+    """
+    the files under `path` that the contextual class reads, i.e. those the
+    fetcher downloaded for it
+    """
+    for dirpath, dirnames, filenames in os.walk(path):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if metadata_patterns is not None and not any(
+                p.match(filename) for p in metadata_patterns
+            ):
+                continue
+            yield os.path.join(dirpath, filename)
+
+
+@functools.lru_cache(maxsize=None)
+def _package_digest(root=_PACKAGE_ROOT):
+    """
+    digest of the source of every module under `root`. contextual classes call
+    helpers throughout the package (ingest_utils, excel_wrapper, ...), so any
+    change to the package's source invalidates the cache
+    """
+    digest = hashlib.sha256()
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.endswith(".py"):
+                source_file = os.path.join(dirpath, filename)
+                digest.update(os.path.relpath(source_file, root).encode())
+                _hash_file(digest, source_file)
+    return digest.hexdigest()
+
+
+def contextual_cache_key(contextual_cls, path):
+    """
+    key for a contextual class parsed from `path`: the class, the source of the
+    bpaingest package, and the content of its metadata files. the location of
+    the files plays no part, so slugs sharing a contextual class share the
+    parsed result
+    """
+    digest = hashlib.sha256()
+    digest.update(
+        "{}.{}".format(contextual_cls.__module__, contextual_cls.__qualname__).encode()
+    )
+    digest.update(_package_digest().encode())
+    for source_file in _source_files(
+        path, getattr(contextual_cls, "metadata_patterns", None)
+    ):
+        digest.update(os.path.relpath(source_file, path).encode())
+        _hash_file(digest, source_file)
+    return digest.hexdigest()
+
+
+class ContextualCache:
+    """
+    builds contextual metadata objects, reusing any earlier parse of the same
+    class from identical source files. parsed objects are kept in memory for
+    the life of the process and, if `cache_path` is given, pickled there for
+    later processes (e.g. one `bpa-ingest sync` per slug)
+    """
+
+    def __init__(self, logger, cache_path=None):
+        self._logger = logger
+        self.cache_path = cache_path
+        if cache_path is not None:
+            os.makedirs(cache_path, exist_ok=True)
+
+    def _disk_path(self, contextual_cls, key):
+        return os.path.join(
+            self.cache_path, "{}-{}.pickle".format(contextual_cls.__name__, key)
+        )
+
+    def _read_disk(self, contextual_cls, key):
+        if self.cache_path is None:
+            return None
+        disk_path = self._disk_path(contextual_cls, key)
+        try:
+            with open(disk_path, "rb") as fd:
+                return pickle.load(fd)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            self._logger.warning(
+                "unable to read contextual cache {}: {}".format(disk_path, e)
+            )
+            return None
+
+    def _write_disk(self, contextual_cls, key, contextual):
+        if self.cache_path is None:
+            return
+        disk_path = self._disk_path(contextual_cls, key)
+        tmpf = disk_path + ".{}.new".format(os.getpid())
+        try:
+            with open(tmpf, "wb") as fd:
+                pickle.dump(contextual, fd, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmpf, disk_path)
+        except Exception as e:
+            self._logger.warning(
+                "unable to cache contextual metadata {}: {}".format(
+                    contextual_cls.__name__, e
+                )
+            )
+            if os.path.exists(tmpf):
+                os.unlink(tmpf)
+
+    def get(self, contextual_cls, path):
+        key = contextual_cache_key(contextual_cls, path)
+        with _memory_cache_lock:
+            contextual = _memory_cache.get(key)
+        if contextual is None:
+            contextual = self._read_disk(contextual_cls, key)
+            if contextual is None:
+                contextual = contextual_cls(self._logger, path)
+                self._write_disk(contextual_cls, key, contextual)
+            else:
+                self._logger.info(
+                    "contextual metadata {} read from cache".format(
+                        contextual_cls.__name__
+                    )
+                )
+            with _memory_cache_lock:
+                _memory_cache[key] = contextual
+        else:
+            self._logger.info(
+                "contextual metadata {} already parsed, reusing".format(
+                    contextual_cls.__name__
+                )
+            )
+        # a shallow copy, so the parsed metadata is shared but each caller logs
+        # to its own logger and points at its own download
+        cached_path = getattr(contextual, "path_dir", None)
+        contextual = copy.copy(contextual)
+        contextual._logger = self._logger
+        if cached_path is not None:
+            contextual.path_dir = path
+            if getattr(contextual, "source_path", None):
+                contextual.source_path = os.path.join(
+                    path, os.path.relpath(contextual.source_path, cached_path)
+                )
+        return contextual
+
+
+def clear_contextual_cache():
+    with _memory_cache_lock:
+        _memory_cache.clear()
@@ -1,10 +1,13 @@
+import itertools
 import json
 import os
 import re
 from collections import defaultdict, Counter
+from concurrent.futures import ProcessPoolExecutor
 
 from bpaingest.metadata import DownloadMetadata
 from bpaingest.projects import ProjectInfo
+from bpaingest.state import StateWriter
 from bpaingest.resource_metadata import (
     build_raw_resources_from_state_as_file,
     validate_raw_resources_from_state,
@@ -107,13 +110,57 @@ def linkage_qc(logger, state, data_type_meta, errors_callback=None):
 #     )
 
 
+class DataTypeMeta:
+    """
+    the parts of an ingest class used once state has been generated, which
+    unlike the ingest class itself can be returned from a worker process
+    """
+
+    def __init__(self, meta):
+        self.ckan_data_type = meta.ckan_data_type
+        self.resource_linkage = meta.resource_linkage
+        self.metadata_info = meta.metadata_info
+        if hasattr(meta, "_raw_resources_linkage"):
+            self._raw_resources_linkage = meta._raw_resources_linkage
+
+
+def dump_slug_state(class_info, options):
+    """
+    download metadata for one slug, and generate its packages and resources
+    """
+    logger = make_logger(__name__, options["log_level"])
+    logger.info(
+        "Dumping state generation: %s / %s"
+        % (class_info["project"], class_info["slug"])
+    )
+    dlpath = os.path.join(options["download_path"], class_info["slug"])
+    with DownloadMetadata(
+        make_logger(class_info["slug"], options["log_level"]),
+        class_info["cls"],
+        path=dlpath,
+        has_sql_context=options["has_sql_context"],
+        has_validate_schema=options["has_validate_schema"],
+        sql_context_excel_copy=options["sql_context_excel_copy"],
+        incremental_fetch=options["incremental_fetch"],
+        contextual_cache_path=options["contextual_cache_path"],
+    ) as dlmeta:
+        meta = dlmeta.meta
+        packages = meta.get_packages()
+        resources = meta.get_resources()
+        return (
+            meta.ckan_data_type,
+            DataTypeMeta(meta),
+            packages,
+            resources,
+            dlmeta.auth,
+        )
+
+
 def dump_state(args):
     if args.log_level:
         logger = make_logger(__name__, args.log_level)
     else:
         logger = make_logger(__name__)
-    state = defaultdict(lambda: defaultdict(list))
-
     project_info = ProjectInfo()
     classes = sorted(project_info.metadata_info, key=lambda t: t["slug"])
     if args.dump_re:
@@ -129,39 +176,75 @@ def dump_state(args):
     logger.info("dumping: {}".format(", ".join(t["slug"] for t in classes)))
     has_sql_context = True if args.sql_context == "True" else False
     has_validate_schema = True if args.validate_schema == "True" else False
-
-    data_type_meta = {}
-    # download metadata for all project types and aggregate metadata keys
-    for class_info in sorted(classes, key=lambda x: x["slug"]):
-        logger.info(
-            "Dumping state generation: %s / %s"
-            % (class_info["project"], class_info["slug"])
-        )
-        dlpath = os.path.join(args.download_path, class_info["slug"])
-        with DownloadMetadata(
-            make_logger(class_info["slug"], args.log_level),
-            class_info["cls"],
-            path=dlpath,
-            has_sql_context=has_sql_context,
-            has_validate_schema=has_validate_schema,
-        ) as dlmeta:
-            meta = dlmeta.meta
-            data_type = meta.ckan_data_type
+    sql_context_excel_copy = True if args.sql_context_excel_copy == "True" else False
+
+    options = {
+        "download_path": args.download_path,
+        "log_level": args.log_level,
+        "has_sql_context": has_sql_context,
+        "has_validate_schema": has_validate_schema,
+        "sql_context_excel_copy": sql_context_excel_copy,
+        "incremental_fetch": args.incremental_fetch,
+        "contextual_cache_path": args.contextual_cache,
+    }
+    classes = sorted(classes, key=lambda x: x["slug"])
+    executor = None
+    if args.jobs > 1:
+        logger.info("generating state with {} processes".format(args.jobs))
+        executor = ProcessPoolExecutor(max_workers=args.jobs)
+
+    def slug_states(classes):
+        "the state of each slug of `classes`, in order"
+        if executor is not None:
+            # every slug is submitted to the pool at once
+            return executor.map(dump_slug_state, classes, [options] * len(classes))
+        return (dump_slug_state(t, options) for t in classes)
+
+    def merge_state(slug_states):
+        state = defaultdict(lambda: defaultdict(list))
+        data_type_meta = {}
+        # merge in slug order, so that the state matches a serial run
+        for data_type, meta, packages, resources, auth in slug_states:
             data_type_meta[data_type] = meta
-            state[data_type]["packages"] += meta.get_packages()
-            state[data_type]["resources"] += meta.get_resources()
-            state[data_type]["auth"] = dlmeta.auth
-
-    for data_type in state:
-        state[data_type]["packages"].sort(key=lambda x: x["id"])
-        state[data_type]["resources"].sort(key=lambda x: x[2]["id"])
-
-    linkage_qc(logger, state, data_type_meta)
+            state[data_type]["packages"] += packages
+            state[data_type]["resources"] += resources
+            state[data_type]["auth"] = auth
+        for data_type in state:
+            state[data_type]["packages"].sort(key=lambda x: x["id"])
+            state[data_type]["resources"].sort(key=lambda x: x[2]["id"])
+        return state, data_type_meta
+
+    def finalise_state(state, data_type_meta):
+        linkage_qc(logger, state, data_type_meta)
+        build_raw_resources_from_state_as_file(logger, ckan, state, data_type_meta)
+        validate_raw_resources_from_state(logger, state)
 
     ckan = make_ckan_api(args)
-
-    build_raw_resources_from_state_as_file(logger, ckan, state, data_type_meta)
-    validate_raw_resources_from_state(logger, state)
+    try:
+        if args.format == "ndjson":
+            # check and write one data type at a time, as the state of its
+            # slugs arrives. all the slugs are generated in data type order,
+            # so that the pool is kept busy across data types
+            by_data_type = defaultdict(list)
+            for class_info in classes:
+                by_data_type[class_info["cls"].ckan_data_type].append(class_info)
+            data_types = sorted(by_data_type)
+            states = slug_states([t for k in data_types for t in by_data_type[k]])
+            with StateWriter(args.filename) as writer:
+                for data_type in data_types:
+                    state, data_type_meta = merge_state(
+                        itertools.islice(states, len(by_data_type[data_type]))
+                    )
+                    finalise_state(state, data_type_meta)
+                    for state_data_type in sorted(state):
+                        writer.write(state_data_type, state[state_data_type])
+            return
+
+        state, data_type_meta = merge_state(slug_states(classes))
+        finalise_state(state, data_type_meta)
+    finally:
+        if executor is not None:
+            executor.shutdown()
 
     # for datetime objects, use 'default as str' for now so that parsing doesn't break
     with open(args.filename, "w") as fd:
@@ -0,0 +1,99 @@
+import json
+import os
+import threading
+import time
+
+from .util import make_logger
+
+logger = make_logger(__name__)
+
+KINDS = ("packages", "resources")
+
+
+class FingerprintStore:
+    """
+    fingerprints (see ops.object_fingerprint) of the packages and resources of
+    a data type, as last synced to a CKAN instance. an object whose fingerprint
+    is unchanged since it was last synced need not be compared with CKAN.
+
+    changes made in CKAN by other means are not seen while objects are being
+    skipped, so every `full_compare_days` all objects are compared again, as
+    they are if `force_full_compare` is set.
+    """
+
+    def __init__(
+        self, path, ckan, data_type, force_full_compare=False, full_compare_days=7
+    ):
+        os.makedirs(path, exist_ok=True)
+        self.path = os.path.join(path, "{}.json".format(data_type))
+        self._address = getattr(ckan, "address", "")
+        self._lock = threading.Lock()
+        self._fingerprints = {kind: {} for kind in KINDS}
+        self._seen = {kind: set() for kind in KINDS}
+        verified = None
+        try:
+            with open(self.path) as fd:
+                stored = json.load(fd)
+        except FileNotFoundError:
+            stored = None
+        if stored is not None and stored["address"] == self._address:
+            self._fingerprints = stored["fingerprints"]
+            verified = stored["verified"]
+        self.verified = verified
+        if force_full_compare:
+            self.full_compare = True
+            logger.info("full compare forced: no objects will be skipped")
+        elif verified is None or time.time() - verified > full_compare_days * 86400:
+            self.full_compare = True
+            logger.info(
+                "no full compare within {} days: no objects will be skipped".format(
+                    full_compare_days
+                )
+            )
+        else:
+            self.full_compare = False
+
+    def unchanged(self, kind, obj_id, fingerprint):
+        "true if the object can be skipped"
+        with self._lock:
+            self._seen[kind].add(obj_id)
+            if self.full_compare:
+                return False
+            return self._fingerprints[kind].get(obj_id) == fingerprint
+
+    def record(self, kind, obj_id, fingerprint):
+        "record the fingerprint of an object which has been synced"
+        with self._lock:
+            self._seen[kind].add(obj_id)
+            self._fingerprints[kind][obj_id] = fingerprint
+
+    def save(self, complete):
+        """
+        write the store to disk. `complete` should be set if every object of the
+        data type was synced, so objects not seen can be dropped and a full
+        compare counted as verification
+        """
+        with self._lock:
+            fingerprints = self._fingerprints
+            if complete:
+                fingerprints = {
+                    kind: {
+                        k: v
+                        for k, v in fingerprints[kind].items()
+                        if k in self._seen[kind]
+                    }
+                    for kind in KINDS
+                }
+                if self.full_compare:
+                    self.verified = time.time()
+            tmpf = self.path + ".new"
+            with open(tmpf, "w") as fd:
+                json.dump(
+                    {
+                        "address": self._address,
+                        "verified": self.verified,
+                        "fingerprints": fingerprints,
+                    },
+                    fd,
+                )
+            os.replace(tmpf, self.path)
@@ -1,6 +1,7 @@
 import urllib.parse
 import re
 import os
+from concurrent.futures import ProcessPoolExecutor
 
 from .ops import ckan_method
 from .util import make_logger
@@ -30,7 +31,11 @@ def is_hashed(resource):
     return size_valid(resource) and resource.get("s3etag_134217728")
 
 
-def calculate_hashes(ckan, mirror_path, legacy_url, resource):
+def calculate_hashes(ckan, mirror_path, legacy_url, resource, hashes=None):
+    """
+    patch `resource` with its size and hashes. `hashes` may be passed in if
+    already generated for the file, e.g. by a worker process
+    """
     fpath = localpath(mirror_path, legacy_url)
     patch_obj = {}
     resource_path = "dataset/%s/resource/%s" % (resource["package_id"], resource["id"])
@@ -39,7 +44,8 @@ def calculate_hashes(ckan, mirror_path, legacy_url, resource):
         patch_obj["size"] = str(os.stat(fpath).st_size)
 
     if not resource.get("s3etag_134217728"):
-        hashes = generate_hashes(fpath)
+        if hashes is None:
+            hashes = generate_hashes(fpath)
         if hashes["md5"] != resource["md5"]:
             logger.critical(
                 "MD5 hash mismatch of on-disk data. Have `{}' and expected `{}': {}".format(
@@ -57,8 +63,10 @@ def calculate_hashes(ckan, mirror_path, legacy_url, resource):
     logger.info("%s: hashes calculated and pushed" % (resource_path))
 
 
-def genhash(ckan, meta, mirror_path, num_threads):
-    cache = build_resource_cache(ckan, meta.ckan_data_type, meta.get_packages())
+def genhash(ckan, meta, mirror_path, num_threads, ckan_mirror=None):
+    cache = build_resource_cache(
+        ckan, meta.ckan_data_type, meta.get_packages(), mirror=ckan_mirror
+    )
     logger.info(
         "%d resources of type %s" % (len(meta.get_resources()), meta.ckan_data_type)
     )
@@ -74,5 +82,22 @@ def genhash(ckan, meta, mirror_path, num_threads):
             queue.append((legacy_url, resource))
 
     logger.info("{} resources to be hashed".format(len(queue)))
-    for task in queue:
-        calculate_hashes(ckan, mirror_path, *task)
+    if num_threads <= 1:
+        for task in queue:
+            calculate_hashes(ckan, mirror_path, *task)
+        return
+
+    # files are hashed in worker processes; CKAN is patched from this process
+    logger.info("hashing with {} worker processes".format(num_threads))
+    with ProcessPoolExecutor(max_workers=num_threads) as executor:
+        futures = []
+        for legacy_url, resource in queue:
+            future = None
+            if not resource.get("s3etag_134217728"):
+                future = executor.submit(
+                    generate_hashes, localpath(mirror_path, legacy_url)
+                )
+            futures.append(future)
+        for (legacy_url, resource), future in zip(queue, futures):
+            hashes = future.result() if future is not None else None
+            calculate_hashes(ckan, mirror_path, legacy_url, resource, hashes=hashes)
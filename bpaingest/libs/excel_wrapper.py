@@ -19,7 +19,7 @@ import os
 import xlrd
 import string
 import logging
-from openpyxl.utils.cell import get_column_letter
+import threading
 
 SkipColumn = namedtuple("SkipColumn", ["column_name", "skip_all"])
 skip_column_default = SkipColumn("column_name", False)
@@ -31,6 +31,54 @@ field_definition_default = FieldDefinition(
 )
 
 
+# parsed workbooks, keyed by (absolute path, mtime, size), least recently used first.
+# contextual metadata is often read from several sheets of one large workbook, and
+# each ExcelWrapper would otherwise parse the whole workbook again.
+WORKBOOK_CACHE_SIZE = 4
+_workbook_cache = OrderedDict()
+_workbook_cache_lock = threading.Lock()
+
+
+def _workbook_cache_key(file_name):
+    st = os.stat(file_name)
+    return os.path.abspath(file_name), st.st_mtime_ns, st.st_size
+
+
+def open_workbook(file_name):
+    """
+    returns the parsed xlrd workbook for `file_name`. the workbook is only parsed
+    if it is not in the cache, or if the file has changed since it was cached
+    """
+    key = _workbook_cache_key(file_name)
+    with _workbook_cache_lock:
+        workbook = _workbook_cache.get(key)
+        if workbook is not None:
+            _workbook_cache.move_to_end(key)
+            return workbook
+        # drop any stale copy of this file
+        for stale_key in [t for t in _workbook_cache if t[0] == key[0]]:
+            del _workbook_cache[stale_key]
+        workbook = xlrd.open_workbook(file_name)
+        _workbook_cache[key] = workbook
+        while len(_workbook_cache) > WORKBOOK_CACHE_SIZE:
+            _workbook_cache.popitem(last=False)
+        return workbook
+
+
+def evict_workbook(file_name=None):
+    """
+    drop `file_name` from the workbook cache; if `file_name` is None, the cache is
+    cleared. call once all the sheets required from a workbook have been read.
+    """
+    with _workbook_cache_lock:
+        if file_name is None:
+            _workbook_cache.clear()
+            return
+        path = os.path.abspath(file_name)
+        for key in [t for t in _workbook_cache if t[0] == path]:
+            del _workbook_cache[key]
+
+
 def make_field_definition(attribute, column_name, **kwargs):
     return field_definition_default._replace(
         attribute=attribute, column_name=column_name, **kwargs
@@ -41,6 +89,19 @@ def make_skip_column(column_name, **kwargs):
     return skip_column_default._replace(column_name=column_name, **kwargs)
 
 
+class RowNumber:
+    """
+    the current spreadsheet row, shared by the per-column loggers of a sheet
+    so that they need not be rebuilt for every row
+    """
+
+    def __init__(self):
+        self.value = 0
+
+    def __str__(self):
+        return str(self.value)
+
+
 class ExcelWrapperLogger(logging.LoggerAdapter):
     def process(self, msg, kwargs):
         return (
@@ -91,18 +152,9 @@ class ExcelWrapper:
         self.additional_context = additional_context
         self.suggest_template = suggest_template
 
-        self.workbook = xlrd.open_workbook(file_name)
+        self.workbook = None
         self.modified = None
-        try:
-            self.modified = self.workbook.props["modified"]
-
-        except:
-            self._logger.warn(
-                "xlsx file named '%s' does not have a modified date, may be very old"
-                % file_name
-            )
-
-        self.sheet = self._find_sheet_in_workbook(file_name, self.workbook, sheet_name)
+        self.sheet = self._open_sheet(file_name, sheet_name)
 
         self.missing_headers = []
         self.header, self.name_to_column_map = self.set_name_to_column_map()
@@ -127,6 +179,23 @@ class ExcelWrapper:
             )
         return names
 
+    def _open_sheet(self, file_name, sheet_name):
+        """
+        open the workbook, and return the sheet rows are to be read from. subclasses
+        may override this to read rows from another source.
+        """
+        self.workbook = open_workbook(file_name)
+        try:
+            self.modified = self.workbook.props["modified"]
+
+        except:
+            self._logger.warn(
+                "xlsx file named '%s' does not have a modified date, may be very old"
+                % file_name
+            )
+
+        return self._find_sheet_in_workbook(file_name, self.workbook, sheet_name)
+
     def _find_sheet_in_workbook(self, file_name, workbook, sheet_name):
         # This method performs the following in order to find an appropriately named sheet in the given workbook:
         # Try sheet_name supplied as parameter to this method (if it is not None).
@@ -469,27 +538,26 @@ class ExcelWrapper:
     def _get_rows(self):
         """Yields sequence of cells"""
 
-        merge_redirect = {}
+        # resolve each merged cell to the cell at the top-left of its range, once
+        merged_by_row = {}
         for crange in self.sheet.merged_cells:
             rlo, rhi, clo, chi = crange
-            source_coords = (rlo, clo)
+            source_cell = self.sheet.cell(rlo, clo)
             for rowx in range(rlo, rhi):
                 for colx in range(clo, chi):
                     if rowx == rlo and colx == clo:
                         continue
-                    merge_redirect[(rowx, colx)] = source_coords
+                    merged_by_row.setdefault(rowx, []).append((colx, source_cell))
 
         for row_idx in range(self.header_length, self.sheet.nrows):
             row = self.sheet.row(row_idx)
-            merged_row = []
-            for colx, val in enumerate(row):
-                coord = (row_idx, colx)
-                if coord in merge_redirect:
-                    merge_row, merge_col = merge_redirect[coord]
-                    merged_row.append(self.sheet.row(merge_row)[merge_col])
-                else:
-                    merged_row.append(val)
-            yield merged_row
+            merged = merged_by_row.get(row_idx)
+            if merged:
+                row = list(row)
+                for colx, source_cell in merged:
+                    if colx < len(row):
+                        row[colx] = source_cell
+            yield row
 
     def get_date_time(self, i, cell):
         """the cell contains a float and pious hope, get a date, if you dare."""
@@ -512,6 +580,33 @@ class ExcelWrapper:
             )
         return val
 
+    def _compile_decoders(self, row_number):
+        """
+        returns a (column index, coerce function, logger) tuple for each field. the
+        column index is None if the column was not found in the sheet.
+        """
+        from openpyxl.utils.cell import get_column_letter
+
+        filename = os.path.basename(self.file_name)
+        decoders = []
+        for name in self.field_names:
+            i = self.name_to_column_map[name]
+            func = self.name_to_func_map[name]
+            func_logger = None
+            if i is not None and func is not None:
+                func_logger = ExcelWrapperLogger(
+                    self._logger,
+                    {
+                        "field_name": name,
+                        "row": row_number,
+                        "column": get_column_letter(i + 1),  # 0 vs 1 start
+                        "filename": filename,
+                        "sheet": self.sheet.name,
+                    },
+                )
+            decoders.append((i, func, func_logger))
+        return decoders
+
     def get_all(self, typname="DataRow"):
         """Returns all rows for the sheet as namedtuple instances. Filters out any exact duplicates."""
 
@@ -520,41 +615,31 @@ class ExcelWrapper:
         if self.additional_context is not None:
             typ_attrs += list(self.additional_context.keys())
         typ = namedtuple(typname, typ_attrs)
-        row_num = 0
+        additional_values = []
+        if self.additional_context:
+            additional_values = list(self.additional_context.values())
+        row_number = RowNumber()
+        decoders = self._compile_decoders(row_number)
         for row in self._get_rows():
-            row_num = row_num + 1
+            row_number.value += 1
             tpl = []
-            for name in self.field_names:
-                i = self.name_to_column_map[name]
+            for i, func, func_logger in decoders:
                 # i is None if the column specified was not found, in that case,
                 # set the val to None as well
                 if i is None:
                     tpl.append(None)
                     continue
-                func = self.name_to_func_map[name]
                 cell = row[i]
                 ctype = cell.ctype
                 val = cell.value
                 # convert dates to python dates
                 if ctype == xlrd.XL_CELL_DATE:
                     val = self.get_date_time(i, cell)
-                if ctype == xlrd.XL_CELL_TEXT:
+                elif ctype == xlrd.XL_CELL_TEXT:
                     val = val.strip()
                 # apply func
                 if func is not None:
-                    func_logger = ExcelWrapperLogger(
-                        self._logger,
-                        {
-                            "field_name": name,
-                            "row": row_num,
-                            "column": get_column_letter(i + 1),  # 0 vs 1 start
-                            "filename": os.path.basename(self.file_name),
-                            "sheet": self.sheet.name,
-                        },
-                    )
-
                     val = func(func_logger, val)
                 tpl.append(val)
-            if self.additional_context:
-                tpl += list(self.additional_context.values())
+            tpl += additional_values
             yield typ(*tpl)
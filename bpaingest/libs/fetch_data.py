@@ -3,16 +3,18 @@
 Utility functions to fetch data from web server
 """
 
+import json
 import os
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+
 import requests
-from bs4 import BeautifulSoup
 from urllib.parse import urljoin
 
 import requests.packages.urllib3
 
-requests.packages.urllib3.disable_warnings()
-
 
 class MissingCredentialsException(Exception):
     pass
@@ -46,40 +48,176 @@ def get_password(project_name=None):
     return password
 
 
+def listing_sizes(soup, url):
+    """
+    the sizes of the files in a directory listing, where the listing gives them
+    exactly, in bytes: both Apache's table and <pre> formatted listings are
+    understood. abbreviated sizes (e.g. 1.2G) are ignored
+    """
+    from bs4 import NavigableString
+
+    sizes = {}
+    for link in soup.find_all("a"):
+        href = link.get("href")
+        if not href or href.endswith("/") or "?" in href:
+            continue
+        row = link.find_parent("tr")
+        if row is not None:
+            cells = [
+                td.get_text(strip=True)
+                for td in row.find_all("td")
+                if link not in td.descendants
+            ]
+        elif isinstance(link.next_sibling, NavigableString):
+            cells = str(link.next_sibling).split()
+        else:
+            cells = []
+        exact = [t for t in cells if t.isdigit()]
+        if exact:
+            sizes[urljoin(url, href)] = int(exact[-1])
+    return sizes
+
+
 def get_env_username(username_variable="BPAINGEST_DOWNLOADS_USERNAME"):
     return os.getenv(username_variable)
 
 
 class Fetcher:
-    """facilitates fetching data from webserver"""
+    """
+    facilitates fetching data from webserver.
+
+    directory listings are crawled, and files downloaded, by a pool of worker
+    threads. in incremental mode, the ETag and Last-Modified validators of each
+    downloaded file are kept in a manifest in `target_folder`, and files are
+    re-fetched with conditional GETs: only files changed upstream are downloaded.
+
+    the sizes of all files in the listings crawled, where given exactly, are
+    kept in `listed_sizes` (url -> size in bytes).
+    """
 
     recurse_re = re.compile(r"^[A-Za-z0-9_-]+/")
+    manifest_name = ".bpa-ingest-fetch.json"
+    chunk_size = 1 << 20
+    num_threads = 8
 
-    def __init__(self, logger, target_folder, metadata_source_url, auth=None):
+    def __init__(
+        self, logger, target_folder, metadata_source_url, auth=None, incremental=False
+    ):
+        # the archive is fetched without certificate verification; silence the
+        # warnings urllib3 would give for each request
+        requests.packages.urllib3.disable_warnings()
         self._logger = logger
         self.target_folder = target_folder
         self.metadata_source_url = metadata_source_url
         self.auth = auth
+        self.incremental = incremental
+        self._local = threading.local()
+        self._manifest_lock = threading.Lock()
+        self.listed_sizes = {}
         self._ensure_target_folder_exists()
+        self._manifest = self._read_manifest() if incremental else {}
 
     def _ensure_target_folder_exists(self):
         if not os.path.exists(self.target_folder):
             os.makedirs(self.target_folder, exist_ok=True)
 
-    def _fetch(self, session, base_url, name):
-        self._logger.info("Fetching {} from {}".format(name, base_url))
+    @property
+    def manifest_path(self):
+        return os.path.join(self.target_folder, self.manifest_name)
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path) as fd:
+                return json.load(fd)
+        except FileNotFoundError:
+            return {}
+
+    def _write_manifest(self):
+        tmpf = self.manifest_path + ".new"
+        with open(tmpf, "w") as fd:
+            json.dump(self._manifest, fd, sort_keys=True, indent=2)
+        os.replace(tmpf, self.manifest_path)
+
+    def _session(self):
+        # requests sessions aren't guaranteed thread-safe: keep one per worker
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _fetch(self, base_url, name):
         url = base_url + name
-        with session.get(url, stream=True, auth=self.auth, verify=False) as r:
+        output_file = self.target_folder + "/" + name
+        headers = {}
+        validators = self._manifest.get(url)
+        if validators and os.path.exists(output_file):
+            if validators.get("etag"):
+                headers["If-None-Match"] = validators["etag"]
+            if validators.get("last_modified"):
+                headers["If-Modified-Since"] = validators["last_modified"]
+        with self._session().get(
+            url, stream=True, auth=self.auth, verify=False, headers=headers
+        ) as r:
+            if r.status_code == 304:
+                self._logger.info(
+                    "Unchanged, skipping {} from {}".format(name, base_url)
+                )
+                return
+            self._logger.info("Fetching {} from {}".format(name, base_url))
             if r.status_code != 200:
                 raise DownloadException(
                     "status code {} for: {}".format(r.status_code, url)
                 )
-            output_file = self.target_folder + "/" + name
-            with open(output_file, "wb") as f:
-                for chunk in r.iter_content(chunk_size=1024):
-                    if chunk:
-                        f.write(chunk)
-                        f.flush()
+            tmpf = output_file + ".new"
+            with open(tmpf, "wb") as f:
+                for chunk in r.iter_content(chunk_size=self.chunk_size):
+                    f.write(chunk)
+            os.replace(tmpf, output_file)
+            if self.incremental:
+                with self._manifest_lock:
+                    self._manifest[url] = {
+                        "etag": r.headers.get("ETag"),
+                        "last_modified": r.headers.get("Last-Modified"),
+                    }
+
+    def _list_folder(self, url):
+        """
+        returns (ok, link targets) for the directory listing at `url`. `ok` is False
+        if the listing could not be retrieved
+        """
+        self._logger.info("Fetching folder from {}".format(url))
+        response = self._session().get(url, auth=self.auth, verify=False)
+        if response.status_code != 200:
+            self._logger.error(
+                "warning: status code %d for url %s" % (response.status_code, url)
+            )
+        from bs4 import BeautifulSoup
+
+        links = []
+        seen = set()
+        soup = BeautifulSoup(response.content, "html.parser")
+        if response.status_code == 200:
+            sizes = listing_sizes(soup, url)
+            with self._manifest_lock:
+                self.listed_sizes.update(sizes)
+        for link in soup.find_all("a"):
+            link_target = link.get("href")
+            if link_target in seen:
+                continue
+            seen.add(link_target)
+            links.append(link_target)
+        return response.status_code == 200, links
+
+    def _prune(self, fetched_urls):
+        "remove files previously fetched from this source which are no longer listed"
+        for url in sorted(self._manifest):
+            if not url.startswith(self.metadata_source_url) or url in fetched_urls:
+                continue
+            name = url.rsplit("/", 1)[-1]
+            self._logger.info("Removing {}, no longer in {}".format(name, url))
+            with suppress(FileNotFoundError):
+                os.unlink(self.target_folder + "/" + name)
+            del self._manifest[url]
 
     def fetch_metadata_from_folder(
         self,
@@ -87,9 +225,6 @@ class Fetcher:
         metadata_info,
         url_components,
         download=True,
-        _target_depth=-1,
-        _url=None,
-        _session=None,
     ):
         """
         walk a directory structure, grabbing files matching `metadata_patterns`.
@@ -99,66 +234,64 @@ class Fetcher:
 
         if metadata_patterns is None:
             metadata_patterns = [r"^.*\.(md5|xlsx)$"]
-        if _url is None:
-            _url = self.metadata_source_url
-        if _target_depth == -1:
-            _target_depth = len(url_components)
-        if _session is None:
-            _session = requests.Session()
-        self._logger.info("Fetching folder from {}".format(_url))
-        response = _session.get(_url, stream=True, auth=self.auth, verify=False)
-        if response.status_code != 200:
-            self._logger.error(
-                "warning: status code %d for url %s" % (response.status_code, _url)
-            )
-        fetched = set()
-        for link in BeautifulSoup(response.content, "html.parser").find_all("a"):
-            link_target = link.get("href")
-            if link_target in fetched:
-                continue
-            fetched.add(link_target)
-            # we need to descend directory tree further in order to find all `url_components`
-            if _target_depth > 0:
-                if Fetcher.recurse_re.match(link_target):
-                    self.fetch_metadata_from_folder(
-                        metadata_patterns,
-                        metadata_info,
-                        url_components,
-                        download=download,
-                        _session=_session,
-                        _target_depth=_target_depth - 1,
-                        _url=urljoin(_url, link_target),
+        patterns = [re.compile(pattern) for pattern in metadata_patterns]
+
+        with ThreadPoolExecutor(max_workers=self.num_threads) as executor:
+            # the tree is crawled a level at a time, with the listings of each level
+            # fetched concurrently. files are keyed by their position in the tree, so
+            # that they are registered in depth-first order, whatever the crawl order
+            found = []
+            complete = True
+            level = [((), self.metadata_source_url, len(url_components))]
+            while level:
+                listings = executor.map(lambda t: self._list_folder(t[1]), level)
+                next_level = []
+                for (position, url, target_depth), (ok, links) in zip(level, listings):
+                    complete = complete and ok
+                    for idx, link_target in enumerate(links):
+                        # we need to descend directory tree further in order to find all `url_components`;
+                        # past target_depth, descend anyway to find whatever is there
+                        if Fetcher.recurse_re.match(link_target):
+                            next_level.append(
+                                (
+                                    position + (idx,),
+                                    urljoin(url, link_target),
+                                    max(target_depth - 1, 0),
+                                )
+                            )
+                        elif target_depth == 0 and any(
+                            pattern.match(link_target) for pattern in patterns
+                        ):
+                            found.append((position + (idx,), url, link_target))
+                level = next_level
+
+            to_fetch = []
+            for _position, url, link_target in sorted(found):
+                subdir = url[len(self.metadata_source_url) :].strip("/")
+                meta_parts = subdir.split("/")[: len(url_components)]
+                assert len(meta_parts) == len(url_components)
+                if link_target in metadata_info:
+                    raise DownloadException(
+                        "Legacy archive contains non-unique filename: %s (%s)"
+                        % (link_target, metadata_info[link_target])
                     )
+                metadata_info[link_target] = dict(list(zip(url_components, meta_parts)))
+                metadata_info[link_target]["base_url"] = url
+                to_fetch.append((url, link_target))
+
+            if not download:
+                return
+            # download the actual files
+            for future in [executor.submit(self._fetch, *t) for t in to_fetch]:
+                future.result()
+
+        if self.incremental:
+            if complete:
+                self._prune(set(url + name for url, name in to_fetch))
             else:
-                # descend anyway, to find whatever is there, but we've already hit target_depth
-                if Fetcher.recurse_re.match(link_target):
-                    self.fetch_metadata_from_folder(
-                        metadata_patterns,
-                        metadata_info,
-                        url_components,
-                        download=download,
-                        _session=_session,
-                        _target_depth=_target_depth,
-                        _url=urljoin(_url, link_target),
+                self._logger.warning(
+                    "not all listings under {} retrieved, stale files kept".format(
+                        self.metadata_source_url
                     )
-                elif not any(
-                    re.compile(pattern).match(link_target)
-                    for pattern in metadata_patterns
-                ):
-                    continue
-                else:
-                    subdir = _url[len(self.metadata_source_url) :].strip("/")
-                    meta_parts = subdir.split("/")[: len(url_components)]
-                    assert len(meta_parts) == len(url_components)
-                    if link_target in metadata_info:
-                        raise DownloadException(
-                            "Legacy archive contains non-unique filename: %s (%s)"
-                            % (link_target, metadata_info[link_target])
-                        )
-                    metadata_info[link_target] = dict(
-                        list(zip(url_components, meta_parts))
-                    )
-                    metadata_info[link_target]["base_url"] = _url
-                    # download the actual file
-                    if download:
-                        self._fetch(_session, _url, link_target)
+                )
+            self._write_manifest()
@@ -1,20 +1,75 @@
 from bpaingest.libs.common_resources import bsd_md5_re, linux_md5_re
 from bpaingest.libs.raw_matcher import RawParser
 
+HEX_DIGITS = "0123456789abcdefABCDEF"
+
+
+class MD5Match:
+    """
+    a line of an md5 file which matched `regexp`. the values of its named
+    groups are kept as a tuple, which the parser fills with interned strings
+    as values such as flowcell ids and lanes repeat from line to line;
+    `groupdict` gives them as a dict, as re.Match.groupdict would.
+
+    unpacks as (path, md5, groupdict), the tuples MD5Parser once stored
+    """
+
+    __slots__ = ("path", "md5", "regexp", "values")
+
+    def __init__(self, path, md5, regexp, values):
+        self.path = path
+        self.md5 = md5
+        self.regexp = regexp
+        self.values = values
+
+    def groupdict(self):
+        return dict(zip(self.regexp.groupindex, self.values))
+
+    def __iter__(self):
+        return iter((self.path, self.md5, self.groupdict()))
+
 
 class MD5Parser(RawParser):
-    def _parse(self, fname, match, skip):
-        with open(fname) as f:
+    """
+    the md5 file `fname`, read as it is iterated over: each line matching an
+    expression in `match` (and none in `skip`) is yielded as an MD5Match. the
+    paths of lines skipped or not matched are gathered in `skipped` and
+    `no_match` as the file is read. group values are interned per parser, so
+    that each distinct value is held once however many lines it appears in
+    """
+
+    def __init__(self, fname, match, skip):
+        self.fname = fname
+        self.skipped = []
+        self.no_match = []
+        self._match, self._skip = self._matchers(match, skip)
+        self._matches = None
+        self._strings = {}
+
+    def __iter__(self):
+        self.skipped = []
+        self.no_match = []
+        match, skip = self._match, self._skip
+        intern = self._strings.setdefault
+        with open(self.fname) as f:
             for md5, path in md5lines(f):
                 match_path = self._match_path(path)
-                if skip is not None and self._matching_regexp(skip, match_path):
+                if skip is not None and skip.match(match_path):
                     self.skipped.append(path)
                     continue
-                m = self._matching_regexp(match, match_path)
+                m = match.match(match_path)
                 if not m:
                     self.no_match.append(path)
                     continue
-                self.matches.append((path, md5, m.groupdict()))
+                values = m.groupdict().values()
+                yield MD5Match(path, md5, m.re, tuple(map(intern, values, values)))
+
+    @property
+    def matches(self):
+        "every MD5Match in the file, read on first access"
+        if self._matches is None:
+            self._matches = list(self)
+        return self._matches
 
 
 def md5lines(fd):
@@ -24,6 +79,14 @@ def md5lines(fd):
         # skip blank lines
         if line == "":
             continue
+        # fast path for the usual GNU format, "<md5> <path>" or "<md5> *<path>",
+        # as matched by linux_md5_re
+        md5, sep, path = line.partition(" ")
+        if sep and len(md5) == 32 and not md5.strip(HEX_DIGITS):
+            if path[:1] in ("*", " "):
+                path = path[1:]
+            yield md5, path
+            continue
         m = bsd_md5_re.match(line)
         if m:
             path, md5 = m.groups()
@@ -1,3 +1,4 @@
+from concurrent.futures import ThreadPoolExecutor
 from hashlib import md5, sha256
 from binascii import hexlify
 from ..util import make_logger
@@ -11,6 +12,9 @@ logger = make_logger(__name__)
 S3_CHUNK_SIZES = [(t * (1 << 20)) for t in (8, 16, 32, 64, 128)]
 S3_HASH_FIELDS = ["s3etag_%d" % t for t in S3_CHUNK_SIZES]
 
+# one worker for each of the whole-file MD5 and SHA256, and one for each S3 chunk size
+HASH_THREADS = 2 + len(S3_CHUNK_SIZES)
+
 
 def make_multipart(md5_s3part):
     if len(md5_s3part) == 0:
@@ -21,23 +25,90 @@ def make_multipart(md5_s3part):
         return "%s-%d" % (md5(b"".join(md5_s3part)).hexdigest(), len(md5_s3part))
 
 
-def _generate_hashes(fd):
+class MultiHasher:
+    """
+    computes the same hashes as generate_hashes, over data passed to `update`
+    in pieces of any size, e.g. as it is streamed elsewhere
+    """
+
+    def __init__(self):
+        self._md5 = md5()
+        self._sha256 = sha256()
+        self._parts = dict((t, []) for t in S3_CHUNK_SIZES)
+        self._chunk = dict((t, md5()) for t in S3_CHUNK_SIZES)
+        self._filled = dict((t, 0) for t in S3_CHUNK_SIZES)
+
+    def update(self, data):
+        data = memoryview(data)
+        self._md5.update(data)
+        self._sha256.update(data)
+        for chunk_size in S3_CHUNK_SIZES:
+            offset = 0
+            while offset < len(data):
+                take = min(chunk_size - self._filled[chunk_size], len(data) - offset)
+                self._chunk[chunk_size].update(data[offset : offset + take])
+                self._filled[chunk_size] += take
+                offset += take
+                if self._filled[chunk_size] == chunk_size:
+                    self._parts[chunk_size].append(self._chunk[chunk_size].digest())
+                    self._chunk[chunk_size] = md5()
+                    self._filled[chunk_size] = 0
+
+    def hashes(self):
+        obj = {
+            "md5": self._md5.hexdigest(),
+            "sha256": self._sha256.hexdigest(),
+        }
+        for chunk_size, parts in self._parts.items():
+            if self._filled[chunk_size]:
+                parts = parts + [self._chunk[chunk_size].digest()]
+            obj["s3etag_%d" % (chunk_size)] = make_multipart(parts)
+        return obj
+
+
+def _read_block(fd, view):
+    "fill `view` from `fd`, returning the number of bytes read (short only at EOF)"
+    filled = 0
+    while filled < len(view):
+        n = fd.readinto(view[filled:])
+        if not n:
+            break
+        filled += n
+    return filled
+
+
+def _generate_hashes(fd, executor=None):
+    """
+    hash the contents of `fd` in a single pass. the block is shared by every
+    digest as a zero-copy memoryview; if `executor` is given the digests are
+    computed concurrently (hashlib releases the GIL while hashing)
+    """
     md5_s3part = dict((t, []) for t in S3_CHUNK_SIZES)
     md5_whole = md5()
     sha256_whole = sha256()
-    hashed = 0
+
+    def hash_parts(data, chunk_size):
+        parts = md5_s3part[chunk_size]
+        for i in range(0, len(data), chunk_size):
+            parts.append(md5(data[i : i + chunk_size]).digest())
+
     # note: the read length needs to be an integer multiple of
     # the block size of each hash (any large power of 2 is fine)
+    block = memoryview(bytearray(S3_CHUNK_SIZES[-1]))
     while True:
-        data = fd.read(S3_CHUNK_SIZES[-1])
-        hashed += len(data)
-        if len(data) == 0:
+        length = _read_block(fd, block)
+        if length == 0:
             break
-        for chunk_size in S3_CHUNK_SIZES:
-            for i in range(0, len(data), chunk_size):
-                md5_s3part[chunk_size].append(md5(data[i : i + chunk_size]).digest())
-        md5_whole.update(data)
-        sha256_whole.update(data)
+        data = block[:length]
+        jobs = [(md5_whole.update, data), (sha256_whole.update, data)]
+        jobs += [(hash_parts, data, chunk_size) for chunk_size in S3_CHUNK_SIZES]
+        if executor is None:
+            for fn, *args in jobs:
+                fn(*args)
+        else:
+            # the block is re-used for the next read, so wait for every digest
+            for future in [executor.submit(*job) for job in jobs]:
+                future.result()
     obj = {
         "md5": md5_whole.hexdigest(),
         "sha256": sha256_whole.hexdigest(),
@@ -53,5 +124,7 @@ def _generate_hashes(fd):
 
 def generate_hashes(fname):
     logger.info("generating hashes: %s" % (fname))
-    with open(fname, "rb") as fd:
-        return _generate_hashes(fd)
+    with open(fname, "rb") as fd, ThreadPoolExecutor(
+        max_workers=HASH_THREADS
+    ) as executor:
+        return _generate_hashes(fd, executor)
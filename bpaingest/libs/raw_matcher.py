@@ -1,5 +1,74 @@
+import re
+from functools import lru_cache
+
 from bpaingest.libs.common_resources import bsd_md5_re, linux_md5_re
 
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+
+def required_literal(regexp):
+    """
+    the longest run of literal text which every string matched by `regexp` must
+    contain, or "" if none is known. only the parts of the expression which are
+    not optional or repeated are considered, which is where filename patterns
+    have their separators and extensions
+    """
+    if not isinstance(regexp.pattern, str) or regexp.flags & re.IGNORECASE:
+        return ""
+    try:
+        parsed = sre_parse.parse(regexp.pattern, regexp.flags)
+    except Exception:
+        return ""
+
+    runs = []
+
+    def walk(items):
+        run = []
+        for op, av in items:
+            if op == sre_parse.LITERAL:
+                run.append(chr(av))
+                continue
+            runs.append("".join(run))
+            run = []
+            if op == sre_parse.SUBPATTERN:
+                _, add_flags, _, sub = av
+                if not add_flags & re.IGNORECASE:
+                    walk(sub)
+        runs.append("".join(run))
+
+    walk(parsed)
+    return max(runs, key=len)
+
+
+class PatternMatcher:
+    """
+    matches strings against `regexps`, returning the match of the first to
+    match as `regexp.match` would. an expression is only tried on strings which
+    contain its required literal (e.g. "_R1.fastq.gz"), so that most are ruled
+    out by a substring test rather than a regular expression match
+    """
+
+    def __init__(self, regexps):
+        self.regexps = tuple(regexps)
+        self._candidates = [(required_literal(t), t.match) for t in self.regexps]
+
+    def match(self, s):
+        for literal, match in self._candidates:
+            if literal in s:
+                m = match(s)
+                if m is not None:
+                    return m
+        return None
+
+
+@lru_cache(maxsize=None)
+def compile_matcher(regexps):
+    "the PatternMatcher for a tuple of regular expressions, built once per tuple"
+    return PatternMatcher(regexps)
+
 
 class RawParser:
     def __init__(self, name, match, skip):
@@ -11,22 +80,27 @@ class RawParser:
     @classmethod
     def _matching_regexp(cls, regexps, s):
         "return the first matching regular expression from `regexps`"
-        matches = [t for t in [regexp.match(s) for regexp in regexps] if t]
-        if not matches:
-            return None
-        return matches[0]
+        return compile_matcher(tuple(regexps)).match(s)
 
     @classmethod
     def _match_path(cls, s):
         return s.split("/")[-1]
 
+    @classmethod
+    def _matchers(cls, match, skip):
+        "compiled matchers for the `match` and `skip` expressions"
+        if skip is not None:
+            skip = compile_matcher(tuple(skip))
+        return compile_matcher(tuple(match)), skip
+
     def _parse(self, list_name, match, skip):
+        match, skip = self._matchers(match, skip)
         for path in list_name:
             match_path = self._match_path(path)
-            if skip is not None and self._matching_regexp(skip, match_path):
+            if skip is not None and skip.match(match_path):
                 self.skipped.append(path)
                 continue
-            m = self._matching_regexp(match, match_path)
+            m = match.match(match_path)
             if not m:
                 self.no_match.append(path)
                 continue
@@ -1,13 +1,46 @@
 #!/usr/bin/env python3
 
-import boto3
+import csv
+import gzip
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, unquote_plus
+
+import botocore.exceptions
 import copy
-from deepdiff import DeepDiff
 from bpaingest.util import make_logger
 
 logger = make_logger(__name__)
 
-s3 = boto3.client("s3")
+# number of concurrent tagging requests made by apply_tag_changes
+TAG_THREADS = 16
+
+_s3 = None
+_s3_lock = threading.Lock()
+
+
+def get_s3_client():
+    """
+    the S3 client shared by this module. boto3 clients are thread-safe, so one
+    client with a connection pool sized for TAG_THREADS is used by all threads.
+    boto3 is slow to import, so it is only imported once a client is needed
+    """
+    global _s3
+    with _s3_lock:
+        if _s3 is None:
+            import boto3
+            from botocore.config import Config
+
+            _s3 = boto3.client(
+                "s3",
+                config=Config(
+                    max_pool_connections=TAG_THREADS,
+                    retries={"max_attempts": 10, "mode": "adaptive"},
+                ),
+            )
+        return _s3
 
 
 def boto3_tags_to_dict(tags):
@@ -27,18 +60,22 @@ def dict_to_boto3_tags(boto3_dict):
 
 
 def get_tag_dict(bucket, key):
-    response = s3.get_object_tagging(Bucket=bucket, Key=key)
+    response = get_s3_client().get_object_tagging(Bucket=bucket, Key=key)
     return boto3_tags_to_dict(response.get("TagSet", []))
 
 
 def update_tags(bucket, key, new_tag_dict):
     tags = dict_to_boto3_tags(new_tag_dict)
 
-    response = s3.put_object_tagging(Bucket=bucket, Key=key, Tagging={"TagSet": tags})
+    response = get_s3_client().put_object_tagging(
+        Bucket=bucket, Key=key, Tagging={"TagSet": tags}
+    )
     return response
 
 
 def merge_and_update_tags(bucket, key, update_tag_dict):
+    from deepdiff import DeepDiff
+
     revised_tag_dict = get_tag_dict(bucket, key).copy()
     orig_tag_dict = copy.deepcopy(revised_tag_dict)
 
@@ -54,3 +91,192 @@ def merge_and_update_tags(bucket, key, update_tag_dict):
         )
     )
     return update_tags(bucket, key, revised_tag_dict)
+
+
+class TagPlan:
+    """
+    the tag changes needed to merge `update_tag_dict` into the tags of many
+    objects. `changes` is a list of (bucket, key, revised tag dict) for objects
+    whose tags would change, `missing` the (bucket, key) of objects which do
+    not exist, and `failed` the (bucket, key) of objects whose tags could not
+    be read (e.g. access denied). `unchanged` counts objects already tagged as
+    required.
+    """
+
+    def __init__(self):
+        self.changes = []
+        self.missing = []
+        self.failed = []
+        self.unchanged = 0
+
+
+def plan_tag_changes(objects, update_tag_dict, snapshot=None, num_threads=TAG_THREADS):
+    """
+    plan merging `update_tag_dict` into the tags of each (bucket, key) in
+    `objects`. current tags are taken from `snapshot`, a dict of
+    (bucket, key) -> tag dict, where available (e.g. from an earlier listing)
+    and otherwise fetched concurrently. an error reading the tags of one object
+    is logged, and the object recorded in `failed`, so that it does not stop
+    the others being tagged
+    """
+    if snapshot is None:
+        snapshot = {}
+
+    def current_tags(obj):
+        "returns (tags, error); tags is None if the object does not exist"
+        if obj in snapshot:
+            return snapshot[obj], None
+        bucket, key = obj
+        try:
+            return get_tag_dict(bucket, key), None
+        except botocore.exceptions.ClientError as ex:
+            if ex.response["Error"]["Code"] == "NoSuchKey":
+                return None, None
+            logger.error(
+                "Unable to read tags of s3 object with key `%s': %s" % (key, ex)
+            )
+            return None, ex
+
+    plan = TagPlan()
+    objects = list(dict.fromkeys(objects))
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        for (bucket, key), (tags, error) in zip(
+            objects, executor.map(current_tags, objects)
+        ):
+            if error is not None:
+                plan.failed.append((bucket, key))
+                continue
+            if tags is None:
+                plan.missing.append((bucket, key))
+                continue
+            revised = dict(tags, **update_tag_dict)
+            if revised == tags:
+                plan.unchanged += 1
+                continue
+            plan.changes.append((bucket, key, revised))
+    logger.info(
+        "tag plan: %d objects to tag, %d already tagged, %d missing, %d failed"
+        % (len(plan.changes), plan.unchanged, len(plan.missing), len(plan.failed))
+    )
+    return plan
+
+
+def apply_tag_changes(plan, num_threads=TAG_THREADS):
+    """
+    apply a TagPlan, concurrently. returns the (bucket, key) of any objects
+    which could not be tagged
+    """
+
+    def apply(change):
+        bucket, key, tags = change
+        try:
+            update_tags(bucket, key, tags)
+        except botocore.exceptions.ClientError as ex:
+            logger.error("Unable to tag s3 object with key `%s': %s" % (key, ex))
+            return (bucket, key)
+        return None
+
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        failed = [t for t in executor.map(apply, plan.changes) if t is not None]
+    logger.info(
+        "tagged %d objects, %d failed" % (len(plan.changes) - len(failed), len(failed))
+    )
+    return failed
+
+
+def write_batch_operations_manifests(plan, path):
+    """
+    write a TagPlan as S3 Batch Operations manifests, rather than applying it.
+    a PutObjectTagging job replaces the tags of every object in its manifest
+    with one tag set, so objects are grouped by their revised tags: one CSV
+    manifest per tag set, listed with its tag set in `jobs.json`. keys are URL
+    encoded, as S3 Batch Operations requires
+    """
+    os.makedirs(path, exist_ok=True)
+    by_tags = {}
+    for bucket, key, tags in plan.changes:
+        tag_set = tuple(sorted(tags.items()))
+        by_tags.setdefault(tag_set, []).append((bucket, key))
+    jobs = []
+    for idx, (tag_set, objects) in enumerate(sorted(by_tags.items())):
+        manifest = os.path.join(path, "manifest-{}.csv".format(idx))
+        with open(manifest, "w", newline="") as fd:
+            writer = csv.writer(fd)
+            for bucket, key in objects:
+                writer.writerow([bucket, quote(key)])
+        jobs.append(
+            {
+                "manifest": os.path.basename(manifest),
+                "objects": len(objects),
+                "operation": {
+                    "S3PutObjectTagging": {"TagSet": dict_to_boto3_tags(dict(tag_set))}
+                },
+            }
+        )
+    with open(os.path.join(path, "jobs.json"), "w") as fd:
+        json.dump(jobs, fd, indent=2)
+    logger.info(
+        "wrote %d S3 Batch Operations manifests for %d objects to %s"
+        % (len(jobs), len(plan.changes), path)
+    )
+    return jobs
+
+
+def list_object_index(bucket, prefix):
+    """
+    the size and ETag of every object under `prefix` in `bucket`, from a
+    paginated ListObjectsV2 listing: a dict of key (relative to `prefix`) ->
+    (size, etag). each call lists up to 1000 objects
+    """
+    index = {}
+    calls = 0
+    paginator = get_s3_client().get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        calls += 1
+        for obj in page.get("Contents", []):
+            index[obj["Key"][len(prefix) :]] = (obj["Size"], obj["ETag"].strip('"'))
+    logger.info(
+        "indexed %d objects under s3://%s/%s with %d list calls"
+        % (len(index), bucket, prefix, calls)
+    )
+    return index
+
+
+def load_inventory_index(manifest_path, prefix):
+    """
+    as list_object_index, from a CSV format S3 Inventory report which has been
+    downloaded to local files. `manifest_path` is the report's manifest.json;
+    the data files it lists are looked for alongside it, or under data/
+    """
+    with open(manifest_path) as fd:
+        manifest = json.load(fd)
+    if manifest.get("fileFormat", "CSV") != "CSV":
+        raise Exception(
+            "S3 Inventory format %s not supported: use CSV" % (manifest["fileFormat"])
+        )
+    fields = [t.strip() for t in manifest["fileSchema"].split(",")]
+    key_idx, size_idx, etag_idx = (fields.index(t) for t in ("Key", "Size", "ETag"))
+    # a report of all versions lists superseded versions too
+    latest_idx = fields.index("IsLatest") if "IsLatest" in fields else None
+    base = os.path.dirname(manifest_path)
+    index = {}
+    for data_file in manifest["files"]:
+        name = os.path.basename(data_file["key"])
+        candidates = [os.path.join(base, name), os.path.join(base, "data", name)]
+        path = next((t for t in candidates if os.path.exists(t)), None)
+        if path is None:
+            raise FileNotFoundError("S3 Inventory data file not found: %s" % (name))
+        with gzip.open(path, "rt", newline="") as fd:
+            for row in csv.reader(fd):
+                # keys are URL encoded; delete markers have no size
+                key = unquote_plus(row[key_idx])
+                if not key.startswith(prefix) or not row[size_idx]:
+                    continue
+                if latest_idx is not None and row[latest_idx] != "true":
+                    continue
+                index[key[len(prefix) :]] = (int(row[size_idx]), row[etag_idx])
+    logger.info(
+        "indexed %d objects under %s from S3 Inventory %s"
+        % (len(index), prefix, manifest_path)
+    )
+    return index
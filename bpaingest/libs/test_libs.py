@@ -1,7 +1,30 @@
+import functools
+import gzip
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from hashlib import md5
 from io import BytesIO
 
+import openpyxl
+import pytest
+from bs4 import BeautifulSoup
+
+from . import ingest_utils, s3, transfer
+from .excel_wrapper import (
+    ExcelWrapper,
+    open_workbook,
+    evict_workbook,
+    make_field_definition as fld,
+)
+from .fetch_data import Fetcher, listing_sizes
 from .ingest_utils import get_clean_number, get_clean_doi
-from .multihash import _generate_hashes
+from .md5lines import MD5Parser, md5lines
+from .multihash import _generate_hashes, HASH_THREADS, MultiHasher
+from .raw_matcher import PatternMatcher, RawParser, required_literal
 from bpaingest.libs.common_resources import bsd_md5_re, linux_md5_re
 from bpaingest.util import make_logger
 
@@ -102,6 +125,113 @@ def test_md5lines2():
         assert linux_md5_re.match(filename) is not None
 
 
+def test_pattern_matcher():
+    fastq_re = re.compile(
+        r"""
+        (?P<library_id>\d{4,6})_
+        (?P<flowcell_id>\w{9})_
+        (?P<read>R[12])
+        \.fastq\.gz$
+    """,
+        re.VERBOSE,
+    )
+    any_fastq_re = re.compile(r"(?P<name>.*)\.fastq\.gz$")
+    xlsx_re = re.compile(r"(?i:.*_METADATA)\.xlsx$")
+    assert required_literal(fastq_re) == ".fastq.gz"
+    assert required_literal(xlsx_re) == ".xlsx"
+    assert required_literal(re.compile(r"\d+_md5\.txt", re.IGNORECASE)) == ""
+
+    matcher = PatternMatcher([fastq_re, any_fastq_re, xlsx_re])
+    # the first expression to match is used, as with re.match in order
+    m = matcher.match("12345_HLCH5DSXX_R1.fastq.gz")
+    assert m.re is fastq_re
+    assert m.groupdict() == {
+        "library_id": "12345",
+        "flowcell_id": "HLCH5DSXX",
+        "read": "R1",
+    }
+    assert matcher.match("sample.fastq.gz").groupdict() == {"name": "sample"}
+    assert matcher.match("x_metadata.xlsx").re is xlsx_re
+    assert matcher.match("12345_HLCH5DSXX_R1.fastq") is None
+
+    parser = RawParser(
+        ["a/12345_HLCH5DSXX_R2.fastq.gz", "b/notes.txt", "c/x_metadata.xlsx"],
+        [fastq_re],
+        [xlsx_re],
+    )
+    assert parser.matches == [
+        (
+            "a/12345_HLCH5DSXX_R2.fastq.gz",
+            {"library_id": "12345", "flowcell_id": "HLCH5DSXX", "read": "R2"},
+        )
+    ]
+    assert parser.no_match == ["b/notes.txt"]
+    assert parser.skipped == ["c/x_metadata.xlsx"]
+
+
+def test_md5lines_formats():
+    md5 = "8f819a7635f192212300cd64d1e34f10"
+    lines = [
+        "{} a/12345_HLCH5DSXX_R1.fastq.gz\n".format(md5),
+        "{} *12345_HLCH5DSXX_R2.fastq.gz\n".format(md5.upper()),
+        "{}  name with spaces.xlsx\n".format(md5),
+        "\n",
+        "MD5 (12345_HLCH5DSXX_I1.fastq.gz) = {}\n".format(md5),
+    ]
+    # the fast path gives the same result as the regular expressions
+    expected = []
+    for line in lines:
+        line = line.strip()
+        m = bsd_md5_re.match(line)
+        if m:
+            expected.append(tuple(reversed(m.groups())))
+        elif linux_md5_re.match(line):
+            expected.append(linux_md5_re.match(line).groups())
+    assert list(md5lines(lines)) == expected
+    assert expected[2] == (md5, "name with spaces.xlsx")
+    with pytest.raises(Exception):
+        list(md5lines(["{} \n".format(md5[1:])]))
+
+
+def test_md5_parser_streams_matches(tmp_path):
+    fastq_re = re.compile(r"(?P<library_id>\d+)_(?P<flowcell_id>\w{9})_(?P<read>R[12])")
+    fname = str(tmp_path / "manifest.md5")
+    with open(fname, "w") as fd:
+        for library_id in ("12345", "12346"):
+            for read in ("R1", "R2"):
+                fd.write(
+                    "8f819a7635f192212300cd64d1e34f10 run/{}_HLCH5DSXX_{}.fastq.gz\n".format(
+                        library_id, read
+                    )
+                )
+        fd.write("8f819a7635f192212300cd64d1e34f10 run/SampleSheet.csv\n")
+        fd.write("8f819a7635f192212300cd64d1e34f10 run/notes.txt\n")
+
+    parser = MD5Parser(fname, [fastq_re], [re.compile(r"SampleSheet")])
+    matches = iter(parser)
+    first = next(matches)
+    # the file is read only as far as the matches consumed
+    assert parser.no_match == []
+    assert first.path == "run/12345_HLCH5DSXX_R1.fastq.gz"
+    assert first.groupdict() == {
+        "library_id": "12345",
+        "flowcell_id": "HLCH5DSXX",
+        "read": "R1",
+    }
+    rest = list(matches)
+    assert [t.path for t in rest][-1] == "run/12346_HLCH5DSXX_R2.fastq.gz"
+    assert parser.skipped == ["run/SampleSheet.csv"]
+    assert parser.no_match == ["run/notes.txt"]
+    # repeated values are shared between records
+    assert rest[0].values[1] is rest[2].values[1]
+
+    path, md5, file_info = parser.matches[3]
+    assert (path, file_info["library_id"]) == (
+        "run/12346_HLCH5DSXX_R2.fastq.gz",
+        "12346",
+    )
+
+
 def test_get_clean_doi():
     strings = (
         ("https://dx.doi.org/10.100/1234", None),
@@ -120,3 +250,328 @@ def test_get_clean_doi():
         assert get_clean_doi(logger, s) == f
     assert get_clean_doi(logger, "") is ""
     assert get_clean_doi(logger, None) is None
+
+
+def test_multihash_threaded_matches_serial():
+    data = b"hello" * TEST_CHUNK_SIZE
+    with ThreadPoolExecutor(max_workers=HASH_THREADS) as executor:
+        threaded = _generate_hashes(BytesIO(data), executor)
+    assert threaded == _generate_hashes(BytesIO(data))
+
+
+def test_multihasher_matches_generate_hashes():
+    data = os.urandom(2 * TEST_CHUNK_SIZE + 12345)
+    hasher = MultiHasher()
+    for i in range(0, len(data), 3 * (1 << 20) + 7):
+        hasher.update(data[i : i + 3 * (1 << 20) + 7])
+    assert hasher.hashes() == _generate_hashes(BytesIO(data))
+
+
+def test_workbook_cache(tmp_path):
+    fname = str(tmp_path / "metadata.xlsx")
+    workbook = openpyxl.Workbook()
+    workbook.active.append(["sample_id"])
+    workbook.save(fname)
+
+    first = open_workbook(fname)
+    assert open_workbook(fname) is first
+    evict_workbook(fname)
+    second = open_workbook(fname)
+    assert second is not first
+
+    # a changed file is parsed again
+    workbook.active.append(["102.100.100/1234"])
+    workbook.save(fname)
+    os.utime(fname, ns=(0, 0))
+    assert open_workbook(fname) is not second
+    evict_workbook()
+
+
+def test_excel_wrapper_get_all_merged(tmp_path):
+    fname = str(tmp_path / "merged.xlsx")
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(["Sample ID", "Site"])
+    sheet.append(["102.100.100/1", " Bondi "])
+    sheet.append(["102.100.100/2", None])
+    sheet.merge_cells("B2:B3")
+    workbook.save(fname)
+
+    field_spec = [
+        fld("sample_id", "sample id", coerce=ingest_utils.extract_ands_id),
+        fld("site", "site"),
+        fld("depth", "depth", optional=True),
+    ]
+    wrapper = ExcelWrapper(logger, field_spec, fname, header_length=1)
+    rows = list(wrapper.get_all())
+    evict_workbook(fname)
+    assert [tuple(t) for t in rows] == [
+        ("102.100.100/1", "Bondi", None),
+        ("102.100.100/2", "Bondi", None),
+    ]
+
+
+def test_fetcher_incremental(tmp_path):
+    source = tmp_path / "source"
+    for ticket, name in (
+        ("BPAOPS-1", "a.md5"),
+        ("BPAOPS-1", "b.xlsx"),
+        ("BPAOPS-2", "c.md5"),
+    ):
+        (source / ticket).mkdir(parents=True, exist_ok=True)
+        (source / ticket / name).write_text(name)
+    (source / "BPAOPS-2" / "ignored.txt").write_text("ignored")
+
+    handler = functools.partial(SimpleHTTPRequestHandler, directory=str(source))
+    handler.log_message = lambda *args: None
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = "http://127.0.0.1:{}/".format(server.server_port)
+
+    def fetch():
+        metadata_info = {}
+        fetcher = Fetcher(logger, str(tmp_path / "target"), url, incremental=True)
+        fetcher.fetch_metadata_from_folder(None, metadata_info, ["ticket"])
+        return metadata_info
+
+    try:
+        metadata_info = fetch()
+        assert list(metadata_info) == ["a.md5", "b.xlsx", "c.md5"]
+        assert metadata_info["c.md5"] == {
+            "ticket": "BPAOPS-2",
+            "base_url": url + "BPAOPS-2/",
+        }
+        assert (tmp_path / "target" / "b.xlsx").read_text() == "b.xlsx"
+
+        # unchanged files are not downloaded again, changed ones are
+        (tmp_path / "target" / "a.md5").write_text("local")
+        (source / "BPAOPS-1" / "b.xlsx").write_text("changed")
+        os.utime(source / "BPAOPS-1" / "b.xlsx", (2**31, 2**31))
+        (source / "BPAOPS-2" / "c.md5").unlink()
+        metadata_info = fetch()
+        assert list(metadata_info) == ["a.md5", "b.xlsx"]
+        assert (tmp_path / "target" / "a.md5").read_text() == "local"
+        assert (tmp_path / "target" / "b.xlsx").read_text() == "changed"
+        assert not (tmp_path / "target" / "c.md5").exists()
+    finally:
+        server.shutdown()
+
+
+def test_batch_tagging(tmp_path, monkeypatch):
+    mock_aws = pytest.importorskip("moto").mock_aws
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setattr(s3, "_s3", None)
+    with mock_aws():
+        client = s3.get_s3_client()
+        client.create_bucket(Bucket="bpa-ckan-test")
+        keys = ["resources/{}/file {}.fastq.gz".format(i, i) for i in range(6)]
+        for idx, key in enumerate(keys):
+            client.put_object(Bucket="bpa-ckan-test", Key=key, Body=b"data")
+            tags = {"project": "amd"}
+            if idx < 2:
+                tags["audit"] = "verified"
+            s3.update_tags("bpa-ckan-test", key, tags)
+
+        objects = [("bpa-ckan-test", t) for t in keys + ["resources/missing"]]
+        plan = s3.plan_tag_changes(objects, {"audit": "verified"})
+        assert plan.unchanged == 2
+        assert plan.missing == [("bpa-ckan-test", "resources/missing")]
+        assert [t[1] for t in plan.changes] == keys[2:]
+
+        jobs = s3.write_batch_operations_manifests(plan, str(tmp_path))
+        assert len(jobs) == 1 and jobs[0]["objects"] == 4
+        assert (tmp_path / "manifest-0.csv").read_text().splitlines()[0] == (
+            "bpa-ckan-test,resources/2/file%202.fastq.gz"
+        )
+
+        assert s3.apply_tag_changes(plan) == []
+        for key in keys:
+            assert s3.get_tag_dict("bpa-ckan-test", key) == {
+                "project": "amd",
+                "audit": "verified",
+            }
+        assert s3.plan_tag_changes(objects, {"audit": "verified"}).changes == []
+
+
+class FlakySource:
+    def __init__(self, data):
+        self.data = data
+        self.fail_at = None
+        self.reads = []
+
+    def size(self):
+        return len(self.data)
+
+    def read(self, start, length):
+        self.reads.append(start)
+        if start == self.fail_at:
+            self.fail_at = None
+            raise IOError("connection reset")
+        return self.data[start : start + length]
+
+
+def test_streaming_upload_resumes(monkeypatch):
+    mock_aws = pytest.importorskip("moto").mock_aws
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setattr(s3, "_s3", None)
+    monkeypatch.setattr(transfer, "PART_ATTEMPTS", 1)
+    data = os.urandom(2 * TEST_CHUNK_SIZE + 12345)
+    source = FlakySource(data)
+    with mock_aws():
+        client = s3.get_s3_client()
+        client.create_bucket(Bucket="bpa-ckan-test")
+        upload = transfer.StreamingUpload(
+            source, "bpa-ckan-test", "resources/1/file.bam", num_threads=2
+        )
+        source.fail_at = 2 * TEST_CHUNK_SIZE
+        with pytest.raises(IOError):
+            upload.run()
+        assert sorted(upload.parts) == [1, 2]
+
+        # parts S3 lists as uploaded are neither read nor uploaded again; the
+        # ETag recorded for part 2 is not the one listed
+        upload.parts[2] = '"0123"'
+        source.reads = []
+        uploaded = []
+        upload_part = client.upload_part
+        monkeypatch.setattr(
+            client,
+            "upload_part",
+            lambda **kwargs: uploaded.append(kwargs["PartNumber"])
+            or upload_part(**kwargs),
+        )
+        hashes = upload.run()
+        assert sorted(source.reads) == [TEST_CHUNK_SIZE, 2 * TEST_CHUNK_SIZE]
+        assert sorted(uploaded) == [2, 3]
+        assert hashes == _generate_hashes(BytesIO(data))
+        head = client.head_object(Bucket="bpa-ckan-test", Key="resources/1/file.bam")
+        assert head["ETag"].strip('"') == hashes["s3etag_8388608"]
+        assert head["ContentLength"] == len(data)
+
+
+def test_streaming_upload_md5_mismatch(monkeypatch):
+    mock_aws = pytest.importorskip("moto").mock_aws
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setattr(s3, "_s3", None)
+    monkeypatch.setattr(transfer, "PART_ATTEMPTS", 1)
+    data = os.urandom(2 * TEST_CHUNK_SIZE + 12345)
+    wrong = "0" * 32
+    with mock_aws():
+        client = s3.get_s3_client()
+        client.create_bucket(Bucket="bpa-ckan-test")
+
+        def objects():
+            listing = client.list_objects_v2(Bucket="bpa-ckan-test")
+            uploads = client.list_multipart_uploads(Bucket="bpa-ckan-test")
+            return listing.get("Contents", []) + uploads.get("Uploads", [])
+
+        # the upload is abandoned before it is completed
+        for source in (FlakySource(data[:100]), FlakySource(data)):
+            upload = transfer.StreamingUpload(source, "bpa-ckan-test", "file.bam")
+            with pytest.raises(transfer.MD5Mismatch):
+                upload.run(md5=wrong)
+            assert objects() == []
+
+        # a resumed upload is checked once completed, and then removed
+        source = FlakySource(data)
+        source.fail_at = 2 * TEST_CHUNK_SIZE
+        upload = transfer.StreamingUpload(source, "bpa-ckan-test", "file.bam")
+        with pytest.raises(IOError):
+            upload.run()
+        with pytest.raises(transfer.MD5Mismatch):
+            upload.run(md5=wrong)
+        assert objects() == []
+
+        upload = transfer.StreamingUpload(FlakySource(data), "bpa-ckan-test", "a.bam")
+        assert upload.run(md5=md5(data).hexdigest())["md5"] == md5(data).hexdigest()
+
+
+def test_streaming_upload_empty_file(tmp_path, monkeypatch):
+    mock_aws = pytest.importorskip("moto").mock_aws
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setattr(s3, "_s3", None)
+    (tmp_path / "empty.txt").write_bytes(b"")
+    handler = functools.partial(SimpleHTTPRequestHandler, directory=str(tmp_path))
+    handler.log_message = lambda *args: None
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = "http://127.0.0.1:{}/empty.txt".format(server.server_port)
+    try:
+        source = transfer.HTTPSource(url)
+        assert source.read(0, 0) == b""
+        with mock_aws():
+            client = s3.get_s3_client()
+            client.create_bucket(Bucket="bpa-ckan-test")
+            hashes = transfer.StreamingUpload(
+                source, "bpa-ckan-test", "resources/1/empty.txt"
+            ).run()
+            assert hashes == _generate_hashes(BytesIO(b""))
+            head = client.head_object(
+                Bucket="bpa-ckan-test", Key="resources/1/empty.txt"
+            )
+            assert head["ContentLength"] == 0
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_listing_sizes():
+    apache = """<table>
+    <tr><th><a href="?C=N;O=D">Name</a></th><th>Size</th></tr>
+    <tr><td><a href="../">Parent Directory</a></td><td>-</td></tr>
+    <tr><td><a href="12345.md5">12345.md5</a></td>
+        <td align="right">2023-01-01 10:00</td><td align="right">97</td></tr>
+    <tr><td><a href="12345_R1.fastq.gz">12345_R1.fastq.gz</a></td>
+        <td align="right">2023-01-01 10:00</td><td align="right">1.2G</td></tr>
+    </table>"""
+    url = "https://downloads.bioplatforms.com/amd/BPAOPS-1/"
+    assert listing_sizes(BeautifulSoup(apache, "html.parser"), url) == {
+        url + "12345.md5": 97
+    }
+    pre = """<pre><a href="../">../</a>
+<a href="a%20b.bam">a b.bam</a>      01-Jan-2023 10:00      123456789
+<a href="c.bam">c.bam</a>      01-Jan-2023 10:00      118M
+</pre>"""
+    assert listing_sizes(BeautifulSoup(pre, "html.parser"), url) == {
+        url + "a%20b.bam": 123456789
+    }
+
+
+def test_s3_object_index(tmp_path, monkeypatch):
+    mock_aws = pytest.importorskip("moto").mock_aws
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setattr(s3, "_s3", None)
+    prefix = "prodenv/resources/"
+    with mock_aws():
+        client = s3.get_s3_client()
+        client.create_bucket(Bucket="bpa-ckan-test")
+        for key in ("1/a.fastq.gz", "2/b c.bam"):
+            client.put_object(Bucket="bpa-ckan-test", Key=prefix + key, Body=b"data")
+        client.put_object(Bucket="bpa-ckan-test", Key="other/3/c.bam", Body=b"x")
+        index = s3.list_object_index("bpa-ckan-test", prefix)
+    etag = "8d777f385d3dfec8815d20f7496026dc"
+    assert index == {"1/a.fastq.gz": (4, etag), "2/b c.bam": (4, etag)}
+
+    # the same, from an S3 Inventory report
+    (tmp_path / "data").mkdir()
+    with gzip.open(str(tmp_path / "data" / "0123.csv.gz"), "wt") as fd:
+        fd.write('"bpa-ckan-test","prodenv/resources/1/a.fastq.gz","4","%s"\n' % etag)
+        fd.write('"bpa-ckan-test","prodenv/resources/2/b+c.bam","4","%s"\n' % etag)
+        fd.write('"bpa-ckan-test","other/3/c.bam","1","x"\n')
+    manifest = {
+        "fileFormat": "CSV",
+        "fileSchema": "Bucket, Key, Size, ETag",
+        "files": [{"key": "inventory/bpa-ckan-test/all/data/0123.csv.gz"}],
+    }
+    (tmp_path / "manifest.json").write_text(json.dumps(manifest))
+    assert s3.load_inventory_index(str(tmp_path / "manifest.json"), prefix) == index
@@ -0,0 +1,357 @@
+"""
+In-process transfer of files from the archive to S3: parts of the file are
+fetched with concurrent ranged GETs and sent straight to a multipart upload,
+hashing the data as it passes through
+"""
+
+import base64
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import md5
+
+import urllib3
+
+from .multihash import MultiHasher, S3_CHUNK_SIZES
+from .s3 import get_s3_client
+from ..util import make_logger
+
+logger = make_logger(__name__)
+
+# S3 permits at most this many parts in a multipart upload
+MAX_PARTS = 10000
+# number of parts of a file fetched and uploaded concurrently
+PART_THREADS = 8
+# upper bound on the part data held in memory by one transfer
+MAX_BUFFER = 512 * (1 << 20)
+# each part is tried this many times in all, waiting PART_RETRY_BACKOFF seconds
+# before the first retry, doubling after each
+PART_ATTEMPTS = 3
+PART_RETRY_BACKOFF = 2
+
+
+class TransferException(Exception):
+    pass
+
+
+class MD5Mismatch(TransferException):
+    "the file transferred does not have the md5 expected of it"
+
+
+def choose_part_size(size):
+    """
+    the smallest of the S3 chunk sizes we record hashes for which keeps the
+    upload within MAX_PARTS, so that the uploaded object has an ETag matching
+    the corresponding s3etag_* hash
+    """
+    for part_size in S3_CHUNK_SIZES:
+        if size <= part_size * MAX_PARTS:
+            return part_size
+    part_size = S3_CHUNK_SIZES[-1]
+    while size > part_size * MAX_PARTS:
+        part_size *= 2
+    return part_size
+
+
+class HTTPSource:
+    "a file on a web server, read with ranged GETs"
+
+    def __init__(self, url, headers=None, http=None):
+        self.url = url
+        self.headers = headers or {}
+        self.http = http or urllib3.PoolManager(maxsize=PART_THREADS)
+
+    def size(self):
+        response = self.http.request("HEAD", self.url, headers=self.headers)
+        if response.status != 200 or "content-length" not in response.headers:
+            raise TransferException(
+                "unable to determine size of `%s': status %s"
+                % (self.url, response.status)
+            )
+        return int(response.headers["content-length"])
+
+    def read(self, start, length):
+        if length == 0:
+            # there is no valid range for no bytes
+            return b""
+        headers = dict(self.headers)
+        headers["Range"] = "bytes=%d-%d" % (start, start + length - 1)
+        response = self.http.request("GET", self.url, headers=headers)
+        if response.status != 206:
+            raise TransferException(
+                "ranged GET of `%s' failed: status %s" % (self.url, response.status)
+            )
+        return response.data
+
+
+class FileSource:
+    "a local file"
+
+    def __init__(self, path):
+        self.path = path
+
+    def size(self):
+        return os.path.getsize(self.path)
+
+    def read(self, start, length):
+        with open(self.path, "rb") as fd:
+            fd.seek(start)
+            return fd.read(length)
+
+
+class StreamingUpload:
+    """
+    upload `source` to s3://`bucket`/`key`, without writing it to local disk.
+
+    each part is fetched from the source and uploaded by a pool of worker
+    threads; at most MAX_BUFFER bytes of part data are held in memory. the
+    parts are hashed in order as they complete, so once the upload is done
+    `run` returns the md5, sha256 and s3etag_* hashes of the file.
+
+    if `run` fails, the multipart upload is left in place and the parts
+    uploaded so far are kept in `parts`: a later call to `run` fetches and
+    uploads only the parts which S3 does not list as uploaded. as the parts
+    already uploaded are not read from the source again, the hashes of a
+    resumed upload are computed by reading the completed object back from S3.
+    `checkpoint`, if given, is called after each part is uploaded, so that the
+    upload can be resumed by another process (see `state`)
+
+    if `run` is given the md5 expected of the file, an upload whose data does
+    not match is aborted rather than completed. a resumed upload can only be
+    checked once complete, so on a mismatch its object is deleted instead
+    """
+
+    def __init__(
+        self,
+        source,
+        bucket,
+        key,
+        num_threads=PART_THREADS,
+        upload_id=None,
+        part_size=None,
+        parts=None,
+        size=None,
+        checkpoint=None,
+    ):
+        self.source = source
+        self.bucket = bucket
+        self.key = key
+        self.num_threads = num_threads
+        self.upload_id = upload_id
+        self.part_size = part_size
+        self.parts = dict(parts or {})
+        self.size = size
+        self.checkpoint = checkpoint
+        self._lock = threading.Lock()
+
+    def state(self):
+        "the state needed to resume the upload, as a JSON-serialisable dict"
+        with self._lock:
+            parts = dict((str(k), v) for k, v in self.parts.items())
+        return {
+            "bucket": self.bucket,
+            "key": self.key,
+            "upload_id": self.upload_id,
+            "part_size": self.part_size,
+            "size": self.size,
+            "parts": parts,
+        }
+
+    def _read(self, start, length):
+        data = self.source.read(start, length)
+        if len(data) != length:
+            raise TransferException(
+                "short read of %s: wanted %d bytes at %d, got %d"
+                % (self.key, length, start, len(data))
+            )
+        return data
+
+    def _part_length(self, part_number):
+        return min(self.part_size, self.size - (part_number - 1) * self.part_size)
+
+    def _confirm_parts(self):
+        """
+        keep only those of `parts` which S3 lists as uploaded, with the ETag
+        and length recorded, returning their part numbers
+        """
+        listed = {}
+        paginator = get_s3_client().get_paginator("list_parts")
+        for page in paginator.paginate(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id
+        ):
+            for part in page.get("Parts", []):
+                listed[part["PartNumber"]] = (part["ETag"], part["Size"])
+        with self._lock:
+            self.parts = dict(
+                (k, v)
+                for k, v in self.parts.items()
+                if listed.get(k) == (v, self._part_length(k))
+            )
+            return set(self.parts)
+
+    def _object_hashes(self):
+        "the hashes of the uploaded object, read back from S3"
+        hasher = MultiHasher()
+        body = get_s3_client().get_object(Bucket=self.bucket, Key=self.key)["Body"]
+        for chunk in body.iter_chunks(chunk_size=self.part_size):
+            hasher.update(chunk)
+        return hasher.hashes()
+
+    def _check_md5(self, hashes, expected):
+        if expected is not None and hashes["md5"] != expected:
+            raise MD5Mismatch(
+                "md5 of %s is %s, expected %s" % (self.key, hashes["md5"], expected)
+            )
+
+    def _upload_part(self, part_number, length):
+        "fetch and upload a part, returning its data"
+        start = (part_number - 1) * self.part_size
+        delay = PART_RETRY_BACKOFF
+        for attempt in range(1, PART_ATTEMPTS + 1):
+            try:
+                data = self._read(start, length)
+                digest = md5(data).digest()
+                response = get_s3_client().upload_part(
+                    Bucket=self.bucket,
+                    Key=self.key,
+                    UploadId=self.upload_id,
+                    PartNumber=part_number,
+                    Body=data,
+                    ContentMD5=base64.b64encode(digest).decode("ascii"),
+                )
+                with self._lock:
+                    self.parts[part_number] = response["ETag"]
+                if self.checkpoint is not None:
+                    self.checkpoint()
+                return data
+            except Exception as e:
+                if attempt == PART_ATTEMPTS:
+                    raise
+                logger.warning(
+                    "part %d of %s failed (attempt %d of %d), retrying in %ds: %s"
+                    % (part_number, self.key, attempt, PART_ATTEMPTS, delay, e)
+                )
+                time.sleep(delay)
+                delay *= 2
+
+    def _run_single(self, progress, expected_md5):
+        # a file within one part is uploaded in one request, as S3 then gives it
+        # the ETag recorded as its s3etag_* hashes. an empty file is not read
+        data = self._read(0, self.size) if self.size else b""
+        hasher = MultiHasher()
+        hasher.update(data)
+        hashes = hasher.hashes()
+        self._check_md5(hashes, expected_md5)
+        get_s3_client().put_object(
+            Bucket=self.bucket,
+            Key=self.key,
+            Body=data,
+            ContentMD5=base64.b64encode(md5(data).digest()).decode("ascii"),
+        )
+        if progress is not None:
+            progress(len(data))
+        return hashes
+
+    def run(self, progress=None, md5=None):
+        """
+        transfer the file, returning its hashes. `progress` is called with the
+        number of bytes of each part as it is completed. if `md5` is given and
+        the file does not match it, MD5Mismatch is raised and nothing is left
+        in S3
+        """
+        if self.size is None:
+            self.size = self.source.size()
+        if self.part_size is None:
+            self.part_size = choose_part_size(self.size)
+        if self.size <= self.part_size:
+            return self._run_single(progress, md5)
+
+        if self.upload_id is None:
+            self.upload_id = get_s3_client().create_multipart_upload(
+                Bucket=self.bucket, Key=self.key
+            )["UploadId"]
+            logger.info(
+                "started multipart upload of %s: %d bytes in parts of %d"
+                % (self.key, self.size, self.part_size)
+            )
+        uploaded = set()
+        if self.parts:
+            uploaded = self._confirm_parts()
+            logger.info(
+                "resuming multipart upload of %s: %d parts already uploaded"
+                % (self.key, len(uploaded))
+            )
+            if progress is not None:
+                progress(sum(self._part_length(t) for t in uploaded))
+
+        part_count = (self.size + self.part_size - 1) // self.part_size
+        to_upload = [t for t in range(1, part_count + 1) if t not in uploaded]
+        window = max(1, min(self.num_threads, MAX_BUFFER // self.part_size))
+        # the file can only be hashed as it passes through if every part does
+        hasher = None if uploaded else MultiHasher()
+        with ThreadPoolExecutor(max_workers=window) as executor:
+            pending = deque()
+            remaining = iter(to_upload)
+            try:
+                while True:
+                    # keep `window` parts in flight; parts are hashed in order
+                    for part_number in remaining:
+                        pending.append(
+                            executor.submit(
+                                self._upload_part,
+                                part_number,
+                                self._part_length(part_number),
+                            )
+                        )
+                        if len(pending) == window:
+                            break
+                    if not pending:
+                        break
+                    data = pending.popleft().result()
+                    if hasher is not None:
+                        hasher.update(data)
+                    if progress is not None:
+                        progress(len(data))
+            finally:
+                for future in pending:
+                    future.cancel()
+
+        if hasher is not None:
+            hashes = hasher.hashes()
+            try:
+                self._check_md5(hashes, md5)
+            except MD5Mismatch:
+                self.abort()
+                raise
+        get_s3_client().complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            MultipartUpload={
+                "Parts": [
+                    {"ETag": self.parts[t], "PartNumber": t}
+                    for t in range(1, part_count + 1)
+                ]
+            },
+        )
+        logger.info("completed multipart upload of %s" % (self.key))
+        if hasher is None:
+            hashes = self._object_hashes()
+            try:
+                self._check_md5(hashes, md5)
+            except MD5Mismatch:
+                get_s3_client().delete_object(Bucket=self.bucket, Key=self.key)
+                raise
+        return hashes
+
+    def abort(self):
+        "abandon the multipart upload, discarding any uploaded parts"
+        if self.upload_id is None:
+            return
+        get_s3_client().abort_multipart_upload(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id
+        )
+        self.upload_id = None
+        self.parts = {}
@@ -6,6 +6,7 @@ from contextlib import suppress
 
 import requests as requests
 
+from .contextual_cache import ContextualCache
 from .libs.fetch_data import Fetcher, get_password, get_env_username
 
 
@@ -19,10 +20,15 @@ class DownloadMetadata:
         metadata_info=None,
         has_sql_context=False,
         has_validate_schema=False,
+        sql_context_excel_copy=False,
+        incremental_fetch=False,
+        contextual_cache_path=None,
     ):
         self.cleanup = True
         self.fetch = True
         self._logger = logger
+        self.contextual_cache = ContextualCache(logger, contextual_cache_path)
+        self.incremental_fetch = incremental_fetch
         self._set_path(path)
         self._set_auth(project_class)
 
@@ -32,8 +38,10 @@ class DownloadMetadata:
         sql_to_excel_context_classes = getattr(
             project_class, "sql_to_excel_context_classes", []
         )
+        self.sql_context_excel_copy = False
         if has_sql_context == True and sql_to_excel_context_classes:
             contextual_classes = sql_to_excel_context_classes
+            self.sql_context_excel_copy = sql_context_excel_copy
         else:
             contextual_classes = getattr(project_class, "contextual_classes", [])
 
@@ -62,25 +70,48 @@ class DownloadMetadata:
             meta_kwargs["metadata_info"] = json.load(fd)
         if self.contextual:
             meta_kwargs["contextual_metadata"] = [
-                c(self._logger, p) for (p, c) in self.contextual
+                self.contextual_cache.get(c, p) for (p, c) in self.contextual
             ]
+            if self.sql_context_excel_copy:
+                for contextual in meta_kwargs["contextual_metadata"]:
+                    if hasattr(contextual, "write_excel_copy"):
+                        contextual.write_excel_copy()
         if self.schema_definitions:
             meta_kwargs["schema_definitions"] = [
                 c(self._logger, p) for (p, c) in self.schema_definitions
             ]
         return self.project_class(logger, self.path, **meta_kwargs)
 
+    def listed_sizes(self):
+        """
+        the sizes of files in the archive, as given in the directory listings
+        crawled for the project's metadata (see Fetcher.listed_sizes)
+        """
+        try:
+            with open(self.sizes_json) as fd:
+                return json.load(fd)
+        except FileNotFoundError:
+            return {}
+
     def _fetch_metadata(self, project_class, contextual, metadata_info):
+        listed_sizes = {}
         for metadata_url in project_class.metadata_urls:
             self._logger.info(
                 "fetching submission metadata: %s" % (project_class.metadata_urls)
             )
-            fetcher = Fetcher(self._logger, self.path, metadata_url, self.auth)
+            fetcher = Fetcher(
+                self._logger,
+                self.path,
+                metadata_url,
+                self.auth,
+                incremental=self.incremental_fetch,
+            )
             fetcher.fetch_metadata_from_folder(
                 getattr(project_class, "metadata_patterns", None),
                 metadata_info,
                 getattr(project_class, "metadata_url_components", []),
             )
+            listed_sizes.update(fetcher.listed_sizes)
 
         with suppress(FileExistsError):
             os.mkdir(self.path)
@@ -99,7 +130,11 @@ class DownloadMetadata:
             )
             for metadata_url in contextual_cls.metadata_urls:
                 fetcher = Fetcher(
-                    self._logger, contextual_path, metadata_url, self.auth
+                    self._logger,
+                    contextual_path,
+                    metadata_url,
+                    self.auth,
+                    incremental=self.incremental_fetch,
                 )
                 fetcher.fetch_metadata_from_folder(
                     getattr(contextual_cls, "metadata_patterns", None),
@@ -107,6 +142,10 @@ class DownloadMetadata:
                     getattr(contextual_cls, "metadata_url_components", []),
                 )
         self.init_schema_classes(project_class, metadata_info)
+        tmpf = self.sizes_json + ".new"
+        with open(tmpf, "w") as fd:
+            json.dump(listed_sizes, fd)
+        os.replace(tmpf, self.sizes_json)
         tmpf = self.info_json + ".new"
         with open(tmpf, "w") as fd:
             json.dump(metadata_info, fd)
@@ -165,7 +204,16 @@ class DownloadMetadata:
             path = tempfile.mkdtemp(prefix="bpaingest-metadata-")
         self.path = path
         self.info_json = os.path.join(path, "bpa-ingest.json")
-        if os.access(self.info_json, os.R_OK):
+        self.sizes_json = os.path.join(path, "bpa-ingest-sizes.json")
+        if self.incremental_fetch:
+            if self.cleanup:
+                self._logger.warning(
+                    "incremental fetch has no effect without a download path"
+                )
+            self._logger.info(
+                "incremental metadata fetch, only changed files will be downloaded"
+            )
+        elif os.access(self.info_json, os.R_OK):
             self._logger.info(
                 "skipping metadata download, complete download in directory `%s' exists"
                 % path
@@ -1,6 +1,10 @@
+import hashlib
+import json
 import logging
+import re
 import subprocess
 import tempfile
+import threading
 import urllib
 import urllib3
 import shutil
@@ -10,23 +14,21 @@ import ckanapi
 import tqdm
 import os
 
-import boto3
-import boto3.session
-from botocore.config import Config
-from boto3.s3.transfer import TransferConfig
-from botocore.exceptions import ClientError, WaiterError
+from botocore.exceptions import ClientError
 
 from urllib.parse import urlparse
 import time
 from urllib.parse import urlparse, unquote
 from urllib.request import url2pathname
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 from urllib3 import request
 
 from .libs.ingest_utils import ApiFqBuilder
 from .libs.bpa_constants import AUDIT_VERIFIED
 from .libs.s3 import update_tags
+from .libs.transfer import FileSource, HTTPSource, MD5Mismatch, StreamingUpload
 from .libs.munge import bpa_munge_filename
 from .util import make_logger
 from .util import build_apache_headers_for_urllib3
@@ -36,25 +38,99 @@ logger = make_logger(__name__)
 UPLOAD_RETRY = 3
 
 method_stats = defaultdict(int)
+method_stats_lock = threading.Lock()
+
+# CKAN calls failing with an API error are tried this many times in all, waiting
+# CKAN_RETRY_BACKOFF seconds before the first retry, doubling after each
+CKAN_ATTEMPTS = 3
+CKAN_RETRY_BACKOFF = 2
+
+# symlinks in the archive are served as redirects, followed up to this depth
+LEGACY_REDIRECTS = 4
+# sizes found by HEAD requests are kept by a persisted legacy size cache for this
+# many seconds
+LEGACY_SIZE_TTL = 7 * 86400
+
+
+class RateLimiter:
+    """
+    spaces calls to `wait` so that there are at most `rate` per second
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+# requests per second to each CKAN host, or None for no limit
+ckan_rate_limit = None
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def set_ckan_rate_limit(rate):
+    global ckan_rate_limit
+    with _rate_limiters_lock:
+        ckan_rate_limit = rate or None
+        _rate_limiters.clear()
+
+
+def _rate_limiter(ckan):
+    if ckan_rate_limit is None:
+        return None
+    host = urlparse(getattr(ckan, "address", "")).netloc
+    with _rate_limiters_lock:
+        if host not in _rate_limiters:
+            _rate_limiters[host] = RateLimiter(ckan_rate_limit)
+        return _rate_limiters[host]
 
-KB = 1024
-MB = KB * KB
-GB = MB * KB
 
 def ckan_method(ckan, object_type, method):
     """
     returns a CKAN method from the upstream API, with an
-    intermediate function which does some global accounting
+    intermediate function which does some global accounting,
+    and applies any rate limit for the CKAN host
     """
     fn = getattr(ckan.action, object_type + "_" + method)
 
     def _proxy_fn(*args, **kwargs):
-        method_stats[(object_type, method)] += 1
+        with method_stats_lock:
+            method_stats[(object_type, method)] += 1
+        rate_limiter = _rate_limiter(ckan)
+        if rate_limiter is not None:
+            rate_limiter.wait()
         return fn(*args, **kwargs)
 
     return _proxy_fn
 
 
+def retry_ckan_call(desc, fn, **kwargs):
+    """
+    call `fn`, retrying with exponential backoff if CKAN returns an error
+    """
+    delay = CKAN_RETRY_BACKOFF
+    for attempt in range(1, CKAN_ATTEMPTS + 1):
+        try:
+            return fn(**kwargs)
+        except ckanapi.errors.CKANAPIError:
+            if attempt == CKAN_ATTEMPTS:
+                raise
+            logger.warning(
+                "%s failed, waiting %d sec, then trying again" % (desc, delay)
+            )
+            time.sleep(delay)
+            delay *= 2
+
+
 def print_accounts():
     print("API call accounting:")
     for object_type, method in sorted(method_stats, key=lambda x: method_stats[x]):
@@ -66,20 +142,51 @@ def print_accounts():
         )
 
 
+def _sort_if_list(v):
+    if isinstance(v, list):
+        return list(sorted(v, key=lambda v: repr(v)))
+    return v
+
+
+def canonical_value(v):
+    """
+    the form in which diff_objects compares values that are not equal: lists
+    are compared irrespective of order, and values are co-erced to string
+    """
+    return str(_sort_if_list(v))
+
+
+def object_fingerprint(obj, keys):
+    """
+    a hash of `obj` restricted to `keys`, in canonical form. two objects with the
+    same fingerprint for the keys of a patch would not be patched. the converse
+    does not hold: equal values with differing string forms (e.g. 1 and 1.0)
+    fingerprint differently, so a mismatch should fall back to diff_objects
+    """
+    canonical = [[k, canonical_value(obj.get(k))] for k in sorted(keys)]
+    return hashlib.sha256(
+        json.dumps(canonical, separators=(",", ":")).encode("utf8")
+    ).hexdigest()
+
+
 def diff_objects(obj1, obj2, desc, skip_differences=None):
     logger.debug("start diff_objects")
 
-    def sort_if_list(v):
-        if isinstance(v, list):
-            return list(sorted(v, key=lambda v: repr(v)))
-        return v
+    # fast path: most objects are unchanged, and equal values need neither sorting
+    # nor string co-ercion to compare
+    keys = [
+        k
+        for k in obj1.keys()
+        if not (skip_differences and k in skip_differences) and obj1[k] != obj2.get(k)
+    ]
+    if not keys:
+        logger.debug("end diff_objects")
+        return False
 
     differences = []
-    for k in list(obj1.keys()):
-        if skip_differences and k in skip_differences:
-            continue
-        v1 = sort_if_list(obj1.get(k))
-        v2 = sort_if_list(obj2.get(k))
+    for k in keys:
+        v1 = _sort_if_list(obj1.get(k))
+        v2 = _sort_if_list(obj2.get(k))
         # co-erce to string to cope with numeric types in the JSON data
         if v1 != v2 and str(v1) != str(v2):
             differences.append((k, v1, v2))
@@ -104,13 +211,9 @@ def patch_if_required(
     logger.debug("start patch if required")
     patch_needed = diff_objects(patch_object, ckan_object, object_type)
     if patch_needed:
-        try:
-            ckan_object = ckan_method(ckan, object_type, "patch")(**patch_object)
-        except ckanapi.errors.CKANAPIError:
-            # wait 2 sec, then try again (give up if it fails a second time)
-            logger.warning("ckan patch failed, waiting 2 sec, then trying again")
-            time.sleep(2)
-            ckan_object = ckan_method(ckan, object_type, "patch")(**patch_object)
+        ckan_object = retry_ckan_call(
+            "ckan patch", ckan_method(ckan, object_type, "patch"), **patch_object
+        )
 
     logger.debug("end patch_if_required")
     return patch_needed, ckan_object
@@ -141,9 +244,13 @@ def make_organization(ckan, organization_obj):
 
 
 class BaseArchiveInfo:
-    def __init__(self):
+    def __init__(self, maxsize=1):
+        # instances are shared between resource check worker threads: the
+        # pool must be able to hold a connection per worker, and cache
+        # updates are made under `_cache_lock`
         self._size_cache = {}
-        self.http = urllib3.PoolManager()
+        self._cache_lock = threading.Lock()
+        self.http = urllib3.PoolManager(maxsize=maxsize)
 
     def check_status_code(self, response):
         if response.status in (403, 401):
@@ -170,10 +277,19 @@ def same_netloc(u1, u2):
 
 
 class CKANArchiveInfo(BaseArchiveInfo):
-    def __init__(self, ckan):
+    """
+    sizes and ETags of resources uploaded to CKAN. if `s3_index` (see
+    sync.build_s3_index) is given, they are read from it where possible,
+    rather than with a request to CKAN for each resource
+    """
+
+    download_re = re.compile(r"/resource/([^/]+)/download/([^/]+)$")
+
+    def __init__(self, ckan, maxsize=1, s3_index=None):
         self.ckan = ckan
         self._etag_cache = {}
-        super().__init__()
+        self.s3_index = s3_index
+        super().__init__(maxsize=maxsize)
 
     def on_ckan(self, url):
         return same_netloc(self.ckan.address, url)
@@ -184,6 +300,13 @@ class CKANArchiveInfo(BaseArchiveInfo):
     def get_size_and_etag(self, url):
         if not url:
             return None
+        if self.s3_index is not None:
+            match = self.download_re.search(url)
+            if match:
+                resource_id, filename = match.groups()
+                obj = self.s3_index.get("{}/{}".format(resource_id, unquote(filename)))
+                if obj is not None:
+                    return obj
         logger.debug("start get_size_and_etag `%s' " % url)
         if url not in self._size_cache:
 
@@ -209,17 +332,21 @@ class CKANArchiveInfo(BaseArchiveInfo):
             if response.headers.get("Server") != 'AmazonS3':
                 logger.error("the URL {} does not reside on s3. Headers returned were {}".format(url, response.headers))
                 return None
-            self._size_cache[url] = self._size_cache[url] = self.size_from_response(response)
-            self._etag_cache[url] = self._etag_cache[url] = response.headers.get("etag")
+            size = self.size_from_response(response)
+            with self._cache_lock:
+                self._size_cache[url] = size
+                self._etag_cache[url] = response.headers.get("etag")
 
-        return self._size_cache[url], self._etag_cache[url]
+        with self._cache_lock:
+            return self._size_cache[url], self._etag_cache[url]
 
 
 class ApacheArchiveInfo(BaseArchiveInfo):
-    def __init__(self, auth):
+    def __init__(self, auth, maxsize=1):
         self.auth = auth
-        super().__init__()   # need this first to set up the http
+        super().__init__(maxsize=maxsize)   # need this first to set up the http
         self.headers = build_apache_headers_for_urllib3(self.auth)
+        self._size_fetched = {}
 
 
     def resolve_url(self, url):
@@ -245,17 +372,100 @@ class ApacheArchiveInfo(BaseArchiveInfo):
             else:
                 return None
 
+    def head_size(self, url):
+        """
+        the size of the file at `url`, from a single HEAD request: any redirects
+        are followed on the pooled, keep-alive connections
+        """
+        response = self.http.request(
+            "HEAD",
+            url,
+            headers=self.headers,
+            retries=urllib3.Retry(3, redirect=LEGACY_REDIRECTS),
+        )
+        return self.size_from_response(response)
+
+    def _cache_size(self, url, size):
+        with self._cache_lock:
+            self._size_cache[url] = size
+            self._size_fetched[url] = time.time()
+
     def get_size(self, url):
         if not url:
             return None
-        if url not in self._size_cache:
-            resolved = self.resolve_url(url)
-            if resolved is None:
+        with self._cache_lock:
+            if url in self._size_cache:
+                return self._size_cache[url]
+        size = self.head_size(url)
+        if size is not None:
+            self._cache_size(url, size)
+        return size
+
+    def prefetch_sizes(self, urls, num_threads, listed_sizes=None):
+        """
+        determine the sizes of many legacy URLs up front, so that checks are
+        answered from the cache. sizes are taken from `listed_sizes` (url ->
+        size, from the archive's directory listings) where given, and
+        otherwise found with concurrent HEAD requests
+        """
+        listed_sizes = dict(
+            (unquote(url), size) for url, size in (listed_sizes or {}).items()
+        )
+        todo = []
+        cached = listed = 0
+        with self._cache_lock:
+            for url in dict.fromkeys(urls):
+                if not url or url.startswith("file:///"):
+                    continue
+                if url in self._size_cache:
+                    cached += 1
+                elif unquote(url) in listed_sizes:
+                    self._size_cache[url] = listed_sizes[unquote(url)]
+                    listed += 1
+                else:
+                    todo.append(url)
+
+        def fetch(url):
+            try:
+                return self.head_size(url)
+            except urllib3.exceptions.HTTPError as e:
+                logger.error("unable to get legacy size of `%s': %s" % (url, e))
                 return None
-            self._size_cache[url] = self._size_cache[
-                resolved
-            ] = self.size_from_response(self.http.request("HEAD", resolved, headers=self.headers))
-        return self._size_cache[url]
+
+        with ThreadPoolExecutor(max_workers=num_threads) as executor:
+            for url, size in zip(todo, executor.map(fetch, todo)):
+                if size is not None:
+                    self._cache_size(url, size)
+        logger.info(
+            "legacy sizes: %d already cached, %d from directory listings, %d by HEAD"
+            % (cached, listed, len(todo))
+        )
+
+    def load_sizes(self, path):
+        "load sizes found by HEAD requests within LEGACY_SIZE_TTL from `path`"
+        try:
+            with open(path) as fd:
+                stored = json.load(fd)
+        except FileNotFoundError:
+            return
+        now = time.time()
+        with self._cache_lock:
+            for url, (size, fetched) in stored.items():
+                if now - fetched < LEGACY_SIZE_TTL:
+                    self._size_cache[url] = size
+                    self._size_fetched[url] = fetched
+
+    def save_sizes(self, path):
+        "save the sizes found by HEAD requests to `path`"
+        with self._cache_lock:
+            stored = dict(
+                (url, [self._size_cache[url], fetched])
+                for url, fetched in self._size_fetched.items()
+            )
+        tmpf = path + ".new"
+        with open(tmpf, "w") as fd:
+            json.dump(stored, fd)
+        os.replace(tmpf, path)
 
 
 def get_legacy_size(apache_archive_info, legacy_url):
@@ -446,247 +656,137 @@ def download_legacy_file(legacy_url, auth):
     return tempdir, path
 
 
-def reupload_resource(ckan, ckan_obj, legacy_url, parent_destination, auth=None):
-    "reupload data from legacy_url to ckan_obj"
+def legacy_source(legacy_url, auth):
+    "the source to transfer the file at `legacy_url` from, or None if it is missing"
+    if legacy_url.startswith("file:///"):
+        file_path = url2pathname(urlparse(legacy_url).path)
+        logger.info("Local file URL resolved to '%s'" % (file_path,))
+        if not os.path.isfile(file_path) or not os.access(file_path, os.R_OK):
+            logger.warning("File '%s' doesn't exist or isn't readable" % (file_path,))
+            return None
+        return FileSource(file_path)
+    resolved_url = resolve_legacy_file(legacy_url, auth)
+    if resolved_url is None:
+        return None
+    if auth:
+        headers = build_apache_headers_for_urllib3(auth)
+    else:
+        headers = {"User-Agent": "BPA-INGEST"}
+    return HTTPSource(resolved_url, headers=headers)
+
+
+def reupload_resource(
+    ckan, ckan_obj, legacy_url, parent_destination, auth=None, upload_state=None
+):
+    """
+    reupload data from legacy_url to ckan_obj. the data is streamed from the
+    archive to S3, and hashed on the way through: the resource is patched with
+    its hashes, so it need not be processed by genhash.
+
+    if `upload_state` (an UploadStateStore) is given, an upload which fails is
+    kept, to be resumed by a later run
+    """
     logger.debug("start reupload_resource `%s' " % legacy_url)
 
     if legacy_url is None:
         logger.error("download from legacy archive URL failed - legacy_url not set")
         return
 
-    stream = False
-    transfer_mode = os.getenv("BPAINGEST_STREAM")
-    if transfer_mode is not None and transfer_mode == "yes":
-        logger.info(f"Streaming upload from legacy URL to S3: {legacy_url}")
-        stream = True
-    else:
-        logger.info(f"Downloading from legacy URL: {legacy_url}")
-
-    if stream:
-        path = resolve_legacy_file(legacy_url, auth)
-    else:
-        tempdir, path = download_legacy_file(legacy_url, auth)
-
-    if path is None:
+    source = legacy_source(legacy_url, auth)
+    if source is None:
         logger.error("download from legacy archive failed")
         return
 
-    try:
-        status = -1
-        logger.info("re-uploading from: %s" % (path))
-        # Always store in S3 with a clean filename
-        filename = bpa_munge_filename(path.split("/")[-1])
-        s3_destination = "s3://{}/resources/{}/{}".format(
-            parent_destination, ckan_obj["id"], filename
-        )
-
-        logger.info(f"S3 destination is: {s3_destination}")
-
-        if stream:
-            logger.info("Streaming - get mirror file info...")
-            headers = build_apache_headers_for_urllib3(auth)
-            logger.debug("Headers for stream retrieval are {}".format(headers))
-            logger.debug("using  url {}".format(legacy_url))
-            http = urllib3.PoolManager()
-
-            with http.request("GET", legacy_url, preload_content=False, headers=headers) as response:
-                logger.debug("Response should be set (streaming)")
-
-                file_size = response.headers.get("Content-length", None)
-                logger.info("File size of legacy file is : {}".format(file_size))
-                if file_size:
-                    # calculate a 1000 part split, make the chunksize 5MB greater
-                    calculated_chunksize = int(int(file_size)/1000) + (5*MB)  # default to 1000 chunks
-                    logger.info("Initial chunksize value = {}".format(calculated_chunksize))
-                    if int(file_size) > 100*GB:
-
-                        calculated_chunksize = int(int(file_size) / 5000) + (5 * MB)  # go with more chunks?
-                        logger.info("File size > 100Gb, using 5000 as the divisor, chunk size is {}".format(calculated_chunksize))
-
-                    multipart_chunksize = max(20*MB, calculated_chunksize)
-                    logger.info("Using chunksize of: {}".format(multipart_chunksize))
-                else:
-                    logger.warn("File size not able to be determined from legacy URL")
-                    # YOLO
-                    multipart_chunksize=1024*20
-
-                logger.info("Streaming - set S3 session...")
-                b3_config = Config(
-                    retries={
-                        'max_attempts': 10,
-                        'mode': 'standard'
-                    },
-                    max_pool_connections=96,
-                    # duration_seconds=7200  # 2 hours
+    # Always store in S3 with a clean filename
+    filename = bpa_munge_filename(unquote(legacy_url.rsplit("/", 1)[-1]))
+    bucket = parent_destination.split("/")[0]
+    key = "{}/resources/{}/{}".format(
+        parent_destination.split("/", 1)[1], ckan_obj["id"], filename
+    )
+    s3_destination = "s3://{}/{}".format(bucket, key)
+    logger.info("re-uploading from: %s" % (legacy_url))
+    logger.info(f"S3 destination is: {s3_destination}")
+
+    if upload_state is not None:
+        upload = upload_state.upload(ckan_obj["id"], source, bucket, key)
+    else:
+        upload = StreamingUpload(source, bucket, key)
+    with tqdm.tqdm(unit="B", unit_scale=True, unit_divisor=1024, ascii=True) as bar:
+        for attempt in range(1, UPLOAD_RETRY + 1):
+            # parts uploaded by a failed attempt are not fetched or uploaded again
+            bar.reset(total=upload.size)
+            try:
+                hashes = upload.run(
+                    progress=bar.update, md5=ckan_obj.get("md5") or None
                 )
-                stream_session = boto3.session.Session()
-                s3_client = stream_session.client("s3", config=b3_config)
-                s3_resource = stream_session.resource("s3")
-                # set logging for boto3 and botocore: (commented out so as not to add too much to the ingest logs
-                #boto3.set_stream_logger('boto3', logging.DEBUG)
-                #boto3.set_stream_logger('botocore', logging.DEBUG)
-                #boto3.set_stream_logger('')
-
-                tf_config = TransferConfig(multipart_threshold=20*MB,  # this is irrelevant when chunksize is larger
-                                        multipart_chunksize=multipart_chunksize,
-                                        use_threads=True,
-                                        max_concurrency=10)
-
-            # Configure the progress bar
-                bar = {"unit": "B", "unit_scale": True, "unit_divisor": 1024, "ascii": True}
-                if file_size:
-                    bar["total"] = int(file_size)
-                else:
-                    logger.warn("File size not able to be determined from legacy URL")
-
-                content_length = 0
-                # Chunk size of 1024 bytes
-
-                key = s3_destination.split("/", 3)[3]
-
-                bucket_name = parent_destination.split("/")[0]
-
-                # validate bucket
-                try:
-                    logger.debug("Bucket in stream is {}".format(bucket_name))
-                    bucket = s3_resource.Bucket(bucket_name)
-                    logger.debug("Bucket in stream is {}".format(bucket))
-                except ClientError as e:
-                    logger.error("Error setting Bucket in stream {}".format(e))
-                    bucket = None
-
-                # handle pre-existing file case
-                try:
-                    # In case filename already exists, get current etag to check if the
-                    # contents change after upload
-                    head = s3_client.head_object(Bucket=bucket_name, Key=key)
-                    logger.debug("Got the Head in the pre-check")
-                except ClientError as e:
-                    logger.debug("Failed getting the head, set etag blank - file not in S3, file will be created {}".format(e))
-                    etag = ""
-                else:
-                    etag = head["ETag"].strip('"')
-                    logger.debug("Did get the head, etag is {}".format(etag))
-
-                # create the Object to represent the file
+                break
+            except MD5Mismatch as e:
+                # the upload is abandoned, and there is no point trying again
+                logger.critical(
+                    "MD5 hash mismatch of uploaded data: {}: {}".format(e, legacy_url)
+                )
+                if upload_state is not None:
+                    upload_state.discard(ckan_obj["id"])
+                raise Exception("Uploaded data does not match MD5 in metadata")
+            except Exception as e:
+                logger.error(
+                    "upload to {} failed (attempt {} of {}): {}".format(
+                        s3_destination, attempt, UPLOAD_RETRY, e
+                    )
+                )
+        else:
+            if upload_state is not None:
+                upload_state.save(ckan_obj["id"], upload, force=True)
+                logger.info(
+                    "upload state kept: the upload to {} will be resumed".format(
+                        s3_destination
+                    )
+                )
+            else:
                 try:
-                    s3_obj = bucket.Object(key)
+                    upload.abort()
                 except ClientError as e:
-                    logger.error("ClientError when setting key: {}".format(e))
-                    s3_obj = None
-                except AttributeError as e:
-                    logger.error("Attribute Error when setting key:: {}".format(e))
-                    s3_obj = None
-                try:
-                    with tqdm.tqdm(**bar) as progress:
-                        try:
-                         # upload with progress bar
-                            try:
-                                logger.debug("about to try the s3 upload")
-                                s3_client.upload_fileobj(response, bucket_name, key,
-                                                         Callback=progress.update, Config=tf_config)
-                                logger.debug("Done with the upload_fileobj")
-                            except ClientError as e:
-                                logger.error("ClientError when upload file object: {}".format(e))
-                                # pass
-                            except AttributeError as e:
-                                logger.error("AttributeError when upload file object: {}".format(e))
-                                # pass
-                            except Exception as e:
-                                logger.error("Generic Exception when upload file object: {}".format(e))
-                            else:
-                                logger.debug("waiting for the object to exist")
-                                # wait for S3 Object to exist
-                                try:
-                                    logger.debug("TRY...waiting for the object to exist")
-                                    s3_obj.wait_until_exists(IfNoneMatch=etag)
-                                except WaiterError as e:
-                                    logger.error("WaiterError while streaming to S3 {}".format(e))
-                                else:
-                                    logger.debug("ELSE..waiting for the object to exist")
-                                finally:
-                                    logger.debug("In the finally, waited or not, go and get the new head")
-                                    head = s3_client.head_object(Bucket=bucket_name, Key=key)
-                                    logger.debug("Head is: {}".format(head))
-                                    content_length = head["ContentLength"]
-
-                                    if content_length > 0 and content_length == int(file_size):
-                                        logger.debug("Content length of {} is good, setting status to 0"
-                                                     .format(content_length))
-                                        status = 0
-                                    else:
-                                        logger.error("uploaded s3 file size {} not legacy file size {} "
-                                                     .format(content_length, file_size))
-                        except Exception as e:
-                            logger.error("Exception in with response/part: {}".format(e))
-
-                except Exception as e:
-                    logger.error("Exception in status bar: {}".format(e))
-
-                response.release_conn()  # regardless of the outcome, we should free up the connection.
-
-                logger.debug("Got to the end of the Stream logic, status is {}".format(status))
-
-        else:
-            s3cmd_args = ["aws", "s3", "cp", path, s3_destination]
-            status = subprocess.call(s3cmd_args)
-            content_length = os.path.getsize(path)
-            logger.debug("status after non-stream: {}".format(status))
-
-        logger.debug("status before check: {}".format(status))
-
-        if status == 0:
-            # patch the object in CKAN to have full URL
-            logger.debug("build the resource url using {} {} {} {}"
-                         .format(ckan.address, filename, ckan_obj["package_id"], ckan_obj["id"]))
-            logger.debug(parent_destination)
-            resource_url = "{}/dataset/{}/resource/{}/download/{}".format(
-                ckan.address, ckan_obj["package_id"], ckan_obj["id"], filename
-            )
-            logger.debug("resource_url is:{}".format(resource_url))
-            logger.debug("updating the ckan resource with id {} with the size {}  and new URL {}"
-                         .format(ckan_obj["id"], content_length, resource_url))
-            ckan.action.resource_patch(
-                id=ckan_obj["id"],
-                url=resource_url,
-                url_type="upload",
-                size=content_length,
-            )
-            logger.debug("Update Complete")
-        else:
-            logger.error("upload failed: status {}".format(status))
+                    logger.error("unable to abort upload to {}: {}".format(key, e))
             logger.error("Skipping applying audit tag to {}".format(s3_destination))
             raise Exception("Upload failed to S3")
 
-        # if resource_patch throws an exception, we shouldn't get to
-        # tagging the s3 resource
-
-        # tag resource in S3:
-        # - permit lifecycle rules
-        # - storage audit
+    if upload_state is not None:
+        upload_state.discard(ckan_obj["id"])
 
-        tags = {
-            "source": "bpaingest",
-            "audit": AUDIT_VERIFIED,
-        }
-
-        logger.info("tagging resource : %s (%s)" % (s3_destination, tags))
-        bucket = parent_destination.split("/")[0]
-        key = "{}/resources/{}/{}".format(
-            parent_destination.split("/", 1)[1], ckan_obj["id"], filename
+    # patch the object in CKAN to have full URL
+    resource_url = "{}/dataset/{}/resource/{}/download/{}".format(
+        ckan.address, ckan_obj["package_id"], ckan_obj["id"], filename
+    )
+    logger.debug(
+        "updating the ckan resource with id {} with the size {} and new URL {}".format(
+            ckan_obj["id"], upload.size, resource_url
         )
+    )
+    ckan.action.resource_patch(
+        id=ckan_obj["id"],
+        url=resource_url,
+        url_type="upload",
+        size=upload.size,
+        **hashes,
+    )
+
+    # if resource_patch throws an exception, we shouldn't get to
+    # tagging the s3 resource
+
+    # tag resource in S3:
+    # - permit lifecycle rules
+    # - storage audit
+
+    tags = {
+        "source": "bpaingest",
+        "audit": AUDIT_VERIFIED,
+    }
 
-        status = update_tags(bucket, key, tags)
-
-        # FIXME Fix handling of status response
-        logger.debug(status)
-        # if status != 0:
-        #    logger.error("tagging failed: status {}".format(status))
+    logger.info("tagging resource : %s (%s)" % (s3_destination, tags))
+    status = update_tags(bucket, key, tags)
 
-    finally:
-        if not stream:
-            os.unlink(path)
-            os.rmdir(tempdir)
+    # FIXME Fix handling of status response
+    logger.debug(status)
 
 
 def create_resource(ckan, ckan_obj):
@@ -1,32 +1,168 @@
+import json
+import threading
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+
 from .util import make_logger
 from .ops import ckan_method
 
-
 logger = make_logger(__name__)
 
+SEARCH_PAGE_SIZE = 1000
+SEARCH_THREADS = 4
+
+
+class PackageSummary(dict):
+    """
+    a package from a PackageIndex, without its resources. the resources are
+    decoded from the index each time `summary["resources"]` is looked up, so
+    a package which is only compared never decodes them
+    """
+
+    def __init__(self, index, package):
+        super().__init__(package)
+        self._index = index
+
+    def __missing__(self, key):
+        if key != "resources":
+            raise KeyError(key)
+        return self._index.resources(self["id"])
+
+    def copy(self):
+        return PackageSummary(self._index, self)
+
+
+class PackageIndex(Mapping):
+    """
+    package id -> package, for packages retrieved from CKAN. each package's
+    resources are held JSON encoded, and only decoded when the package (or one
+    of its resources) is looked up. each lookup returns a new object.
+    """
+
+    def __init__(self):
+        self._packages = {}
+        self._resources = {}
+        self._resource_package = {}
+        self._lock = threading.Lock()
+
+    def add(self, package):
+        package = package.copy()
+        resources = package.pop("resources", [])
+        encoded = json.dumps(resources, separators=(",", ":"))
+        with self._lock:
+            self._packages[package["id"]] = package
+            self._resources[package["id"]] = encoded
+            for resource in resources:
+                self._resource_package[resource["id"]] = package["id"]
+
+    def summary(self, package_id):
+        "the package, its resources decoded only if they are looked up"
+        return PackageSummary(self, self._packages[package_id])
+
+    def resources(self, package_id):
+        return json.loads(self._resources[package_id])
+
+    def __getitem__(self, package_id):
+        package = self._packages[package_id].copy()
+        package["resources"] = self.resources(package_id)
+        return package
+
+    def __contains__(self, package_id):
+        return package_id in self._packages
+
+    def __iter__(self):
+        return iter(self._packages)
+
+    def __len__(self):
+        return len(self._packages)
+
+    def resource_view(self):
+        return ResourceView(self)
+
+
+class ResourceView(Mapping):
+    """
+    resource id -> resource, over a PackageIndex
+    """
+
+    def __init__(self, index):
+        self._index = index
+        # resources are usually looked up package by package, so keep the
+        # last package's decoded resources
+        self._last = (None, {})
+
+    def __getitem__(self, resource_id):
+        package_id = self._index._resource_package[resource_id]
+        last_package_id, resources = self._last
+        if package_id != last_package_id:
+            resources = {t["id"]: t for t in self._index.resources(package_id)}
+            self._last = (package_id, resources)
+        return resources[resource_id]
+
+    def __iter__(self):
+        return iter(self._index._resource_package)
+
+    def __len__(self):
+        return len(self._index._resource_package)
+
+
+def search_packages(ckan, typ, add_fn, num_threads=SEARCH_THREADS, **search_kwargs):
+    """
+    call `add_fn` with each package of type `typ`, retrieving pages of results
+    concurrently. `search_kwargs` are passed through to package_search, e.g. to
+    filter (fq) or restrict fields (fl). returns the number of results CKAN
+    reported
+    """
+    search = ckan_method(ckan, "package", "search")
+
+    def fetch_page(start):
+        results = search(
+            q="type:{}".format(typ),
+            include_private=True,
+            sort="id asc",
+            rows=SEARCH_PAGE_SIZE,
+            start=start,
+            **search_kwargs,
+        )
+        for package in results["results"]:
+            add_fn(package)
+        return results["count"]
+
+    count = fetch_page(0)
+    starts = range(SEARCH_PAGE_SIZE, count, SEARCH_PAGE_SIZE)
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        for _ in executor.map(fetch_page, starts):
+            pass
+    return count
+
 
-def build_package_cache(ckan, ckan_data_type, sync_packages):
+def build_package_cache(ckan, ckan_data_type, sync_packages, mirror=None):
     """
     build a cache of all the packages in `org`, to speed up comparison.
     `sync_packages` is the packages we are aiming to set as our target
-    state
+    state. if a CKANMirror is given, it is refreshed and the cache built
+    from it
     """
     package_types = set(t["type"] for t in sync_packages)
     package_types.add(ckan_data_type)
-    packages = []
-    for typ in package_types:
-        logger.info("Retrieving all extant packages of type: {}".format(typ))
-        results = ckan_method(ckan, "package", "search")(
-            q="type:{}".format(typ), include_private=True, rows=50000
+    index = PackageIndex()
+    expected = 0
+    for typ in sorted(package_types):
+        if mirror is not None:
+            mirror.refresh(typ)
+            for package in mirror.packages(typ):
+                index.add(package)
+        else:
+            logger.info("Retrieving all extant packages of type: {}".format(typ))
+            expected += search_packages(ckan, typ, index.add)
+    if mirror is None and len(index) != expected:
+        # packages were created or deleted while we paged through the results
+        logger.warning(
+            "{} packages cached, but CKAN reported {}".format(len(index), expected)
         )
-        packages += results["results"]
-    logger.info("{} packages cached.".format(len(packages)))
-    return {t["id"]: t for t in packages}
+    logger.info("{} packages cached.".format(len(index)))
+    return index
 
 
-def build_resource_cache(*args):
-    cache = {}
-    for pkg in build_package_cache(*args).values():
-        for resource in pkg["resources"]:
-            cache[resource["id"]] = resource
-    return cache
+def build_resource_cache(*args, **kwargs):
+    return build_package_cache(*args, **kwargs).resource_view()
@@ -1,399 +1,774 @@
-import logging
+"""
+the registry of ingest classes. the attributes of each class which make up its
+slug are recorded here, so that slugs can be listed (e.g. for the CLI) without
+importing every project; a project's ingest module is imported only when one
+of its classes is used. test_projects.py checks this table against the classes.
+"""
 
-from .amdb.ingest import (
-    AustralianMicrobiomeMetagenomicsAnalysedMetadata,
-    AustralianMicrobiomeMetagenomicsNovaseqMetadata,
-    AustralianMicrobiomeMetagenomicsNovaseqControlMetadata,
-    AustralianMicrobiomeAmpliconsMetadata,
-    AustralianMicrobiomeAmpliconsControlMetadata,
-    BASEAmpliconsMetadata,
-    BASEMetagenomicsMetadata,
-    BASEAmpliconsControlMetadata,
-    BASESiteImagesMetadata,
-    MarineMicrobesAmpliconsMetadata,
-    MarineMicrobesAmpliconsControlMetadata,
-    MarineMicrobesMetagenomicsMetadata,
-    MarineMicrobesMetatranscriptomeMetadata,
-    EDNAAmpliconsMetadata,
-    EDNAAmpliconsControlMetadata,
-)
-from .animal_disease.ingest import (
-    AnimalDiseaseIlluminaShortreadMetadata,
-    AnimalDiseaseIlluminaHiCMetadata,
-    AnimalDiseaseONTPromethionMetadata,
-    AnimalDiseasePacbioHifiMetadata,
-    AnimalDiseaseIlluminaShortreadMetadata,
-)
+import importlib
+from collections import namedtuple
+from collections.abc import Mapping
 
-from .ausarg.ingest import (
-    AusargIlluminaFastqMetadata,
-    AusargPacbioHifiMetadata,
-    AusargONTPromethionMetadata,
-    AusargExonCaptureMetadata,
-    AusargHiCMetadata,
-    AusargGenomicsDArTMetadata,
-    AusargGenomicsDDRADMetadata,
+# `class_path` is relative to this package
+ProjectClass = namedtuple(
+    "ProjectClass",
+    ("class_path", "organization", "omics", "technology", "analysed", "pool"),
+    defaults=(None, None, False, False),
 )
 
-from .gbr.ingest import GbrAmpliconsMetadata, GbrPacbioMetadata
+PROJECTS = {
+    "amd": [
+        ProjectClass(
+            "amdb.ingest.AustralianMicrobiomeMetagenomicsAnalysedMetadata",
+            "am-csiro-team",
+            omics="metagenomics",
+            technology="analysed",
+        ),
+        ProjectClass(
+            "amdb.ingest.AustralianMicrobiomeMetagenomicsNovaseqMetadata",
+            "australian-microbiome",
+            omics="metagenomics",
+            technology="novaseq",
+        ),
+        ProjectClass(
+            "amdb.ingest.AustralianMicrobiomeMetagenomicsNovaseqControlMetadata",
+            "australian-microbiome",
+            omics="metagenomics",
+            technology="novaseq-control",
+        ),
+        ProjectClass(
+            "amdb.ingest.AustralianMicrobiomeAmpliconsMetadata",
+            "australian-microbiome",
+            omics="genomics",
+            technology="amplicons",
+        ),
+        ProjectClass(
+            "amdb.ingest.AustralianMicrobiomeAmpliconsControlMetadata",
+            "australian-microbiome",
+            omics="genomics",
+            technology="amplicons-control",
+        ),
+    ],
+    "ausarg": [
+        ProjectClass(
+            "ausarg.ingest.AusargIlluminaFastqMetadata",
+            "ausarg",
+            technology="illumina-fastq",
+        ),
+        ProjectClass(
+            "ausarg.ingest.AusargPacbioHifiMetadata", "ausarg", technology="pacbio-hifi"
+        ),
+        ProjectClass(
+            "ausarg.ingest.AusargONTPromethionMetadata",
+            "ausarg",
+            technology="ont-promethion",
+        ),
+        ProjectClass(
+            "ausarg.ingest.AusargExonCaptureMetadata",
+            "ausarg",
+            technology="exoncapture",
+        ),
+        ProjectClass("ausarg.ingest.AusargHiCMetadata", "ausarg", technology="hi-c"),
+        ProjectClass(
+            "ausarg.ingest.AusargGenomicsDArTMetadata",
+            "ausarg",
+            omics="genomics",
+            technology="dart",
+        ),
+        ProjectClass(
+            "ausarg.ingest.AusargGenomicsDDRADMetadata",
+            "ausarg",
+            omics="genomics",
+            technology="ddrad",
+        ),
+    ],
+    "base": [
+        ProjectClass(
+            "amdb.ingest.BASEAmpliconsMetadata",
+            "australian-microbiome",
+            omics="genomics",
+            technology="amplicons",
+        ),
+        ProjectClass(
+            "amdb.ingest.BASEAmpliconsControlMetadata",
+            "australian-microbiome",
+            omics="genomics",
+            technology="amplicons-control",
+        ),
+        ProjectClass(
+            "amdb.ingest.BASEMetagenomicsMetadata",
+            "australian-microbiome",
+            omics="metagenomics",
+        ),
+        ProjectClass(
+            "amdb.ingest.BASESiteImagesMetadata",
+            "australian-microbiome",
+            technology="site-images",
+        ),
+    ],
+    "gap": [
+        ProjectClass(
+            "gap.ingest.GAPIlluminaShortreadMetadata",
+            "bpa-plants",
+            technology="illumina-shortread",
+        ),
+        ProjectClass(
+            "gap.ingest.GAPONTMinionMetadata", "bpa-plants", technology="ont-minion"
+        ),
+        ProjectClass(
+            "gap.ingest.GAPONTPromethionMetadata",
+            "bpa-plants",
+            technology="ont-promethion",
+        ),
+        ProjectClass(
+            "gap.ingest.GAPGenomics10XMetadata", "bpa-plants", technology="genomics-10x"
+        ),
+        ProjectClass("gap.ingest.GAPHiCMetadata", "bpa-plants", technology="hi-c"),
+        ProjectClass(
+            "gap.ingest.GAPGenomicsDDRADMetadata",
+            "bpa-plants",
+            omics="genomics",
+            technology="ddrad",
+        ),
+        ProjectClass(
+            "gap.ingest.GAPPacbioHifiMetadata", "bpa-plants", technology="pacbio-hifi"
+        ),
+    ],
+    "gbr": [
+        ProjectClass(
+            "gbr.ingest.GbrAmpliconsMetadata",
+            "bpa-great-barrier-reef",
+            omics="genomics",
+            technology="amplicons",
+        ),
+        ProjectClass(
+            "gbr.ingest.GbrPacbioMetadata",
+            "bpa-great-barrier-reef",
+            omics="genomics",
+            technology="pacbio",
+        ),
+    ],
+    "marine-microbes": [
+        ProjectClass(
+            "amdb.ingest.MarineMicrobesAmpliconsMetadata",
+            "australian-microbiome",
+            omics="genomics",
+            technology="amplicons",
+        ),
+        ProjectClass(
+            "amdb.ingest.MarineMicrobesAmpliconsControlMetadata",
+            "australian-microbiome",
+            omics="genomics",
+            technology="amplicons-control",
+        ),
+        ProjectClass(
+            "amdb.ingest.MarineMicrobesMetagenomicsMetadata",
+            "australian-microbiome",
+            omics="metagenomics",
+        ),
+        ProjectClass(
+            "amdb.ingest.MarineMicrobesMetatranscriptomeMetadata",
+            "australian-microbiome",
+            omics="metatranscriptomics",
+        ),
+    ],
+    "omg": [
+        ProjectClass("omg.ingest.OMG10XRawMetadata", "bpa-omg", technology="10xraw"),
+        ProjectClass(
+            "omg.ingest.OMG10XRawIlluminaMetadata", "bpa-omg", technology="10x-raw-agrf"
+        ),
+        ProjectClass(
+            "omg.ingest.OMG10XProcessedIlluminaMetadata",
+            "bpa-omg",
+            technology="10xprocessed",
+        ),
+        ProjectClass(
+            "omg.ingest.OMGExonCaptureMetadata", "bpa-omg", technology="exoncapture"
+        ),
+        ProjectClass(
+            "omg.ingest.OMGWholeGenomeMetadata",
+            "bpa-omg",
+            technology="novaseq-whole-genome",
+        ),
+        ProjectClass(
+            "omg.ingest.OMGGenomicsNovaseqMetadata", "bpa-omg", technology="novaseq"
+        ),
+        ProjectClass(
+            "omg.ingest.OMGGenomicsHiSeqMetadata",
+            "bpa-omg",
+            omics="genomics",
+            technology="hiseq",
+        ),
+        ProjectClass(
+            "omg.ingest.OMGGenomicsDDRADMetadata",
+            "bpa-omg",
+            omics="genomics",
+            technology="ddrad",
+        ),
+        ProjectClass(
+            "omg.ingest.OMGGenomicsPacbioMetadata", "bpa-omg", technology="pacbio"
+        ),
+        ProjectClass(
+            "omg.ingest.OMGONTPromethionMetadata",
+            "bpa-omg",
+            technology="ont-promethion",
+        ),
+        ProjectClass(
+            "omg.ingest.OMGTranscriptomicsNextseq",
+            "bpa-omg",
+            omics="transcriptomics",
+            technology="nextseq",
+        ),
+        ProjectClass(
+            "omg.ingest.OMGGenomicsPacBioGenomeAssemblyMetadata",
+            "bpa-omg",
+            technology="pacbio-genome-assembly",
+        ),
+        ProjectClass(
+            "omg.ingest.OMGAnalysedDataMetadata", "bpa-omg", technology="analysed-data"
+        ),
+        ProjectClass(
+            "omg.ingest.OMGGenomicsDArTMetadata",
+            "bpa-omg",
+            omics="genomics",
+            technology="dart",
+        ),
+    ],
+    "tsi": [
+        ProjectClass(
+            "tsi.ingest.TSIPacbioHifiMetadata",
+            "threatened-species",
+            technology="pacbio-hifi",
+        ),
+        ProjectClass(
+            "tsi.ingest.TSIGenomicsDDRADMetadata",
+            "threatened-species",
+            omics="genomics",
+            technology="ddrad",
+        ),
+        ProjectClass(
+            "tsi.ingest.TSIIlluminaShortreadMetadata",
+            "threatened-species",
+            technology="illumina-shortread",
+        ),
+        ProjectClass(
+            "tsi.ingest.TSIIlluminaFastqMetadata",
+            "threatened-species",
+            technology="illumina-fastq",
+        ),
+        ProjectClass(
+            "tsi.ingest.TSIGenomeAssemblyMetadata",
+            "threatened-species",
+            technology="genome-assembly",
+        ),
+        ProjectClass(
+            "tsi.ingest.TSIHiCMetadata", "threatened-species", technology="hi-c"
+        ),
+        ProjectClass(
+            "tsi.ingest.TSIGenomicsDArTMetadata",
+            "threatened-species",
+            omics="genomics",
+            technology="dart",
+        ),
+        ProjectClass(
+            "tsi.ingest.TSIONTPromethionMetadata",
+            "threatened-species",
+            technology="ont-promethion",
+        ),
+    ],
+    "sepsis": [
+        ProjectClass(
+            "sepsis.ingest.SepsisGenomicsMiseqMetadata",
+            "bpa-sepsis",
+            omics="genomics",
+            technology="miseq",
+        ),
+        ProjectClass(
+            "sepsis.ingest.SepsisGenomicsPacbioMetadata",
+            "bpa-sepsis",
+            omics="genomics",
+            technology="pacbio",
+        ),
+        ProjectClass(
+            "sepsis.ingest.SepsisGenomicsAnalysedMetadata",
+            "bpa-sepsis",
+            omics="genomics",
+            technology="analysed",
+        ),
+        ProjectClass(
+            "sepsis.ingest.SepsisTranscriptomicsAnalysedMetadata",
+            "bpa-sepsis",
+            omics="transcriptomics",
+            technology="analysed",
+        ),
+        ProjectClass(
+            "sepsis.ingest.SepsisTranscriptomicsHiseqMetadata",
+            "bpa-sepsis",
+            omics="transcriptomics",
+            technology="hiseq",
+        ),
+        ProjectClass(
+            "sepsis.ingest.SepsisMetabolomicsLCMSMetadata",
+            "bpa-sepsis",
+            omics="metabolomics",
+            technology="lcms",
+        ),
+        ProjectClass(
+            "sepsis.ingest.SepsisMetabolomicsGCMSMetadata",
+            "bpa-sepsis",
+            omics="metabolomics",
+            technology="gcms",
+        ),
+        ProjectClass(
+            "sepsis.ingest.SepsisMetabolomicsAnalysedMetadata",
+            "bpa-sepsis",
+            omics="metabolomics",
+            technology="analysed",
+        ),
+        ProjectClass(
+            "sepsis.ingest.SepsisProteomicsMS1QuantificationMetadata",
+            "bpa-sepsis",
+            omics="proteomics",
+            technology="ms1quantification",
+        ),
+        ProjectClass(
+            "sepsis.ingest.SepsisProteomicsSwathMSMetadata",
+            "bpa-sepsis",
+            omics="proteomics",
+            technology="swathms",
+        ),
+        ProjectClass(
+            "sepsis.ingest.SepsisProteomicsSwathMSCombinedSampleMetadata",
+            "bpa-sepsis",
+            omics="proteomics",
+            technology="swathms-combined-sample",
+        ),
+        ProjectClass(
+            "sepsis.ingest.SepsisProteomicsSwathMSPoolMetadata",
+            "bpa-sepsis",
+            omics="proteomics",
+            technology="swathms",
+            pool=True,
+        ),
+        ProjectClass(
+            "sepsis.ingest.SepsisProteomics2DLibraryMetadata",
+            "bpa-sepsis",
+            omics="proteomics",
+            technology="2dlibrary",
+        ),
+        ProjectClass(
+            "sepsis.ingest.SepsisProteomicsAnalysedMetadata",
+            "bpa-sepsis",
+            omics="proteomics",
+            technology="analysed",
+        ),
+        ProjectClass(
+            "sepsis.ingest.SepsisProteomicsProteinDatabaseMetadata",
+            "bpa-sepsis",
+            omics="proteomics",
+            technology="proteindatabase",
+            analysed=True,
+        ),
+    ],
+    "stemcells": [
+        ProjectClass(
+            "stemcells.ingest.StemcellsTranscriptomeMetadata",
+            "bpa-stemcells",
+            omics="transcriptomics",
+        ),
+        ProjectClass(
+            "stemcells.ingest.StemcellsSmallRNAMetadata",
+            "bpa-stemcells",
+            technology="smallrna",
+        ),
+        ProjectClass(
+            "stemcells.ingest.StemcellsSingleCellRNASeqMetadata",
+            "bpa-stemcells",
+            technology="singlecellrna",
+        ),
+        ProjectClass(
+            "stemcells.ingest.StemcellsMetabolomicsMetadata",
+            "bpa-stemcells",
+            omics="metabolomics",
+        ),
+        ProjectClass(
+            "stemcells.ingest.StemcellsProteomicsMetadata",
+            "bpa-stemcells",
+            omics="proteomics",
+        ),
+        ProjectClass(
+            "stemcells.ingest.StemcellsProteomicsPoolMetadata",
+            "bpa-stemcells",
+            omics="proteomics",
+            pool=True,
+        ),
+        ProjectClass(
+            "stemcells.ingest.StemcellsProteomicsAnalysedMetadata",
+            "bpa-stemcells",
+            omics="proteomics",
+            analysed=True,
+        ),
+        ProjectClass(
+            "stemcells.ingest.StemcellsMetabolomicsAnalysedMetadata",
+            "bpa-stemcells",
+            omics="metabolomics",
+            analysed=True,
+        ),
+        ProjectClass(
+            "stemcells.ingest.StemcellsTranscriptomeAnalysedMetadata",
+            "bpa-stemcells",
+            omics="transcriptome",
+            analysed=True,
+        ),
+    ],
+    "wheat-cultivars": [
+        ProjectClass(
+            "wheat_cultivars.ingest.WheatCultivarsMetadata", "bpa-wheat-cultivars"
+        ),
+    ],
+    "wheat-pathogens": [
+        ProjectClass(
+            "wheat_pathogens_genomes.ingest.WheatPathogensGenomesMetadata",
+            "bpa-wheat-pathogens-genomes",
+            omics="genomics",
+        ),  # the first half of wheat pathogens
+    ],
+    "fungi": [
+        ProjectClass(
+            "fungi.ingest.FungiIlluminaShortreadMetadata",
+            "fungi",
+            technology="illumina-shortread",
+        ),
+        ProjectClass(
+            "fungi.ingest.FungiONTPromethionMetadata",
+            "fungi",
+            technology="ont-promethion",
+        ),
+        ProjectClass(
+            "fungi.ingest.FungiMetabolomicsMetadata", "fungi", technology="metabolomics"
+        ),
+    ],
+    "pp": [
+        ProjectClass(
+            "plant_pathogen.ingest.PlantPathogenIlluminaShortreadMetadata",
+            "plant-pathogen",
+            technology="illumina-shortread",
+        ),
+        ProjectClass(
+            "plant_pathogen.ingest.PlantPathogenPacbioHifiMetadata",
+            "plant-pathogen",
+            technology="pacbio-hifi",
+        ),
+        ProjectClass(
+            "plant_pathogen.ingest.PlantPathogenONTPromethionMetadata",
+            "plant-pathogen",
+            technology="ont-promethion",
+        ),
+    ],
+    "cipps": [
+        ProjectClass(
+            "cipps.ingest.CIPPSIlluminaShortreadMetadata",
+            "cipps",
+            technology="illumina-shortread",
+        ),
+        ProjectClass(
+            "cipps.ingest.CIPPSPacbioHifiMetadata", "cipps", technology="pacbio-hifi"
+        ),
+        ProjectClass("cipps.ingest.CIPPSHiCMetadata", "cipps", technology="hi-c"),
+    ],
+    "ppa": [
+        ProjectClass(
+            "plant_protein_atlas.ingest.PlantProteinAtlasPhenoCTXrayRawMetadata",
+            "ppa",
+            technology="phenoct-xray",
+        ),
+        ProjectClass(
+            "plant_protein_atlas.ingest.PlantProteinAtlasPhenoCTXrayAnalysedMetadata",
+            "ppa",
+            technology="phenoct-xray-analysed",
+        ),
+        ProjectClass(
+            "plant_protein_atlas.ingest.PlantProteinAtlasHyperspectralMetadata",
+            "ppa",
+            technology="hyperspectral",
+        ),
+        ProjectClass(
+            "plant_protein_atlas.ingest.PlantProteinAtlasASDSpectroMetadata",
+            "ppa",
+            technology="asd-spectro",
+        ),
+        ProjectClass(
+            "plant_protein_atlas.ingest.PlantProteinAtlasNutritionalMetadata",
+            "ppa",
+            technology="nutritional-analysis",
+        ),
+        ProjectClass(
+            "plant_protein_atlas.ingest.PlantProteinAtlasMetabolomicsMetadata",
+            "ppa",
+            technology="metabolomics",
+        ),
+        ProjectClass(
+            "plant_protein_atlas.ingest.PlantProteinAtlasMetabolomicsAnalysedMetadata",
+            "ppa",
+            technology="metabolomics-analysed",
+        ),
+        ProjectClass(
+            "plant_protein_atlas.ingest.PlantProteinAtlasProteomicsMetadata",
+            "ppa",
+            technology="proteomics",
+        ),
+        ProjectClass(
+            "plant_protein_atlas.ingest.PlantProteinAtlasProteomicsAnalysedMetadata",
+            "ppa",
+            technology="proteomics-analysed",
+        ),
+        ProjectClass(
+            "plant_protein_atlas.ingest.PlantProteinAtlasProteomicsDatabaseMetadata",
+            "ppa",
+            technology="proteomics-database",
+        ),
+        ProjectClass(
+            "plant_protein_atlas.ingest.PlantProteinAtlasMassImagingMetadata",
+            "ppa",
+            technology="mass-imaging",
+        ),
+        ProjectClass(
+            "plant_protein_atlas.ingest.PlantProteinAtlasMassImagingAnalysedMetadata",
+            "ppa",
+            technology="mass-imaging-analysed",
+        ),
+    ],
+    "grasslands": [
+        ProjectClass(
+            "grasslands.ingest.AGIlluminaShortreadMetadata",
+            "grasslands",
+            technology="illumina-shortread",
+        ),
+        ProjectClass(
+            "grasslands.ingest.AGHiCMetadata", "grasslands", technology="hi-c"
+        ),
+        ProjectClass(
+            "grasslands.ingest.AGPacbioHifiMetadata",
+            "grasslands",
+            technology="pacbio-hifi",
+        ),
+        ProjectClass(
+            "grasslands.ingest.AGGenomicsDDRADMetadata",
+            "grasslands",
+            omics="genomics",
+            technology="ddrad",
+        ),
+        ProjectClass(
+            "grasslands.ingest.AGONTPromethionMetadata",
+            "grasslands",
+            technology="ont-promethion",
+        ),
+    ],
+    "collaborations": [
+        ProjectClass(
+            "collaborations.ingest.CollaborationsMetagenomicsNovaseqMetadata",
+            "bpa-collaborations",
+            omics="metagenomics",
+            technology="novaseq",
+        ),
+        ProjectClass(
+            "collaborations.ingest.CollaborationsONTPromethionMetadata",
+            "bpa-collaborations",
+            technology="ont-promethion",
+        ),
+        ProjectClass(
+            "collaborations.ingest.CaneToadPacbioHifiMetadata",
+            "bpa-collaborations",
+            technology="pacbio-hifi",
+        ),
+    ],
+    "bsd": [
+        ProjectClass(
+            "bpa_sample_data.ingest.BSDSampleImagesMetadata",
+            "bpa-sample-data",
+            technology="site-images",
+        ),
+    ],
+    "workshop": [
+        ProjectClass(
+            "workshop.ingest.WorkshopPlantPathogenPacbioHifiMetadata",
+            "bpa-bioinformatics-workshop",
+            technology="pacbio-hifi",
+        ),
+        ProjectClass(
+            "workshop.ingest.WorkshopFungiIlluminaShortreadMetadata",
+            "bpa-bioinformatics-workshop",
+            technology="illumina-shortread",
+        ),
+    ],
+    "avian": [
+        ProjectClass(
+            "avian.ingest.AvianPacbioHifiMetadata",
+            "aus-avian",
+            technology="pacbio-hifi",
+        ),
+        ProjectClass("avian.ingest.AvianHiCMetadata", "aus-avian", technology="hi-c"),
+        ProjectClass(
+            "avian.ingest.AvianIlluminaShortreadMetadata",
+            "aus-avian",
+            technology="illumina-shortread",
+        ),
+        ProjectClass(
+            "avian.ingest.AvianONTPromethionMetadata",
+            "aus-avian",
+            technology="ont-promethion",
+        ),
+    ],
+    "forest": [
+        ProjectClass(
+            "forest.ingest.ForestPacbioHifiMetadata",
+            "forest-resilience",
+            technology="pacbio-hifi",
+        ),
+        ProjectClass(
+            "forest.ingest.ForestIlluminaShortreadMetadata",
+            "forest-resilience",
+            technology="illumina-shortread",
+        ),
+    ],
+    "ipm": [
+        ProjectClass(
+            "ipm.ingest.IPMIlluminaShortreadMetadata",
+            "bpa-ipm",
+            technology="illumina-shortread",
+        ),
+        ProjectClass(
+            "ipm.ingest.IPMONTPromethionMetadata",
+            "bpa-ipm",
+            technology="ont-promethion",
+        ),
+        ProjectClass(
+            "ipm.ingest.IPMPacbioHifiMetadata", "bpa-ipm", technology="pacbio-hifi"
+        ),
+    ],
+    "fish": [
+        ProjectClass(
+            "fish.ingest.FishIlluminaShortreadMetadata",
+            "aus-fish",
+            technology="illumina-shortread",
+        ),
+        ProjectClass(
+            "fish.ingest.FishPacbioHifiMetadata", "aus-fish", technology="pacbio-hifi"
+        ),
+        ProjectClass(
+            "fish.ingest.FishONTPromethionMetadata",
+            "aus-fish",
+            technology="ont-promethion",
+        ),
+        ProjectClass("fish.ingest.FishHiCMetadata", "aus-fish", technology="hi-c"),
+    ],
+    "ad": [
+        ProjectClass(
+            "animal_disease.ingest.AnimalDiseaseIlluminaShortreadMetadata",
+            "animal-disease",
+            technology="illumina-shortread",
+        ),
+        ProjectClass(
+            "animal_disease.ingest.AnimalDiseaseIlluminaHiCMetadata",
+            "animal-disease",
+            technology="hi-c",
+        ),
+        ProjectClass(
+            "animal_disease.ingest.AnimalDiseaseONTPromethionMetadata",
+            "animal-disease",
+            technology="ont-promethion",
+        ),
+        ProjectClass(
+            "animal_disease.ingest.AnimalDiseasePacbioHifiMetadata",
+            "animal-disease",
+            technology="pacbio-hifi",
+        ),
+    ],
+    "edna": [
+        ProjectClass(
+            "amdb.ingest.EDNAAmpliconsMetadata",
+            "edna-csiro",
+            omics="genomics",
+            technology="amplicons",
+        ),
+        ProjectClass(
+            "amdb.ingest.EDNAAmpliconsControlMetadata",
+            "edna-csiro",
+            omics="genomics",
+            technology="amplicons-control",
+        ),
+    ],
+    "avid": [
+        ProjectClass(
+            "avid.ingest.AVIDIlluminaShortreadMetadata",
+            "aus-venom",
+            technology="illumina-shortread",
+        ),
+        ProjectClass(
+            "avid.ingest.AVIDPacbioHifiMetadata", "aus-venom", technology="pacbio-hifi"
+        ),
+        ProjectClass(
+            "avid.ingest.AVIDGenomeAssemblyMetadata",
+            "aus-venom",
+            technology="genome-assembly",
+        ),
+    ],
+    "dinoflagellates": [
+        ProjectClass(
+            "dinoflagellates.ingest.DinoflagellatesIlluminaShortreadMetadata",
+            "dinoflagellates",
+            technology="illumina-shortread",
+        ),
+        # dinoflagellates.ingest.DinoflagellatesONTPromethionMetadata
+    ],
+    "sentinel_species": [
+        ProjectClass(
+            "sentinel_species.ingest.SentinelSpeciesIlluminaShortreadMetadata",
+            "sentinel-species",
+            technology="illumina-shortread",
+        ),
+        # sentinel_species.ingest.SentinelSpeciesONTPromethionMetadata
+        # sentinel_species.ingest.SentinelSpeciesPacbioHifiMetadata
+    ],
+}
 
-from .sepsis.ingest import (
-    SepsisGenomicsMiseqMetadata,
-    SepsisTranscriptomicsHiseqMetadata,
-    SepsisGenomicsPacbioMetadata,
-    SepsisMetabolomicsLCMSMetadata,
-    SepsisMetabolomicsGCMSMetadata,
-    SepsisProteomicsMS1QuantificationMetadata,
-    SepsisProteomicsSwathMSMetadata,
-    SepsisProteomicsProteinDatabaseMetadata,
-    SepsisProteomicsSwathMSPoolMetadata,
-    SepsisProteomicsSwathMSCombinedSampleMetadata,
-    SepsisProteomics2DLibraryMetadata,
-    SepsisProteomicsAnalysedMetadata,
-    SepsisTranscriptomicsAnalysedMetadata,
-    SepsisMetabolomicsAnalysedMetadata,
-    SepsisGenomicsAnalysedMetadata,
-)
-from .stemcells.ingest import (
-    StemcellsTranscriptomeMetadata,
-    StemcellsSmallRNAMetadata,
-    StemcellsSingleCellRNASeqMetadata,
-    StemcellsMetabolomicsMetadata,
-    StemcellsProteomicsMetadata,
-    StemcellsProteomicsPoolMetadata,
-    StemcellsProteomicsAnalysedMetadata,
-    StemcellsMetabolomicsAnalysedMetadata,
-    StemcellsTranscriptomeAnalysedMetadata,
-)
-from .wheat_cultivars.ingest import WheatCultivarsMetadata
-from .wheat_pathogens_genomes.ingest import WheatPathogensGenomesMetadata
-from .gap.ingest import (
-    GAPIlluminaShortreadMetadata,
-    GAPONTPromethionMetadata,
-    GAPONTMinionMetadata,
-    GAPGenomics10XMetadata,
-    GAPHiCMetadata,
-    GAPGenomicsDDRADMetadata,
-    GAPPacbioHifiMetadata,
-)
-from .omg.ingest import (
-    OMG10XProcessedIlluminaMetadata,
-    OMG10XRawIlluminaMetadata,
-    OMG10XRawMetadata,
-    OMGExonCaptureMetadata,
-    OMGWholeGenomeMetadata,
-    OMGGenomicsNovaseqMetadata,
-    OMGGenomicsHiSeqMetadata,
-    OMGGenomicsDDRADMetadata,
-    OMGGenomicsPacbioMetadata,
-    OMGONTPromethionMetadata,
-    OMGTranscriptomicsNextseq,
-    OMGGenomicsPacBioGenomeAssemblyMetadata,
-    OMGAnalysedDataMetadata,
-    OMGGenomicsDArTMetadata,
-)
 
-from .tsi.ingest import (
-    TSIPacbioHifiMetadata,
-    TSIGenomicsDDRADMetadata,
-    TSIIlluminaShortreadMetadata,
-    TSIIlluminaFastqMetadata,
-    TSIGenomeAssemblyMetadata,
-    TSIHiCMetadata,
-    TSIGenomicsDArTMetadata,
-    TSIONTPromethionMetadata,
-)
+def load_class(class_path):
+    module_name, cls_name = class_path.rsplit(".", 1)
+    return getattr(importlib.import_module("." + module_name, __name__), cls_name)
 
-from .fungi.ingest import (
-    FungiIlluminaShortreadMetadata,
-    FungiONTPromethionMetadata,
-    FungiMetabolomicsMetadata,
-)
 
-from .plant_pathogen.ingest import (
-    PlantPathogenIlluminaShortreadMetadata,
-    PlantPathogenPacbioHifiMetadata,
-    PlantPathogenONTPromethionMetadata,
-)
+class ClassInfo(dict):
+    """
+    the registry entry for an ingest class. the class itself, under the key
+    "cls", is imported on first access
+    """
 
-from .cipps.ingest import (
-    CIPPSIlluminaShortreadMetadata,
-    CIPPSPacbioHifiMetadata,
-    CIPPSHiCMetadata,
-)
+    def __missing__(self, key):
+        if key != "cls":
+            raise KeyError(key)
+        cls = self["cls"] = load_class(self["class_path"])
+        return cls
 
-from .plant_protein_atlas.ingest import (
-    PlantProteinAtlasPhenoCTXrayRawMetadata,
-    PlantProteinAtlasPhenoCTXrayAnalysedMetadata,
-    PlantProteinAtlasHyperspectralMetadata,
-    PlantProteinAtlasASDSpectroMetadata,
-    PlantProteinAtlasNutritionalMetadata,
-    PlantProteinAtlasMetabolomicsMetadata,
-    PlantProteinAtlasMetabolomicsAnalysedMetadata,
-    PlantProteinAtlasProteomicsMetadata,
-    PlantProteinAtlasProteomicsAnalysedMetadata,
-    PlantProteinAtlasProteomicsDatabaseMetadata,
-    PlantProteinAtlasMassImagingMetadata,
-    PlantProteinAtlasMassImagingAnalysedMetadata,
-)
 
-from .grasslands.ingest import (
-    AGIlluminaShortreadMetadata,
-    AGHiCMetadata,
-    AGPacbioHifiMetadata,
-    AGGenomicsDDRADMetadata,
-    AGONTPromethionMetadata,
-)
+class ProjectClasses(Mapping):
+    "slug -> ingest class, importing each class only when it is looked up"
 
-from .collaborations.ingest import (
-    CollaborationsMetagenomicsNovaseqMetadata,
-    CollaborationsONTPromethionMetadata,
-    CaneToadPacbioHifiMetadata,
-)
+    def __init__(self, metadata_info):
+        self._info = dict((t["slug"], t) for t in metadata_info)
 
-from .bpa_sample_data.ingest import (
-    BSDSampleImagesMetadata,
-)
-
-from .workshop.ingest import (
-    WorkshopPlantPathogenPacbioHifiMetadata,
-    WorkshopFungiIlluminaShortreadMetadata,
-)
-
-from .avian.ingest import (
-    AvianPacbioHifiMetadata,
-    AvianHiCMetadata,
-    AvianIlluminaShortreadMetadata,
-    AvianONTPromethionMetadata,
-)
-
-from .forest.ingest import (
-    ForestPacbioHifiMetadata,
-    ForestIlluminaShortreadMetadata,
-)
+    def __getitem__(self, slug):
+        return self._info[slug]["cls"]
 
-from .ipm.ingest import (
-    IPMIlluminaShortreadMetadata,
-    IPMONTPromethionMetadata,
-    IPMPacbioHifiMetadata,
-)
+    def __iter__(self):
+        return iter(self._info)
 
-from .fish.ingest import (
-    FishIlluminaShortreadMetadata,
-    FishPacbioHifiMetadata,
-    FishONTPromethionMetadata,
-    FishHiCMetadata,
-)
+    def __len__(self):
+        return len(self._info)
 
-from .avid.ingest import (
-    AVIDIlluminaShortreadMetadata,
-    AVIDPacbioHifiMetadata,
-    AVIDGenomeAssemblyMetadata,
-)
-from .dinoflagellates.ingest import (
-    DinoflagellatesIlluminaShortreadMetadata,
-    # DinoflagellatesONTPromethionMetadata,
-)
-from .sentinel_species.ingest import (
-    SentinelSpeciesIlluminaShortreadMetadata,
-    #SentinelSpeciesONTPromethionMetadata,
-    #SentinelSpeciesPacbioHifiMetadata,
-)
 
 class ProjectInfo:
-    projects = {
-        "amd": [
-            AustralianMicrobiomeMetagenomicsAnalysedMetadata,
-            AustralianMicrobiomeMetagenomicsNovaseqMetadata,
-            AustralianMicrobiomeMetagenomicsNovaseqControlMetadata,
-            AustralianMicrobiomeAmpliconsMetadata,
-            AustralianMicrobiomeAmpliconsControlMetadata,
-        ],
-        "ausarg": [
-            AusargIlluminaFastqMetadata,
-            AusargPacbioHifiMetadata,
-            AusargONTPromethionMetadata,
-            AusargExonCaptureMetadata,
-            AusargHiCMetadata,
-            AusargGenomicsDArTMetadata,
-            AusargGenomicsDDRADMetadata,
-        ],
-        "base": [
-            BASEAmpliconsMetadata,
-            BASEAmpliconsControlMetadata,
-            BASEMetagenomicsMetadata,
-            BASESiteImagesMetadata,
-        ],
-        "gap": [
-            GAPIlluminaShortreadMetadata,
-            GAPONTMinionMetadata,
-            GAPONTPromethionMetadata,
-            GAPGenomics10XMetadata,
-            GAPHiCMetadata,
-            GAPGenomicsDDRADMetadata,
-            GAPPacbioHifiMetadata,
-        ],
-        "gbr": [GbrAmpliconsMetadata, GbrPacbioMetadata],
-        "marine-microbes": [
-            MarineMicrobesAmpliconsMetadata,
-            MarineMicrobesAmpliconsControlMetadata,
-            MarineMicrobesMetagenomicsMetadata,
-            MarineMicrobesMetatranscriptomeMetadata,
-        ],
-        "omg": [
-            OMG10XRawMetadata,
-            OMG10XRawIlluminaMetadata,
-            OMG10XProcessedIlluminaMetadata,
-            OMGExonCaptureMetadata,
-            OMGWholeGenomeMetadata,
-            OMGGenomicsNovaseqMetadata,
-            OMGGenomicsHiSeqMetadata,
-            OMGGenomicsDDRADMetadata,
-            OMGGenomicsPacbioMetadata,
-            OMGONTPromethionMetadata,
-            OMGTranscriptomicsNextseq,
-            OMGGenomicsPacBioGenomeAssemblyMetadata,
-            OMGAnalysedDataMetadata,
-            OMGGenomicsDArTMetadata,
-        ],
-        "tsi": [
-            TSIPacbioHifiMetadata,
-            TSIGenomicsDDRADMetadata,
-            TSIIlluminaShortreadMetadata,
-            TSIIlluminaFastqMetadata,
-            TSIGenomeAssemblyMetadata,
-            TSIHiCMetadata,
-            TSIGenomicsDArTMetadata,
-            TSIONTPromethionMetadata,
-        ],
-        "sepsis": [
-            SepsisGenomicsMiseqMetadata,
-            SepsisGenomicsPacbioMetadata,
-            SepsisGenomicsAnalysedMetadata,
-            SepsisTranscriptomicsAnalysedMetadata,
-            SepsisTranscriptomicsHiseqMetadata,
-            SepsisMetabolomicsLCMSMetadata,
-            SepsisMetabolomicsGCMSMetadata,
-            SepsisMetabolomicsAnalysedMetadata,
-            SepsisProteomicsMS1QuantificationMetadata,
-            SepsisProteomicsSwathMSMetadata,
-            SepsisProteomicsSwathMSCombinedSampleMetadata,
-            SepsisProteomicsSwathMSPoolMetadata,
-            SepsisProteomics2DLibraryMetadata,
-            SepsisProteomicsAnalysedMetadata,
-            SepsisProteomicsProteinDatabaseMetadata,
-        ],
-        "stemcells": [
-            StemcellsTranscriptomeMetadata,
-            StemcellsSmallRNAMetadata,
-            StemcellsSingleCellRNASeqMetadata,
-            StemcellsMetabolomicsMetadata,
-            StemcellsProteomicsMetadata,
-            StemcellsProteomicsPoolMetadata,
-            StemcellsProteomicsAnalysedMetadata,
-            StemcellsMetabolomicsAnalysedMetadata,
-            StemcellsTranscriptomeAnalysedMetadata,
-        ],
-        "wheat-cultivars": [
-            WheatCultivarsMetadata,
-        ],
-        "wheat-pathogens": [
-            WheatPathogensGenomesMetadata,  # the first half of wheat pathogens
-        ],
-        "fungi": [
-            FungiIlluminaShortreadMetadata,
-            FungiONTPromethionMetadata,
-            FungiMetabolomicsMetadata,
-        ],
-        "pp": [
-            PlantPathogenIlluminaShortreadMetadata,
-            PlantPathogenPacbioHifiMetadata,
-            PlantPathogenONTPromethionMetadata,
-        ],
-        "cipps": [
-            CIPPSIlluminaShortreadMetadata,
-            CIPPSPacbioHifiMetadata,
-            CIPPSHiCMetadata,
-        ],
-        "ppa": [
-            PlantProteinAtlasPhenoCTXrayRawMetadata,
-            PlantProteinAtlasPhenoCTXrayAnalysedMetadata,
-            PlantProteinAtlasHyperspectralMetadata,
-            PlantProteinAtlasASDSpectroMetadata,
-            PlantProteinAtlasNutritionalMetadata,
-            PlantProteinAtlasMetabolomicsMetadata,
-            PlantProteinAtlasMetabolomicsAnalysedMetadata,
-            PlantProteinAtlasProteomicsMetadata,
-            PlantProteinAtlasProteomicsAnalysedMetadata,
-            PlantProteinAtlasProteomicsDatabaseMetadata,
-            PlantProteinAtlasMassImagingMetadata,
-            PlantProteinAtlasMassImagingAnalysedMetadata,
-        ],
-        "grasslands": [
-            AGIlluminaShortreadMetadata,
-            AGHiCMetadata,
-            AGPacbioHifiMetadata,
-            AGGenomicsDDRADMetadata,
-            AGONTPromethionMetadata,
-        ],
-        "collaborations": [
-            CollaborationsMetagenomicsNovaseqMetadata,
-            CollaborationsONTPromethionMetadata,
-            CaneToadPacbioHifiMetadata
-        ],
-        "bsd": [
-            BSDSampleImagesMetadata,
-        ],
-        "workshop": [
-            WorkshopPlantPathogenPacbioHifiMetadata,
-            WorkshopFungiIlluminaShortreadMetadata,
-        ],
-        "avian": [
-            AvianPacbioHifiMetadata,
-            AvianHiCMetadata,
-            AvianIlluminaShortreadMetadata,
-            AvianONTPromethionMetadata,
-        ],
-        "forest": [
-            ForestPacbioHifiMetadata,
-            ForestIlluminaShortreadMetadata,
-        ],
-        "ipm": [
-            IPMIlluminaShortreadMetadata,
-            IPMONTPromethionMetadata,
-            IPMPacbioHifiMetadata,
-        ],
-        "fish": [
-            FishIlluminaShortreadMetadata,
-            FishPacbioHifiMetadata,
-            FishONTPromethionMetadata,
-            FishHiCMetadata,
-        ],
-        "ad": [
-            AnimalDiseaseIlluminaShortreadMetadata,
-            AnimalDiseaseIlluminaHiCMetadata,
-            AnimalDiseaseONTPromethionMetadata,
-            AnimalDiseasePacbioHifiMetadata,
-        ],
-        "edna": [
-            EDNAAmpliconsMetadata,
-            EDNAAmpliconsControlMetadata,
-        ],
-        "avid": [
-            AVIDIlluminaShortreadMetadata,
-            AVIDPacbioHifiMetadata,
-            AVIDGenomeAssemblyMetadata,
-        ],
-        "dinoflagellates": [
-            DinoflagellatesIlluminaShortreadMetadata,
-            #DinoflagellatesONTPromethionMetadata,
-        ],
-        "sentinel_species": [
-            SentinelSpeciesIlluminaShortreadMetadata,
-            # SentinelSpeciesONTPromethionMetadata,
-            # SentinelSpeciesPacbioHifiMetadata,
-        ],
-    }
+    projects = PROJECTS
 
     def __init__(self):
         self.metadata_info = self._build_metadata_info()
@@ -402,16 +777,9 @@ class ProjectInfo:
         info = []
         slugs = set()
         for project_name, classes in ProjectInfo.projects.items():
-            for cls in classes:
-                class_info = {
-                    t: getattr(cls, t, None)
-                    for t in ("omics", "technology", "organization")
-                }
-                class_info.update(
-                    {t: getattr(cls, t, False) for t in ("analysed", "pool")}
-                )
+            for project_class in classes:
+                class_info = ClassInfo(project_class._asdict())
                 class_info["project"] = project_name
-                class_info["cls"] = cls
 
                 class_info["slug"] = slug = self._make_slug(class_info)
                 # ensure that 'slug' is unique
@@ -429,4 +797,4 @@ class ProjectInfo:
         return "-".join(filter(None, nm_parts))
 
     def cli_options(self):
-        return dict((t["slug"], t["cls"]) for t in self.metadata_info)
+        return ProjectClasses(self.metadata_info)
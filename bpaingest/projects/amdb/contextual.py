@@ -5,6 +5,7 @@ from ...libs import ingest_utils
 from ...libs.excel_wrapper import (
     ExcelWrapper,
     FieldDefinition,
+    evict_workbook,
     make_field_definition as fld,
 )
 from ...ncbi import NCBISRAContextual
@@ -1637,6 +1638,7 @@ class AustralianMicrobiomeSampleContextual:
             for error in wrapper.get_errors():
                 self._logger.error(error)
             rows += wrapper.get_all()
+        evict_workbook(metadata_path)
         return rows
 
     def filename_metadata(self, *args, **kwargs):
@@ -7,10 +7,7 @@ from unipath import Path
 
 from . import files
 from .schema_definitions import AustralianMicrobiomeSchema
-from .sqlite_contextual import (
-    AustralianMicrobiomeSampleContextualSQLite,
-    AustralianMicrobiomeSampleContextualSQLiteToExcelCopy,
-)
+from .sqlite_contextual import AustralianMicrobiomeSampleContextualSQLite
 from ...abstract import BaseMetadata
 from ...libs import ingest_utils
 from ...libs.excel_wrapper import make_field_definition as fld
@@ -89,9 +86,7 @@ def build_contextual_field_names():
 
 class AMDBaseMetadata(BaseMetadata):
     package_field_names = build_contextual_field_names()
-    sql_to_excel_context_classes = [
-        AustralianMicrobiomeSampleContextualSQLiteToExcelCopy
-    ]
+    sql_to_excel_context_classes = [AustralianMicrobiomeSampleContextualSQLite]
 
     schema_classes = [AustralianMicrobiomeSchema]
 
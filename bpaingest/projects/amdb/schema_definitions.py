@@ -1,6 +1,4 @@
 from glob import glob
-import pandas
-from numpy import nan
 import unicodedata
 from ...util import one
 
@@ -21,6 +19,9 @@ class AustralianMicrobiomeSchema:
 
     def get_schema_definitions(self, use_cols=None, pandas_format=None):
         if self.schema_definitions is None:
+            # pandas is slow to import, and only needed to validate the schema
+            import pandas
+
             if use_cols is None:
                 use_cols = ["Field", "dType", "AM_enviro", "Units_Definition", "Units"]
             if pandas_format is None:
@@ -32,6 +33,8 @@ class AustralianMicrobiomeSchema:
         return self.schema_definitions
 
     def validate_schema_units(self, context_field_specs):
+        from numpy import nan
+
         self._logger.info("comparing units...")
         missing_values = [None, nan]
         schema_definitions = {
@@ -76,6 +79,8 @@ class AustralianMicrobiomeSchema:
                         )
 
     def validate_schema_datatypes(self, context_field_specs):
+        from numpy import nan
+
         self._logger.info("comparing datatypes...")
         missing_values = [None, nan]
         schema_definitions = {
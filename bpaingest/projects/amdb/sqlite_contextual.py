@@ -1,31 +1,119 @@
+import math
 import os
 import re
-import shutil
 import sqlite3 as lite
 import sys
-import tempfile
 
-import pandas
+import xlrd
+from xlrd.sheet import Cell
 
+from ...libs.excel_wrapper import ExcelWrapper
 from .contextual import AustralianMicrobiomeSampleContextual
 
 
+def sqlite_cell(value):
+    """
+    returns an xlrd cell for a SQLite value, typed as it would be read back from
+    a workbook written from the table by pandas: NULL is empty, and numbers are
+    floats, with the 16 significant digits openpyxl writes to the workbook
+    """
+    if value is None:
+        return Cell(xlrd.XL_CELL_EMPTY, "")
+    if isinstance(value, str):
+        return Cell(xlrd.XL_CELL_TEXT, value)
+    if isinstance(value, (int, float)):
+        if math.isnan(value) or math.isinf(value):
+            return Cell(xlrd.XL_CELL_EMPTY, "")
+        return Cell(xlrd.XL_CELL_NUMBER, float("%.16g" % value))
+    return Cell(xlrd.XL_CELL_TEXT, str(value))
+
+
+class SQLiteTable:
+    """
+    the parts of the xlrd Sheet interface used by ExcelWrapper when mapping
+    columns, for a SQLite table
+    """
+
+    merged_cells = []
+    visibility = 0
+
+    def __init__(self, con, table_name):
+        self.name = table_name
+        cur = con.execute(f"SELECT * FROM {table_name} LIMIT 0")
+        self.column_names = [t[0] for t in cur.description]
+
+    def row_values(self, rowx):
+        assert rowx == 0
+        return self.column_names
+
+
+class SQLiteTableWrapper(ExcelWrapper):
+    """
+    applies a field spec to the rows of a SQLite table, streamed from a cursor.
+    `table_name` takes the place of the sheet name
+    """
+
+    def __init__(self, logger, field_spec, con, table_name, db_path, **kwargs):
+        self._con = con
+        super().__init__(logger, field_spec, db_path, sheet_name=table_name, **kwargs)
+
+    def _open_sheet(self, file_name, sheet_name):
+        return SQLiteTable(self._con, sheet_name)
+
+    def _get_rows(self):
+        for row in self._con.execute(f"SELECT * FROM {self.sheet.name}"):
+            yield [sqlite_cell(t) for t in row]
+
+
 class AustralianMicrobiomeSampleContextualSQLite(AustralianMicrobiomeSampleContextual):
     metadata_patterns = [re.compile(r"^.*\.db$")]
     source_pattern = "/*.db"
     db_table_name = "AM_metadata"
+    excel_file_copy_name = "context_metadata.xlsx"
 
     def __init__(self, logger, path):
         super().__init__(logger, path)
 
     def initialise_source_path(self, source_path):
-        data_frames = self.get_sqlite_data(source_path)
-        fo = tempfile.NamedTemporaryFile(suffix=".xlsx")
-        self.dataframe_to_excel_file(data_frames, fo.name)
-        super().initialise_source_path(fo.name)
-        fo.close()
+        self.source_path = source_path
+        super().initialise_source_path(source_path)
+
+    def _read_metadata(self, metadata_path):
+        con = None
+        try:
+            con = lite.connect(metadata_path)
+            self.validate_db_connection(con)
+            rows = []
+            for sheet_name, field_spec in sorted(self.field_specs.items()):
+                wrapper = SQLiteTableWrapper(
+                    self._logger,
+                    field_spec,
+                    con,
+                    self.db_table_name,
+                    metadata_path,
+                    suggest_template=True,
+                    additional_context={},
+                )
+                for error in wrapper.get_errors():
+                    self._logger.error(error)
+                rows += wrapper.get_all()
+            return rows
+        except lite.Error as e:
+            self._logger.error("Error %s:" % e.args[0])
+            sys.exit(1)
+        finally:
+            if con:
+                con.close()
+
+    def write_excel_copy(self):
+        "write the contextual table to an Excel workbook alongside the database"
+        fname = os.path.join(self.path_dir, self.excel_file_copy_name)
+        self.dataframe_to_excel_file(self.get_sqlite_data(self.source_path), fname)
+        self._logger.info(f"Excel copy made: {self.excel_file_copy_name}")
 
     def dataframe_to_excel_file(self, df, fname):
+        import pandas
+
         writer = pandas.ExcelWriter(fname)
         df.to_excel(writer, sheet_name=self.sheet_name)
         writer.close()
@@ -52,15 +140,7 @@ class AustralianMicrobiomeSampleContextualSQLite(AustralianMicrobiomeSampleConte
         self._logger.info("SQLite version: %s" % data)
 
     def fetch_data(self, con):
-        return pandas.read_sql_query(f"SELECT * FROM {self.db_table_name}", con)
-
-
-class AustralianMicrobiomeSampleContextualSQLiteToExcelCopy(
-    AustralianMicrobiomeSampleContextualSQLite
-):
-    excel_file_copy_name = "context_metadata.xlsx"
+        # pandas is slow to import, so is imported only when the table is read
+        import pandas
 
-    def dataframe_to_excel_file(self, df, fname):
-        super().dataframe_to_excel_file(df, fname)
-        shutil.copyfile(fname, os.path.join(self.path_dir, self.excel_file_copy_name))
-        self._logger.info(f"Excel copy made: {self.excel_file_copy_name}")
+        return pandas.read_sql_query(f"SELECT * FROM {self.db_table_name}", con)
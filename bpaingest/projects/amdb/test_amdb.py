@@ -1,3 +1,8 @@
+import sqlite3
+
+from .contextual import AustralianMicrobiomeSampleContextual
+from .sqlite_contextual import AustralianMicrobiomeSampleContextualSQLite
+from ...util import make_logger
 from .files import (
     amd_metagenomics_analysed_re,
     amd_metagenomics_novaseq_re,
@@ -27,6 +32,8 @@ from .files import (
 
 )
 
+logger = make_logger(__name__)
+
 
 def test_base_amplicon_control():
     filenames = [
@@ -350,3 +357,32 @@ def test_edna_amplicon_control_re():
       ]
     for filename in filenames:
         assert edna_amplicon_control_filename_re.match(filename) is not None
+
+
+def test_sqlite_contextual_matches_excel(tmp_path):
+    db_dir = tmp_path / "db"
+    xlsx_dir = tmp_path / "xlsx"
+    db_dir.mkdir()
+    xlsx_dir.mkdir()
+    con = sqlite3.connect(str(db_dir / "contextual.db"))
+    con.execute(
+        "CREATE TABLE AM_metadata (sample_id, latitude, longitude, depth, sample_type)"
+    )
+    con.executemany(
+        "INSERT INTO AM_metadata VALUES (?, ?, ?, ?, ?)",
+        [
+            ("102.100.100/1001", -33.8911190385673, 151.2755, 5, " Soil "),
+            ("102.100.100/1002", None, 151.0, 12.345678901234567, "Marine"),
+        ],
+    )
+    con.commit()
+    con.close()
+
+    sqlite_contextual = AustralianMicrobiomeSampleContextualSQLite(
+        logger, str(db_dir)
+    )
+    # the previous implementation wrote the table out through pandas and read it back
+    df = sqlite_contextual.get_sqlite_data(str(db_dir / "contextual.db"))
+    sqlite_contextual.dataframe_to_excel_file(df, str(xlsx_dir / "contextual.xlsx"))
+    excel_contextual = AustralianMicrobiomeSampleContextual(logger, str(xlsx_dir))
+    assert sqlite_contextual.sample_metadata == excel_contextual.sample_metadata
@@ -0,0 +1,33 @@
+import os
+import subprocess
+import sys
+
+from . import ProjectInfo
+
+
+def test_slugs_unique():
+    slugs = [t["slug"] for t in ProjectInfo().metadata_info]
+    assert len(slugs) == len(set(slugs))
+
+
+def test_registry_matches_classes():
+    for class_info in ProjectInfo().metadata_info:
+        cls = class_info["cls"]
+        assert class_info["class_path"].endswith("." + cls.__name__)
+        for attr in ("omics", "technology", "organization"):
+            assert class_info[attr] == getattr(cls, attr, None), class_info["slug"]
+        for attr in ("analysed", "pool"):
+            assert class_info[attr] == getattr(cls, attr, False), class_info["slug"]
+
+
+def test_cli_imports_no_projects():
+    # run in a fresh interpreter, as other tests import the project modules
+    code = (
+        "import sys\n"
+        "from bpaingest import cli\n"
+        "assert cli.project_cli_options\n"
+        "print('\\n'.join(t for t in sys.modules if t.endswith('.ingest')))\n"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+    output = subprocess.check_output([sys.executable, "-c", code], cwd=root)
+    assert output.decode("utf8").split() == []
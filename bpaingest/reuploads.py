@@ -0,0 +1,156 @@
+"""
+the reuploads journal: newline-delimited JSON, one event per line. a resource
+is "queued" for re-upload, with its CKAN object and legacy URL, and then
+"started", "completed" or "failed" as it is uploaded. the resources remaining
+to be uploaded are those queued and not since completed.
+
+the journal replaces a pickled list of the resources to re-upload, which is
+imported into the journal if found alongside it.
+"""
+
+import json
+import os
+import pickle
+import threading
+
+from .util import make_logger
+
+
+logger = make_logger(__name__)
+
+LEGACY_DUMP = "reupload_resources.dump"
+
+
+def _encode(event):
+    return json.dumps(event, sort_keys=True, separators=(",", ":")) + "\n"
+
+
+class ReuploadJournal:
+    """
+    the journal at `path`. events are appended as they happen, so recording
+    one costs the same however long the queue; workers may record events
+    concurrently. if `sync_interval` is set, the journal is fsync'd to disk
+    after that many events
+    """
+
+    def __init__(self, path, sync_interval=None):
+        self.path = path
+        self.sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self._fd = None
+        self._unsynced = 0
+
+    def replay(self):
+        """
+        the (ckan_obj, legacy_url) of each resource queued and not completed,
+        in the order queued. a line left incomplete by a crash is ignored
+        """
+        if not os.path.exists(self.path):
+            self._import_legacy_dump()
+        queued = {}
+        last_event = {}
+        try:
+            with open(self.path) as fd:
+                for line in fd:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        logger.warning("ignoring incomplete line in reuploads journal")
+                        continue
+                    if event["event"] == "queued":
+                        queued.pop(event["id"], None)
+                        queued[event["id"]] = (event["resource"], event["legacy_url"])
+                    last_event[event["id"]] = event["event"]
+        except FileNotFoundError:
+            logger.warning("no reuploads journal at {}".format(self.path))
+        remaining = [
+            tpl
+            for resource_id, tpl in queued.items()
+            if last_event[resource_id] != "completed"
+        ]
+        failed = sum(1 for t in remaining if last_event[t[0]["id"]] == "failed")
+        logger.info(
+            "reuploads journal: {} resources remaining, {} of which failed".format(
+                len(remaining), failed
+            )
+        )
+        return remaining
+
+    def _import_legacy_dump(self):
+        "start the journal from the legacy pickled queue, if there is one"
+        legacy_path = os.path.join(os.path.dirname(self.path), LEGACY_DUMP)
+        if not os.path.exists(legacy_path):
+            return
+        logger.warning(
+            "importing legacy reuploads cache {} into journal {}".format(
+                legacy_path, self.path
+            )
+        )
+        try:
+            with open(legacy_path, "rb") as fd:
+                to_reupload = pickle.load(fd)
+        except Exception as e:
+            logger.error(
+                "unable to read legacy reuploads cache {}: {}".format(legacy_path, e)
+            )
+            return
+        self.reset(to_reupload)
+        self.close()
+
+    def reset(self, to_reupload):
+        """
+        start the journal afresh with `to_reupload` queued. earlier events are
+        discarded, compacting the journal
+        """
+        self.close()
+        tmpf = self.path + ".new"
+        with open(tmpf, "w") as fd:
+            for resource, legacy_url in to_reupload:
+                fd.write(
+                    _encode(
+                        {
+                            "event": "queued",
+                            "id": resource["id"],
+                            "resource": resource,
+                            "legacy_url": legacy_url,
+                        }
+                    )
+                )
+            fd.flush()
+            os.fsync(fd.fileno())
+        os.replace(tmpf, self.path)
+        self._fd = open(self.path, "a")
+        logger.info(
+            "reuploads journal at {}: {} resources queued".format(
+                self.path, len(to_reupload)
+            )
+        )
+
+    def _append(self, event):
+        line = _encode(event)
+        with self._lock:
+            # a single write of a whole line, so that concurrent events
+            # are never interleaved
+            self._fd.write(line)
+            self._fd.flush()
+            self._unsynced += 1
+            if self.sync_interval and self._unsynced >= self.sync_interval:
+                os.fsync(self._fd.fileno())
+                self._unsynced = 0
+
+    def started(self, resource_id):
+        self._append({"event": "started", "id": resource_id})
+
+    def completed(self, resource_id):
+        self._append({"event": "completed", "id": resource_id})
+
+    def failed(self, resource_id, error):
+        self._append({"event": "failed", "id": resource_id, "error": str(error)})
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                self._fd.flush()
+                os.fsync(self._fd.fileno())
+                self._fd.close()
+                self._fd = None
@@ -1,11 +1,12 @@
 import math
 
 from bpaingest.libs.ingest_utils import get_clean_number
-from bpasslh.handler import SensitiveDataGeneraliser
 
 
 class SensitiveSpeciesWrapper:
     def __init__(self, logger, *args, **kwargs):
+        from bpasslh.handler import SensitiveDataGeneraliser
+
         self.generaliser = SensitiveDataGeneraliser(logger)
         self.package_id_keyname = kwargs.get("package_id_keyname", "bpa_dataset_id")
         self._logger = logger
@@ -0,0 +1,97 @@
+"""
+newline-delimited dumpstate output. each line is a JSON array of
+`[data_type, key, value]`, where key is one of the keys of a data type in the
+dumpstate JSON. "packages", "resources" and "raw_resources_files" have a line
+per list entry, other keys a single line. a data type can be read without
+parsing the lines of any other.
+"""
+
+import json
+import os
+
+LIST_KEYS = ("packages", "resources", "raw_resources_files")
+
+
+class StateWriter:
+    """
+    writes the state of each data type as it is finalised, so that only one
+    data type need be held in memory
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._tmpf = filename + ".new"
+        self._fd = None
+        self.data_types = set()
+
+    def __enter__(self):
+        self._fd = open(self._tmpf, "w")
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._fd.close()
+        if exc_type is None:
+            os.replace(self._tmpf, self.filename)
+        else:
+            os.unlink(self._tmpf)
+
+    def _write_line(self, data_type, key, value):
+        self._fd.write(
+            json.dumps([data_type, key, value], sort_keys=True, separators=(",", ":"))
+        )
+        self._fd.write("\n")
+
+    def write(self, data_type, data_type_state):
+        assert data_type not in self.data_types
+        self.data_types.add(data_type)
+        for key in sorted(data_type_state):
+            if key in LIST_KEYS:
+                for value in data_type_state[key]:
+                    self._write_line(data_type, key, value)
+            else:
+                self._write_line(data_type, key, data_type_state[key])
+
+
+def _new_data_type_state():
+    return {key: [] for key in LIST_KEYS}
+
+
+def iter_state(filename, data_type=None):
+    """
+    yields (data_type, key, value) from a newline-delimited dumpstate file,
+    optionally for a single data type. lines for other data types are skipped
+    without being parsed
+    """
+    prefix = None
+    if data_type is not None:
+        prefix = json.dumps([data_type])[:-1] + ","
+    with open(filename) as fd:
+        for line in fd:
+            if prefix is not None and not line.startswith(prefix):
+                continue
+            yield json.loads(line)
+
+
+def read_state_data_type(filename, data_type):
+    """
+    the state of `data_type`, as it would be found in the dumpstate JSON
+    """
+    data_type_state = _new_data_type_state()
+    for _data_type, key, value in iter_state(filename, data_type):
+        if key in LIST_KEYS:
+            data_type_state[key].append(value)
+        else:
+            data_type_state[key] = value
+    return data_type_state
+
+
+def read_state(filename):
+    "the whole state, as it would be found in the dumpstate JSON"
+    state = {}
+    for data_type, key, value in iter_state(filename):
+        data_type_state = state.setdefault(data_type, _new_data_type_state())
+        if key in LIST_KEYS:
+            data_type_state[key].append(value)
+        else:
+            data_type_state[key] = value
+    return state
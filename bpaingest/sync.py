@@ -1,9 +1,12 @@
 import os
-import pickle
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from bpaingest.ops import (
     ckan_method,
+    object_fingerprint,
     patch_if_required,
     check_resource,
     create_resource,
@@ -13,9 +16,11 @@ from bpaingest.ops import (
     CKANArchiveInfo,
     ApacheArchiveInfo,
 )
+from bpaingest.fingerprints import FingerprintStore
 from bpaingest.pkgcache import build_package_cache
+from bpaingest.reuploads import ReuploadJournal
+from bpaingest.uploadstate import UploadStateStore
 import ckanapi
-import botocore
 
 from bpaingest.resource_metadata import (
     build_raw_resources_as_file,
@@ -25,12 +30,21 @@ from bpaingest.util import make_logger
 from bpaingest.util import prune_dict
 from bpaingest.libs.multihash import S3_HASH_FIELDS
 from bpaingest.libs.bpa_constants import AUDIT_DELETED, AUDIT_VERIFIED
-from bpaingest.libs.s3 import merge_and_update_tags
+from bpaingest.libs.s3 import (
+    apply_tag_changes,
+    list_object_index,
+    load_inventory_index,
+    plan_tag_changes,
+    write_batch_operations_manifests,
+)
 from bpaingest.libs.munge import munge_filename_legacy
 from collections import Counter
 
 logger = make_logger(__name__)
 
+# number of concurrent resource integrity checks against CKAN/S3 and the mirror
+CHECK_THREADS = 8
+
 
 def get_or_create_package(ckan, obj):
     try:
@@ -72,12 +86,17 @@ def get_or_create_resource(ckan, obj):
     return ckan_obj
 
 
-def get_uploaded_resource_from_ckan(ckan, obj):
+def get_uploaded_resource_from_ckan(ckan, obj, mirror=None):
     #  this will return None if the resource is NOT uploaded to S3.
-    try:
-        resource_from_ckan = ckan_method(ckan, "resource", "show")(id=obj["id"])
-    except ckanapi.errors.NotFound:
-        return None
+    if mirror is not None:
+        resource_from_ckan = mirror.show_resource(obj["id"])
+        if resource_from_ckan is None:
+            return None
+    else:
+        try:
+            resource_from_ckan = ckan_method(ckan, "resource", "show")(id=obj["id"])
+        except ckanapi.errors.NotFound:
+            return None
     if (
         "url_type" not in resource_from_ckan
         or resource_from_ckan["url_type"] != "upload"
@@ -87,7 +106,7 @@ def get_uploaded_resource_from_ckan(ckan, obj):
     return resource_from_ckan
 
 
-def sync_package(ckan, obj, cached_obj):
+def sync_package(ckan, obj, cached_obj, mirror=None):
     if cached_obj is None:
         ckan_obj = get_or_create_package(ckan, obj)
     else:
@@ -102,10 +121,16 @@ def sync_package(ckan, obj, cached_obj):
     )
     if was_patched:
         logger.info("patched package object: %s" % (obj["id"]))
+    if mirror is not None and (was_patched or cached_obj is None):
+        mirror.update(ckan_obj)
     return ckan_obj
 
 
-def audit_resource(audit_tag, description, ckan, delete_id, resource_obj):
+def resource_s3_object(ckan, resource_obj, destination=None):
+    """
+    the (bucket, key) of an uploaded resource, or None for shared resources and
+    resources hosted elsewhere
+    """
     # Filter out shared resources and resources hosted elsewhere
     # Simple check to see if resource_id is in URL
     id = resource_obj.get("id", "")
@@ -118,72 +143,58 @@ def audit_resource(audit_tag, description, ckan, delete_id, resource_obj):
                 url,
             )
         )
-        return
-
-    # Update s3tags for 'audit' to be AUDIT_DELETED
-    s3_tags = {
-        "audit": audit_tag,
-    }
+        return None
 
     # This filename should always be stored as a clean
     # filename in S3
     filename = resource_obj["name"]
-    destination = determine_destination(ckan)
+    if destination is None:
+        destination = determine_destination(ckan)
     bucket = destination.split("/")[0]
     key = "{}/resources/{}/{}".format(
         destination.split("/", 1)[1], resource_obj["id"], filename
     )
-
-    logger.info(
-        "Tagging %s resource object: %s"
-        % (
-            description,
-            key,
-        )
-    )
-
-    try:
-        merge_and_update_tags(bucket, key, s3_tags)
-    except botocore.exceptions.ClientError as ex:
-        if ex.response["Error"]["Code"] == "NoSuchKey":
-            logger.error(
-                "Unable to tag non-existent object with key `%s', for resource object (%s)"
-                % (key, repr(resource_obj))
-            )
-        raise Exception("Unable to tag S3 Resource due to error")
+    return bucket, key
 
 
-def tag_verified_resource(ckan, verified_id, resource_obj):
-    audit_tag = AUDIT_VERIFIED
-    description = "verified"
-    try:
-        audit_resource(audit_tag, description, ckan, verified_id, resource_obj)
-    except:
-        logger.warn("Unable to add verified tag to s3 object with key `%s' - likely filename change or missing" % (verified_id,))
-
-
-def tag_deleted_resource(ckan, delete_id, resource_obj):
-    audit_tag = AUDIT_DELETED
-    description = "deleted"
-    try:
-        audit_resource(audit_tag, description, ckan, delete_id, resource_obj)
-    except:
-        logger.warn("Unable to tag deleted s3 object with key `%s'" % (delete_id,))
-
-
-def delete_resource(ckan, delete_id, resource_obj):
-    tag_deleted_resource(ckan, delete_id, resource_obj)
-    ckan_method(ckan, "resource", "delete")(id=delete_id)
+def tag_resources(ckan, resource_objs, audit_tag, description, manifest_path=None):
+    """
+    tag the S3 objects of many resources with `audit_tag`, skipping objects
+    already tagged. with `manifest_path`, S3 Batch Operations manifests are
+    written there rather than the tags being applied
+    """
+    destination = determine_destination(ckan)
+    if destination is None:
+        logger.warning("Unable to tag %s resources: no bucket" % (description))
+        return
+    objects = []
+    for resource_obj in resource_objs:
+        s3_object = resource_s3_object(ckan, resource_obj, destination=destination)
+        if s3_object is not None:
+            objects.append(s3_object)
+    logger.info("Tagging %d %s resource objects" % (len(objects), description))
+    plan = plan_tag_changes(objects, {"audit": audit_tag})
+    for bucket, key in plan.missing:
+        logger.error("Unable to tag non-existent object with key `%s'" % (key))
+    for bucket, key in plan.failed:
+        logger.warning("Unable to tag %s s3 object with key `%s'" % (description, key))
+    if manifest_path is not None:
+        write_batch_operations_manifests(plan, manifest_path)
+    else:
+        apply_tag_changes(plan)
 
 
 def delete_package(ckan, delete_id, package_obj):
     # delete_id and package_obj["id"] should be same / equivalent
 
-    # iterate through packages resources and tag in s3 as deleted
+    # tag the package's uploaded resources in s3 as deleted
+    resource_objs = []
     for resource in package_obj["resources"]:
         resource_obj = get_uploaded_resource_from_ckan(ckan, resource)
         if resource_obj:
-            tag_deleted_resource(ckan, resource["id"], resource_obj)
+            resource_objs.append(resource_obj)
+    if resource_objs:
+        tag_resources(ckan, resource_objs, AUDIT_DELETED, "deleted")
 
     ckan_method(ckan, "package", "delete")(id=delete_id)
 
@@ -205,7 +216,17 @@ def delete_dangling_packages(ckan, packages, cache, do_delete):
 
 
 def sync_packages(
-    ckan, ckan_data_type, packages, org, group, do_delete, do_single_ticket, do_audit
+    ckan,
+    ckan_data_type,
+    packages,
+    org,
+    group,
+    do_delete,
+    do_single_ticket,
+    do_audit,
+    mirror=None,
+    fingerprints=None,
+    num_threads=1,
 ):
     # FIXME: we don't check if there are any packages we should remove (unpublish)
     logger.info("syncing %d packages" % (len(packages)))
@@ -215,35 +236,95 @@ def sync_packages(
         group,
         ("display_name", "description", "title", "image_display_url", "id", "name"),
     )
-    ckan_packages = []
-
-    cache = build_package_cache(ckan, ckan_data_type, packages)
+    cache = build_package_cache(ckan, ckan_data_type, packages, mirror=mirror)
     if do_single_ticket is None:  # no need to try to delete them
         delete_dangling_packages(ckan, packages, cache, do_delete)
 
-    synched_package_count = 0
+    to_sync = []
     for package in sorted(packages, key=lambda p: p["name"]):
         obj = package.copy()
         obj["owner_org"] = org["id"]
         if api_group_obj is not None:
             obj["groups"] = [api_group_obj]
         if do_single_ticket is None or obj["ticket"] == do_single_ticket:
-            ckan_packages.append(sync_package(ckan, obj, cache.get(obj["id"])))
-            synched_package_count += 1
-            if synched_package_count % reporting_interval == 0:
+            to_sync.append(obj)
+
+    # guards the counts, which are updated from the workers
+    count_lock = threading.Lock()
+    counts = {"synched": 0, "skipped": 0}
+
+    def sync_one(obj):
+        # packages are compared without their resources, which are decoded
+        # only if the resources are synced
+        cached_obj = cache.summary(obj["id"]) if obj["id"] in cache else None
+        fingerprint = object_fingerprint(obj, obj)
+        skipped = (
+            fingerprints is not None
+            and cached_obj is not None
+            and fingerprints.unchanged("packages", obj["id"], fingerprint)
+        )
+        if skipped:
+            # unchanged since it was last synced
+            ckan_obj = cached_obj
+        else:
+            ckan_obj = sync_package(ckan, obj, cached_obj, mirror=mirror)
+            if fingerprints is not None:
+                fingerprints.record("packages", obj["id"], fingerprint)
+        with count_lock:
+            counts["synched"] += 1
+            counts["skipped"] += skipped
+            if counts["synched"] % reporting_interval == 0:
                 logger.info(
-                    "synced %d of %d packages" % (synched_package_count, len(packages))
+                    "synced %d of %d packages" % (counts["synched"], len(packages))
                 )
+        return ckan_obj
+
+    # the packages are independent, so are synced concurrently; results are
+    # returned in name order
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        ckan_packages = list(executor.map(sync_one, to_sync))
+    if fingerprints is not None:
+        logger.info(
+            "%d packages unchanged since last sync, not compared" % (counts["skipped"])
+        )
     return ckan_packages
 
 
-def check_resources(ckan, current_resources, resource_id_legacy_url, auth, num_threads):
-    ckan_archive_info = CKANArchiveInfo(ckan)
-    apache_archive_info = ApacheArchiveInfo(auth)
-    to_reupload = []
+def check_resources(
+    ckan,
+    current_resources,
+    resource_id_legacy_url,
+    auth,
+    num_threads,
+    listed_sizes=None,
+    size_cache_path=None,
+    s3_index=None,
+):
+    """
+    check each of `current_resources` against the legacy archive, using a pool of
+    `num_threads` workers. returns the (ckan_obj, legacy_url) tuples which need to
+    be re-uploaded, in the same order as `current_resources`.
+
+    the legacy sizes are determined up front: see ApacheArchiveInfo.prefetch_sizes.
+    sizes found are kept at `size_cache_path`, if given, for later runs. uploaded
+    objects are looked up in `s3_index`, if given (see build_s3_index)
+    """
+    ckan_archive_info = CKANArchiveInfo(ckan, maxsize=num_threads, s3_index=s3_index)
+    apache_archive_info = ApacheArchiveInfo(auth, maxsize=num_threads)
+    if size_cache_path is not None:
+        apache_archive_info.load_sizes(size_cache_path)
+    apache_archive_info.prefetch_sizes(
+        [resource_id_legacy_url.get(t["id"]) for t in current_resources],
+        num_threads,
+        listed_sizes=listed_sizes,
+    )
+    if size_cache_path is not None:
+        apache_archive_info.save_sizes(size_cache_path)
 
-    def check(current_ckan_obj, legacy_url, current_url):
+    def check(current_ckan_obj):
         obj_id = current_ckan_obj["id"]
+        legacy_url = resource_id_legacy_url.get(obj_id)
+        current_url = current_ckan_obj.get("url")
         resource_issue = check_resource(
             ckan_archive_info,
             apache_archive_info,
@@ -256,47 +337,88 @@ def check_resources(ckan, current_resources, resource_id_legacy_url, auth, num_t
                 "resource check failed (%s) queued for re-upload: %s"
                 % (resource_issue, obj_id)
             )
-            to_reupload.append((current_ckan_obj, legacy_url))
-        else:
-            logger.info("resource check OK: %s" % (obj_id))
+            return current_ckan_obj, legacy_url
+        logger.info("resource check OK: %s" % (obj_id))
+        return None
 
-    logger.info("%d resources to be checked" % (len(current_resources)))
-    for current_ckan_obj in current_resources:
-        obj_id = current_ckan_obj["id"]
-        legacy_url = resource_id_legacy_url.get(obj_id)
-        current_url = current_ckan_obj.get("url")
-        check(current_ckan_obj, legacy_url, current_url)
+    total = len(current_resources)
+    logger.info("%d resources to be checked (%d threads)" % (total, num_threads))
+    reporting_interval = determine_reporting_interval(total)
+    start = time.monotonic()
+    results = [None] * total
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        futures = {
+            executor.submit(check, current_ckan_obj): idx
+            for idx, current_ckan_obj in enumerate(current_resources)
+        }
+        for checked, future in enumerate(as_completed(futures), 1):
+            results[futures[future]] = future.result()
+            if checked % reporting_interval == 0:
+                logger.info(
+                    "checked %d of %d resources (%.1f checks/sec)"
+                    % (checked, total, checked / (time.monotonic() - start))
+                )
 
-    return to_reupload
+    elapsed = time.monotonic() - start
+    if total:
+        logger.info(
+            "%d resources checked in %.1f seconds (%.1f checks/sec)"
+            % (total, elapsed, total / max(elapsed, 1e-6))
+        )
+    return [t for t in results if t is not None]
 
 
-def audit_resources(ckan, current_resources):
+def audit_resources(ckan, current_resources, manifest_path=None):
     logger.info("%d resources to be audited" % (len(current_resources)))
-    for current_ckan_obj in current_resources:
-        obj_id = current_ckan_obj["id"]
-        tag_verified_resource(ckan, obj_id, current_ckan_obj)
+    tag_resources(
+        ckan, current_resources, AUDIT_VERIFIED, "verified", manifest_path=manifest_path
+    )
 
 
-def check_package_resources(ckan, ckan_packages, resource_id_legacy_url, auth):
+def check_package_resources(
+    ckan,
+    ckan_packages,
+    resource_id_legacy_url,
+    auth,
+    listed_sizes=None,
+    size_cache_path=None,
+    s3_index=None,
+):
     all_resources = []
     for package_obj in sorted(ckan_packages, key=lambda p: p["name"]):
         current_resources = package_obj["resources"]
         all_resources += current_resources
 
-    return check_resources(ckan, all_resources, resource_id_legacy_url, auth, 8)
+    return check_resources(
+        ckan,
+        all_resources,
+        resource_id_legacy_url,
+        auth,
+        CHECK_THREADS,
+        listed_sizes=listed_sizes,
+        size_cache_path=size_cache_path,
+        s3_index=s3_index,
+    )
 
 
-def audit_package_resources(ckan, ckan_packages):
+def audit_package_resources(ckan, ckan_packages, manifest_path=None):
     all_resources = []
     for package_obj in sorted(ckan_packages, key=lambda p: p["name"]):
         current_resources = package_obj["resources"]
         all_resources += current_resources
 
-    return audit_resources(ckan, all_resources)
+    return audit_resources(ckan, all_resources, manifest_path=manifest_path)
 
 
 def sync_package_resources(
-    ckan, package_obj, resource_id_legacy_url, resources, auth, do_delete
+    ckan,
+    package_obj,
+    resource_id_legacy_url,
+    resources,
+    auth,
+    do_delete,
+    mirror=None,
+    fingerprints=None,
 ):
     current_resources = package_obj["resources"]
     existing_resources = dict((t["id"], t) for t in current_resources)
@@ -313,6 +435,7 @@ def sync_package_resources(
     to_delete = set(existing_resources) - set(needed_resources)
 
     to_reupload = []
+    created = []
     created_resource_count = 0
     uncreated_resource_count = 0
     for obj_id in to_create:
@@ -328,11 +451,20 @@ def sync_package_resources(
             created_resource_count += 1
             logger.info("created resource: %s/%s" % (create_obj["package_id"], obj_id))
             to_reupload.append((current_ckan_obj, legacy_url))
+            created.append(current_ckan_obj)
         else:
             uncreated_resource_count += 1
         # logger.info("Processing Resource creation: created %d, did not create %d of expected %d"
         #            % (created_resource_count, uncreated_resource_count, len(to_create)))
 
+    if do_delete and to_delete:
+        # tag the S3 objects of the resources as deleted, together
+        tag_resources(
+            ckan,
+            [existing_resources[t] for t in sorted(to_delete)],
+            AUDIT_DELETED,
+            "deleted",
+        )
     for obj_id in to_delete:
         delete_obj = existing_resources[obj_id]
         logger.info(
@@ -340,12 +472,21 @@ def sync_package_resources(
             % (delete_obj["package_id"], obj_id, do_delete)
         )
         if do_delete:
-            delete_resource(ckan, obj_id, delete_obj)
+            ckan_method(ckan, "resource", "delete")(id=obj_id)
             logger.info("deleted resource: %s/%s" % (delete_obj["package_id"], obj_id))
 
     # patch all the resources, to ensure everything is synced on
     # existing resources
-    if to_create or to_delete:
+    if (to_create or to_delete) and mirror is not None:
+        # apply our changes to the package, rather than fetching it again
+        package_obj = package_obj.copy()
+        package_obj["resources"] = [
+            t
+            for t in package_obj["resources"]
+            if not (do_delete and t["id"] in to_delete)
+        ] + created
+        mirror.update(package_obj)
+    elif to_create or to_delete:
         # if we've changed the resources attached to the package, refresh it
         package_obj = ckan_method(ckan, "package", "show")(id=package_obj["id"])
     current_resources = package_obj["resources"]
@@ -356,15 +497,39 @@ def sync_package_resources(
             logger.debug("skipping patch of unknown resource: {}".format(obj_id))
             continue
         legacy_url = resource_id_legacy_url[obj_id]
+        fingerprint = object_fingerprint(resource_obj, resource_obj)
+        if fingerprints is not None and fingerprints.unchanged(
+            "resources", obj_id, fingerprint
+        ):
+            continue
         was_patched, ckan_obj = patch_if_required(
             ckan, "resource", current_ckan_obj, resource_obj
         )
         if was_patched:
             logger.info("patched resource: %s" % (obj_id))
+        if fingerprints is not None:
+            fingerprints.record("resources", obj_id, fingerprint)
 
     return to_reupload
 
 
+def build_s3_index(ckan, inventory_path=None):
+    """
+    the size and ETag of each resource uploaded to the bucket for `ckan`, as a
+    dict of "<resource id>/<filename>" -> (size, etag). read from the S3
+    Inventory report with manifest `inventory_path` if given, and otherwise
+    by listing the bucket
+    """
+    destination = determine_destination(ckan)
+    if destination is None:
+        return None
+    bucket, prefix = destination.split("/", 1)
+    prefix += "/resources/"
+    if inventory_path:
+        return load_inventory_index(inventory_path, prefix)
+    return list_object_index(bucket, prefix)
+
+
 def determine_destination(ckan):
     # TODO: there is no bucket for anything other than prod OR STAGING - however it's unclear whether this breaks in non-prod environments
     ## Test this by setting it to None or '' any that way we don't accidentally send data to a bucket that is inadvertently created in S3
@@ -386,63 +551,86 @@ def determine_destination(ckan):
     return destination
 
 
+def reupload_order_key(upload_order):
+    """
+    returns a sort key for (ckan_obj, legacy_url) tuples implementing `upload_order`,
+    or None if the queue should be uploaded in the order given. resources with an
+    unknown size sort as zero bytes.
+    """
+
+    def resource_size(tpl):
+        try:
+            return int(tpl[0].get("size") or 0)
+        except (TypeError, ValueError):
+            return 0
+
+    if upload_order == "largest":
+        return lambda tpl: -resource_size(tpl)
+    elif upload_order == "smallest":
+        return resource_size
+    return None
+
+
 def reupload_resources(
     ckan,
     to_reupload,
     shared_resources,
     auth,
-    write_reuploads_fn,
-    write_reuploads_interval,
+    journal=None,
+    num_threads=1,
+    upload_order=None,
+    upload_state=None,
 ):
+    """
+    upload `to_reupload` using `num_threads` concurrent transfers. `to_reupload` is
+    updated in place as uploads succeed, and each upload recorded in `journal` (a
+    ReuploadJournal) if given. resources sharing a file (by md5 and name) are
+    handled by a single worker, so each shared file is uploaded at most once.
+    if `upload_state` is given, failed uploads are kept there to be resumed.
+    """
+    # guards `to_reupload`
+    reuploads_lock = threading.Lock()
+
+    def remove_reupload(reupload_obj, legacy_url):
+        with reuploads_lock:
+            to_reupload.remove((reupload_obj, legacy_url))
+        if journal is not None:
+            journal.completed(reupload_obj["id"])
+
     def do_actual_upload(ckan, reupload_obj, legacy_url, destination, auth):
+        if journal is not None:
+            journal.started(reupload_obj["id"])
         try:
-            reupload_resource(ckan, reupload_obj, legacy_url, destination, auth)
+            reupload_resource(
+                ckan,
+                reupload_obj,
+                legacy_url,
+                destination,
+                auth,
+                upload_state=upload_state,
+            )
         except Exception as e:
             logger.error(e)
             logger.info("Resource failed to upload. Continuing...")
+            if journal is not None:
+                journal.failed(reupload_obj["id"], e)
         else:
-            to_reupload.remove((reupload_obj, legacy_url))
+            remove_reupload(reupload_obj, legacy_url)
             logger.info(
                 f"Resource successfully uploaded. Removed {reupload_obj} at {legacy_url} from reupload list..."
             )
         finally:
-            remaining_reuploads_count = len(to_reupload)
-            logger.info(
-                f"Resource Upload progress: {remaining_reuploads_count} out of {total_reuploads} to do."
-            )
-            # Only write to disk when interval counter reached
-            if (
-                write_reuploads_fn
-                and remaining_reuploads_count % int(write_reuploads_interval) == 0
-            ):
+            with reuploads_lock:
+                remaining_reuploads_count = len(to_reupload)
                 logger.info(
-                    f"Reached write reuploads interval: {write_reuploads_interval}"
+                    f"Resource Upload progress: {remaining_reuploads_count} out of {total_reuploads} to do."
                 )
-                write_reuploads_fn(to_reupload)
-
-    total_reuploads = len(to_reupload)
-    logger.info("The following files are ready to be re-uploaded:")
-    for reupload_obj in to_reupload:
-        logger.info(reupload_obj[0]["url"])
-    logger.info("Total of %d objects to be re-uploaded" % (total_reuploads))
-    destination = determine_destination(ckan)
 
-    # copy list and loop that, so can remove safely from original during loop
-    for indx, (reupload_obj, legacy_url) in enumerate(to_reupload[:]):
-        # first determine if this is a shared file.
-        # if it is, has it already been uploaded?
+    def upload_shared(shared_linkage, group):
+        # first determine if this shared file has already been uploaded.
         # if NOT, go off and upload it, and capture the necessary fields to reuse in our shared files list.
         # if so, don't upload it again, but we do need to update the url, size etc from uploaded version of the resource
-        # if its NOT a share resource, just upload as normal.
-        if "shared_file" in reupload_obj and reupload_obj["shared_file"]:
-            shared_linkage = reupload_obj["md5"] + "/" + reupload_obj["name"]
-            if shared_linkage not in shared_resources:
-                logger.error(
-                    "No shared resource on file for {}, resource {},  not uploading".format(
-                        shared_linkage, reupload_obj
-                    )
-                )
-                continue
+        for reupload_obj, legacy_url in group:
             uploaded_shared_resource = shared_resources[shared_linkage][0].get(
                 "uploaded_resource"
             )
@@ -462,26 +650,62 @@ def reupload_resources(
                 reupload_obj["size"] = uploaded_shared_resource["size"]
                 reupload_obj["url_type"] = ""  # explicitly NOT upload
                 ckan_method(ckan, "resource", "update")(**reupload_obj)
-                to_reupload.remove((reupload_obj, legacy_url))
+                remove_reupload(reupload_obj, legacy_url)
                 logger.info(
                     f"Shared resource not re-uploaded. Removed {reupload_obj} at {legacy_url} from reupload list..."
                 )
 
+    total_reuploads = len(to_reupload)
+    logger.info("The following files are ready to be re-uploaded:")
+    for reupload_obj in to_reupload:
+        logger.info(reupload_obj[0]["url"])
+    logger.info("Total of %d objects to be re-uploaded" % (total_reuploads))
+    destination = determine_destination(ckan)
+    if upload_state is not None and destination:
+        bucket, prefix = destination.split("/", 1)
+        upload_state.cleanup(bucket, prefix + "/resources/")
+
+    # copy list and schedule from that, so can remove safely from original during uploads
+    queue = to_reupload[:]
+    order_key = reupload_order_key(upload_order)
+    if order_key is not None:
+        queue.sort(key=order_key)
+        logger.info("Re-uploading %s files first" % (upload_order))
+
+    # each task is either a single resource, or all the queued resources sharing
+    # a file; the latter are uploaded in turn by the same worker
+    tasks = []
+    shared_groups = {}
+    for reupload_obj, legacy_url in queue:
+        if "shared_file" in reupload_obj and reupload_obj["shared_file"]:
+            shared_linkage = reupload_obj["md5"] + "/" + reupload_obj["name"]
+            if shared_linkage not in shared_resources:
+                logger.error(
+                    "No shared resource on file for {}, resource {},  not uploading".format(
+                        shared_linkage, reupload_obj
+                    )
+                )
+                continue
+            if shared_linkage not in shared_groups:
+                shared_groups[shared_linkage] = []
+                tasks.append(
+                    (upload_shared, shared_linkage, shared_groups[shared_linkage])
+                )
+            shared_groups[shared_linkage].append((reupload_obj, legacy_url))
         else:  # it's not a shared file, upload regardless.
-            do_actual_upload(ckan, reupload_obj, legacy_url, destination, auth)
-
-
-def write_reuploads(**kwargs):
-    if kwargs["write_reuploads"] and kwargs["reuploads_path"]:
-
-        def dump_reload(to_reupload):
-            with open(kwargs["reuploads_path"], "wb") as writer:
-                pickle.dump(to_reupload, writer)
-            logger.info(f"Reuploads disk cache write completed.")
+            tasks.append(
+                (do_actual_upload, ckan, reupload_obj, legacy_url, destination, auth)
+            )
 
-        return dump_reload
-    else:
-        logger.info("Reuploads write disabled.")
+    logger.info("Re-uploading with %d concurrent transfers" % (num_threads))
+    with ThreadPoolExecutor(max_workers=max(1, num_threads)) as executor:
+        futures = [executor.submit(*task) for task in tasks]
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                # a failure in one transfer shouldn't stop the others
+                logger.error("Re-upload task failed: {}".format(e))
 
 
 def sync_resources(
@@ -499,6 +723,7 @@ def sync_resources(
     **kwargs,
 ):
     logger.info("checking  %d resources for synch" % (len(resources)))
+    mirror = kwargs.get("ckan_mirror")
     reporting_interval = determine_reporting_interval(len(resources))
     resource_linkage_package_id = {}
     for package_obj in ckan_packages:
@@ -546,12 +771,18 @@ def sync_resources(
                 shared_linkage not in shared_resources
             ):  # we haven't seen this shared file before
                 shared_resources.setdefault(shared_linkage, []).append(
-                    {"uploaded_resource": get_uploaded_resource_from_ckan(ckan, obj)}
+                    {
+                        "uploaded_resource": get_uploaded_resource_from_ckan(
+                            ckan, obj, mirror=mirror
+                        )
+                    }
                 )
             else:
                 if shared_resources[shared_linkage][0].get("uploaded_resource") is None:
                     shared_resources[shared_linkage][0] = {
-                        "uploaded_resource": get_uploaded_resource_from_ckan(ckan, obj)
+                        "uploaded_resource": get_uploaded_resource_from_ckan(
+                            ckan, obj, mirror=mirror
+                        )
                     }
 
         resources_synched += 1
@@ -562,7 +793,9 @@ def sync_resources(
 
     if do_audit:
         logger.info("auditing all exising resources attached to packages")
-        audit_package_resources(ckan, ckan_packages)
+        audit_package_resources(
+            ckan, ckan_packages, manifest_path=kwargs.get("audit_manifest_path")
+        )
 
     if not do_resource_checks:
         logger.warning(
@@ -570,13 +803,21 @@ def sync_resources(
         )
         to_reupload = []
     elif kwargs["read_reuploads"]:
-        with open(kwargs["reuploads_path"], "rb") as reader:
-            to_reupload = pickle.load(reader)
-        logger.info(f"Reuploads disk cache read completed.")
+        to_reupload = ReuploadJournal(kwargs["reuploads_path"]).replay()
+        logger.info(f"Reuploads journal read completed.")
     else:
+        s3_index = None
+        if kwargs.get("s3_index"):
+            s3_index = build_s3_index(ckan, kwargs.get("s3_inventory_path"))
         # check all existing resources on all existing packages, in parallel
         to_reupload = check_package_resources(
-            ckan, ckan_packages, resource_id_legacy_url, auth
+            ckan,
+            ckan_packages,
+            resource_id_legacy_url,
+            auth,
+            listed_sizes=kwargs.get("legacy_listed_sizes"),
+            size_cache_path=kwargs.get("legacy_size_cache_path"),
+            s3_index=s3_index,
         )
 
     logger.info(
@@ -595,22 +836,42 @@ def sync_resources(
             package_resources,
             auth,
             do_delete,
+            mirror=mirror,
+            fingerprints=kwargs.get("fingerprints"),
         )
 
-    write_reuploads_fn = write_reuploads(**kwargs)
+    journal = None
+    if kwargs["write_reuploads"] and kwargs["reuploads_path"]:
+        # written afresh with the queue as it now stands, which also compacts
+        # the events of any earlier run
+        journal = ReuploadJournal(
+            kwargs["reuploads_path"],
+            sync_interval=kwargs.get("write_reuploads_interval"),
+        )
+        journal.reset(to_reupload)
+    else:
+        logger.info("Reuploads write disabled.")
+    upload_state = None
+    if kwargs.get("upload_state_path"):
+        upload_state = UploadStateStore(
+            kwargs["upload_state_path"],
+            max_age_days=kwargs.get("upload_state_max_age", 7),
+        )
     if do_uploads:
         reupload_resources(
             ckan,
             to_reupload,
             shared_resources,
             auth,
-            write_reuploads_fn,
-            kwargs.get("write_reuploads_interval"),
+            journal,
+            num_threads=num_threads,
+            upload_order=kwargs.get("upload_order"),
+            upload_state=upload_state,
         )
 
     logger.info(f"Post resource upload, resources remaining: {len(to_reupload)}")
-    if write_reuploads_fn:
-        write_reuploads_fn(to_reupload)
+    if journal is not None:
+        journal.close()
 
 
 def sync_metadata(
@@ -656,6 +917,16 @@ def sync_metadata(
 
     resources = meta.get_resources()
 
+    fingerprints = None
+    if kwargs.get("fingerprints_path"):
+        fingerprints = FingerprintStore(
+            kwargs["fingerprints_path"],
+            ckan,
+            meta.ckan_data_type,
+            force_full_compare=kwargs.get("force_full_compare", False),
+            full_compare_days=kwargs.get("full_compare_days", 7),
+        )
+
     raw_resources_metadata = build_raw_resources_as_file(
         logger, ckan, meta, packages, resources
     )
@@ -669,6 +940,9 @@ def sync_metadata(
         do_delete,
         do_single_ticket,
         do_audit,
+        mirror=kwargs.get("ckan_mirror"),
+        fingerprints=fingerprints,
+        num_threads=kwargs.get("package_threads", 1),
     )
     sync_resources(
         ckan,
@@ -682,8 +956,11 @@ def sync_metadata(
         do_delete,
         do_single_ticket,
         do_audit,
+        fingerprints=fingerprints,
         **kwargs,
     )
+    if fingerprints is not None:
+        fingerprints.save(complete=do_single_ticket is None)
 
 
 def sync_child_organizations(ckan, project_info):
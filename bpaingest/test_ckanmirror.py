@@ -0,0 +1,47 @@
+from . import test_pkgcache
+from .ckanmirror import CKANMirror, solr_timestamp
+
+
+class FakeCKAN(test_pkgcache.FakeCKAN):
+    def put(self, package_id, modified):
+        self.action.packages[package_id] = {
+            "id": package_id,
+            "type": "amd-amplicon",
+            "metadata_modified": "2024-01-0{}T00:00:00.123456".format(modified),
+            "resources": [{"id": package_id + "-r", "url_type": "upload"}],
+        }
+
+
+def test_solr_timestamp():
+    assert solr_timestamp("2024-01-01T02:03:04.123456") == "2024-01-01T02:03:04.123Z"
+    assert solr_timestamp("2024-01-01T02:03:04") == "2024-01-01T02:03:04Z"
+
+
+def test_ckan_mirror_incremental_refresh(tmp_path):
+    ckan = FakeCKAN()
+    for package_id, modified in (("a", 1), ("b", 1), ("c", 2)):
+        ckan.put(package_id, modified)
+    mirror = CKANMirror(ckan, str(tmp_path))
+    mirror.refresh("amd-amplicon")
+    assert ckan.action.fetched == ["a", "b", "c"]
+    mirror.close()
+
+    # a later run only retrieves what changed
+    ckan.action.fetched = []
+    ckan.put("b", 3)
+    ckan.put("d", 4)
+    del ckan.action.packages["c"]
+    mirror = CKANMirror(ckan, str(tmp_path))
+    mirror.refresh("amd-amplicon")
+    assert sorted(ckan.action.fetched) == ["b", "d"]
+    assert [t["id"] for t in mirror.packages("amd-amplicon")] == ["a", "b", "d"]
+    assert mirror.show_package("b") == ckan.action.packages["b"]
+    assert mirror.show_package("c") is None
+    assert mirror.show_resource("d-r") == {"id": "d-r", "url_type": "upload"}
+    assert mirror.show_resource("c-r") is None
+
+    package = dict(ckan.action.packages["a"], resources=[])
+    mirror.update(package)
+    assert mirror.show_package("a") == package
+    assert mirror.show_resource("a-r") is None
+    mirror.close()
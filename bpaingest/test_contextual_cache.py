@@ -0,0 +1,88 @@
+import re
+
+from . import contextual_cache
+from .contextual_cache import (
+    ContextualCache,
+    clear_contextual_cache,
+    contextual_cache_key,
+)
+from .util import make_logger
+
+
+logger = make_logger(__name__)
+
+
+class CountingContextual:
+    metadata_patterns = [re.compile(r"^.*\.xlsx$")]
+    parsed = 0
+
+    def __init__(self, logger, path):
+        CountingContextual.parsed += 1
+        self._logger = logger
+        self.path_dir = path
+        self.source_path = str(path) + "/context.xlsx"
+        with open(self.source_path) as fd:
+            self.metadata = fd.read()
+
+
+def write_context(path, contents):
+    path.mkdir(exist_ok=True)
+    (path / "context.xlsx").write_text(contents)
+    (path / "ignored.txt").write_text(str(path))
+
+
+def test_contextual_cache(tmp_path):
+    clear_contextual_cache()
+    CountingContextual.parsed = 0
+    for slug in ("one", "two"):
+        write_context(tmp_path / slug, "metadata")
+
+    cache = ContextualCache(logger)
+    one = cache.get(CountingContextual, str(tmp_path / "one"))
+    two = cache.get(CountingContextual, str(tmp_path / "two"))
+    assert CountingContextual.parsed == 1
+    assert two.metadata == one.metadata == "metadata"
+    assert two.path_dir == str(tmp_path / "two")
+    assert two.source_path == str(tmp_path / "two" / "context.xlsx")
+
+    write_context(tmp_path / "two", "changed")
+    assert cache.get(CountingContextual, str(tmp_path / "two")).metadata == "changed"
+    assert CountingContextual.parsed == 2
+
+
+def test_contextual_cache_on_disk(tmp_path):
+    clear_contextual_cache()
+    CountingContextual.parsed = 0
+    write_context(tmp_path / "one", "metadata")
+    cache_path = str(tmp_path / "cache")
+
+    ContextualCache(logger, cache_path).get(CountingContextual, str(tmp_path / "one"))
+    # as if in a new process
+    clear_contextual_cache()
+    contextual = ContextualCache(logger, cache_path).get(
+        CountingContextual, str(tmp_path / "one")
+    )
+    assert CountingContextual.parsed == 1
+    assert contextual.metadata == "metadata"
+
+
+def test_contextual_cache_key_covers_package(tmp_path, monkeypatch):
+    write_context(tmp_path / "one", "metadata")
+    key = contextual_cache_key(CountingContextual, str(tmp_path / "one"))
+
+    # a change to any module of the package, not just those defining the class
+    # (the digest of the installed package is computed once per process)
+    package_digest = contextual_cache._package_digest.__wrapped__
+    package = tmp_path / "package"
+    (package / "libs").mkdir(parents=True)
+    (package / "libs" / "ingest_utils.py").write_text("def helper(): pass\n")
+    before = package_digest(str(package))
+    (package / "libs" / "ingest_utils.py").write_text("def helper(): return 1\n")
+    after = package_digest(str(package))
+    assert before != after
+
+    monkeypatch.setattr(contextual_cache, "_package_digest", lambda: after)
+    changed = contextual_cache_key(CountingContextual, str(tmp_path / "one"))
+    assert changed != key
+    monkeypatch.setattr(contextual_cache, "_package_digest", lambda: before)
+    assert changed != contextual_cache_key(CountingContextual, str(tmp_path / "one"))
@@ -0,0 +1,144 @@
+import argparse
+import json
+import os
+import time
+
+from . import dump
+from .state import read_state, read_state_data_type
+
+
+class FakeMeta:
+    resource_linkage = ("sample_id",)
+
+
+def fake_dump_slug_state(class_info, options):
+    # two slugs of each data type, with interleaved ids
+    n = int(class_info["slug"][-1])
+    data_type = "type-{}".format(n % 2)
+    packages = [{"id": "p{}-{}".format(i, n), "sample_id": str(n)} for i in (2, 1)]
+    resources = [
+        (
+            (str(n),),
+            "https://example.com/{}/{}.fastq.gz".format(n, i),
+            {"id": "r{}-{}".format(i, n)},
+        )
+        for i in (2, 1)
+    ]
+    return data_type, FakeMeta(), packages, resources, ("user", class_info["slug"])
+
+
+def concurrent_dump_slug_state(class_info, options):
+    # wait for a slug of the other data type to start, noting if one did
+    n = int(class_info["slug"][-1])
+    path = options["download_path"]
+    open(os.path.join(path, "started-{}".format(n % 2)), "a").close()
+    other = os.path.join(path, "started-{}".format(1 - n % 2))
+    deadline = time.monotonic() + 10
+    while not os.path.exists(other) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    if os.path.exists(other):
+        open(os.path.join(path, "overlap-{}".format(n)), "a").close()
+    return fake_dump_slug_state(class_info, options)
+
+
+class FakeType0:
+    ckan_data_type = "type-0"
+
+
+class FakeType1:
+    ckan_data_type = "type-1"
+
+
+class FakeProjectInfo:
+    metadata_info = [
+        {
+            "project": "fake",
+            "slug": "slug{}".format(n),
+            "cls": FakeType1 if n % 2 else FakeType0,
+        }
+        for n in (3, 1, 4, 2)
+    ]
+
+
+def patch_dump(monkeypatch):
+    monkeypatch.setattr(dump, "ProjectInfo", FakeProjectInfo)
+    monkeypatch.setattr(dump, "dump_slug_state", fake_dump_slug_state)
+    monkeypatch.setattr(dump, "make_ckan_api", lambda args: None)
+    monkeypatch.setattr(dump, "build_raw_resources_from_state_as_file", lambda *a: None)
+    monkeypatch.setattr(dump, "validate_raw_resources_from_state", lambda *a: None)
+
+
+def dump_args(tmp_path, filename, jobs=1, format="json"):
+    return argparse.Namespace(
+        filename=str(tmp_path / filename),
+        log_level="INFO",
+        dump_re="",
+        sql_context=None,
+        validate_schema=None,
+        sql_context_excel_copy=None,
+        download_path=str(tmp_path),
+        incremental_fetch=False,
+        contextual_cache=None,
+        jobs=jobs,
+        format=format,
+    )
+
+
+def test_dump_state_jobs_matches_serial(tmp_path, monkeypatch):
+    patch_dump(monkeypatch)
+    errors = {}
+    for jobs in (1, 2):
+        monkeypatch.setattr(
+            dump,
+            "linkage_qc",
+            lambda logger, state, data_type_meta: errors.setdefault(
+                jobs, sorted(data_type_meta)
+            ),
+        )
+        dump.dump_state(dump_args(tmp_path, "state-{}.json".format(jobs), jobs))
+
+    with open(tmp_path / "state-1.json") as fd:
+        serial = json.load(fd)
+    with open(tmp_path / "state-2.json") as fd:
+        parallel = json.load(fd)
+    assert parallel == serial
+    assert errors[1] == errors[2] == ["type-0", "type-1"]
+    assert [t["id"] for t in serial["type-0"]["packages"]] == [
+        "p1-2",
+        "p1-4",
+        "p2-2",
+        "p2-4",
+    ]
+    assert serial["type-1"]["auth"] == ["user", "slug3"]
+
+
+def test_dump_state_ndjson(tmp_path, monkeypatch):
+    patch_dump(monkeypatch)
+    monkeypatch.setattr(dump, "linkage_qc", lambda *a: None)
+    dump.dump_state(dump_args(tmp_path, "state.json"))
+    dump.dump_state(dump_args(tmp_path, "state.ndjson", format="ndjson"))
+
+    with open(tmp_path / "state.json") as fd:
+        state = json.load(fd)
+    for data_type in state:
+        state[data_type].setdefault("raw_resources_files", [])
+    assert read_state(tmp_path / "state.ndjson") == state
+    assert read_state_data_type(tmp_path / "state.ndjson", "type-1") == state["type-1"]
+
+
+def test_dump_state_ndjson_jobs(tmp_path, monkeypatch):
+    patch_dump(monkeypatch)
+    monkeypatch.setattr(dump, "linkage_qc", lambda *a: None)
+    dump.dump_state(dump_args(tmp_path, "state.ndjson", format="ndjson"))
+    serial = read_state(tmp_path / "state.ndjson")
+
+    # the slugs of both data types are generated at once
+    monkeypatch.setattr(dump, "dump_slug_state", concurrent_dump_slug_state)
+    dump.dump_state(dump_args(tmp_path, "state-4.ndjson", jobs=4, format="ndjson"))
+    assert sorted(t for t in os.listdir(tmp_path) if t.startswith("overlap-")) == [
+        "overlap-1",
+        "overlap-2",
+        "overlap-3",
+        "overlap-4",
+    ]
+    assert read_state(tmp_path / "state-4.ndjson") == serial
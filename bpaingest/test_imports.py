@@ -0,0 +1,68 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+# the budget for importing the CLI, in milliseconds. wall-clock time varies too
+# much between machines to check by default: set BPAINGEST_IMPORT_BUDGET_MS to
+# run test_cli_import_time
+IMPORT_BUDGET_MS = os.environ.get("BPAINGEST_IMPORT_BUDGET_MS")
+# imported at first use, rather than when the CLI starts
+DEFERRED = ("boto3", "botocore.config", "pandas", "bs4", "openpyxl", "deepdiff")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def cli_import_time():
+    "cumulative time in milliseconds to import bpaingest.cli, per -X importtime"
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import bpaingest.cli"],
+        cwd=ROOT,
+        stderr=subprocess.PIPE,
+        check=True,
+    ).stderr.decode("utf8")
+    return parse_import_time(output, "bpaingest.cli")
+
+
+def parse_import_time(output, module):
+    "cumulative time in milliseconds to import `module`, from -X importtime output"
+    for line in output.splitlines():
+        # other output, such as warnings, may be interleaved with the timings
+        fields = line.split("|")
+        if len(fields) != 3 or not line.startswith("import time:"):
+            continue
+        _, cumulative, name = fields
+        if name.strip() == module:
+            return int(cumulative) / 1000
+    raise AssertionError("{} not imported:\n{}".format(module, output))
+
+
+@pytest.mark.skipif(
+    IMPORT_BUDGET_MS is None, reason="BPAINGEST_IMPORT_BUDGET_MS is not set"
+)
+def test_cli_import_time():
+    # the first run may be compiling bytecode; take the best of several
+    elapsed = min(cli_import_time() for _ in range(3))
+    message = "importing bpaingest.cli took {:.0f}ms".format(elapsed)
+    assert elapsed <= int(IMPORT_BUDGET_MS), message
+
+
+def test_parse_import_time():
+    output = "\n".join(
+        [
+            "import time: self [us] | cumulative | imported package",
+            "import time:       120 |        120 |   bpaingest.util",
+            "/x/y.py:3: SyntaxWarning: invalid escape sequence '\\|'",
+            '  re.compile("a|b|c")',
+            "import time:       310 |       1500 | bpaingest.cli",
+        ]
+    )
+    assert parse_import_time(output, "bpaingest.cli") == 1.5
+
+
+def test_cli_defers_heavy_imports():
+    code = "import sys, bpaingest.cli; print(' '.join(sys.modules))"
+    output = subprocess.check_output([sys.executable, "-c", code], cwd=ROOT)
+    modules = set(output.decode("utf8").split())
+    assert [t for t in DEFERRED if t in modules] == []
@@ -0,0 +1,143 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import ckanapi
+import pytest
+
+from . import ops
+from .ops import diff_objects, object_fingerprint
+
+
+CKAN_OBJ = {
+    "id": "102.100.100/1",
+    "name": "bpa-amd-1",
+    "sample_volume": "1.5",
+    "tags": [{"name": "b"}, {"name": "a"}],
+    "notes": "unchanged",
+}
+
+
+def test_diff_objects_unchanged():
+    assert not diff_objects(dict(CKAN_OBJ), CKAN_OBJ, "package")
+    # co-erced to string, and lists compared irrespective of order
+    patch = {"sample_volume": 1.5, "tags": [{"name": "a"}, {"name": "b"}]}
+    assert not diff_objects(patch, CKAN_OBJ, "package")
+
+
+def test_diff_objects_changed():
+    assert diff_objects({"notes": "changed"}, CKAN_OBJ, "package")
+    assert diff_objects({"tags": [{"name": "a"}]}, CKAN_OBJ, "package")
+    assert diff_objects({"missing": ""}, CKAN_OBJ, "package")
+    assert not diff_objects(
+        {"notes": "changed"}, CKAN_OBJ, "package", skip_differences=("notes",)
+    )
+
+
+def test_object_fingerprint():
+    keys = ("sample_volume", "tags")
+    patch = {"sample_volume": 1.5, "tags": [{"name": "a"}, {"name": "b"}]}
+    assert object_fingerprint(patch, keys) == object_fingerprint(CKAN_OBJ, keys)
+    assert object_fingerprint({"sample_volume": 2}, keys) != object_fingerprint(
+        CKAN_OBJ, keys
+    )
+
+
+def test_retry_ckan_call(monkeypatch):
+    delays = []
+    monkeypatch.setattr(ops.time, "sleep", delays.append)
+    calls = []
+
+    def flaky(**kwargs):
+        calls.append(kwargs)
+        if len(calls) < 3:
+            raise ckanapi.errors.CKANAPIError("unavailable")
+        return "patched"
+
+    assert ops.retry_ckan_call("ckan patch", flaky, id="1") == "patched"
+    assert calls == [{"id": "1"}] * 3
+    assert delays == [ops.CKAN_RETRY_BACKOFF, ops.CKAN_RETRY_BACKOFF * 2]
+
+    def failing(**kwargs):
+        raise ckanapi.errors.CKANAPIError("unavailable")
+
+    with pytest.raises(ckanapi.errors.CKANAPIError):
+        ops.retry_ckan_call("ckan patch", failing)
+
+
+def test_rate_limiter(monkeypatch):
+    now = [100.0]
+    delays = []
+
+    def fake_sleep(delay):
+        delays.append(delay)
+        now[0] += delay
+
+    monkeypatch.setattr(ops.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(ops.time, "sleep", fake_sleep)
+    limiter = ops.RateLimiter(4)
+    for _ in range(5):
+        limiter.wait()
+    assert delays == [0.25] * 4
+
+
+class ArchiveHandler(BaseHTTPRequestHandler):
+    # a symlink in the archive, served as a redirect
+    files = {"/a.bam": 1234, "/b.bam": 99}
+    heads = []
+
+    def do_HEAD(self):
+        ArchiveHandler.heads.append(self.path)
+        if self.path == "/link.bam":
+            self.send_response(302)
+            self.send_header("Location", "/a.bam")
+            self.send_header("Content-Length", "0")
+        elif self.path in self.files:
+            self.send_response(200)
+            self.send_header("Content-Length", str(self.files[self.path]))
+        else:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def test_prefetch_legacy_sizes(tmp_path):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ArchiveHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = "http://127.0.0.1:{}/".format(server.server_port)
+    urls = [url + t for t in ("link.bam", "b.bam", "c.bam", "listed%20file.bam")]
+    cache_path = str(tmp_path / "legacy-sizes.json")
+    try:
+        info = ops.ApacheArchiveInfo(("u", "p"), maxsize=4)
+        info.prefetch_sizes(urls, 4, listed_sizes={url + "listed file.bam": 7})
+        assert sorted(ArchiveHandler.heads) == [
+            "/a.bam",
+            "/b.bam",
+            "/c.bam",
+            "/link.bam",
+        ]
+        assert [info.get_size(t) for t in urls[:2]] == [1234, 99]
+        assert info.get_size(urls[3]) == 7
+        info.save_sizes(cache_path)
+
+        # sizes found by HEAD are kept for later runs
+        ArchiveHandler.heads = []
+        info = ops.ApacheArchiveInfo(("u", "p"))
+        info.load_sizes(cache_path)
+        info.prefetch_sizes(urls[:2], 4)
+        assert ArchiveHandler.heads == []
+        assert info.get_size(urls[0]) == 1234
+    finally:
+        server.shutdown()
+
+
+def test_ckan_archive_info_s3_index():
+    class FakeCKAN:
+        address = "https://data.bioplatforms.com"
+        apikey = "secret"
+
+    info = ops.CKANArchiveInfo(FakeCKAN(), s3_index={"r1/a_b.bam": (4, "abc-2")})
+    url = "https://data.bioplatforms.com/dataset/p1/resource/r1/download/a_b.bam"
+    assert info.get_size_and_etag(url) == (4, "abc-2")
@@ -0,0 +1,77 @@
+import re
+
+from . import pkgcache
+
+
+class FakeAction:
+    """
+    package_search over `packages`, supporting the metadata_modified filter
+    (fq) and field list (fl) used by the CKAN mirror. each call is kept in
+    `calls`, and the ids of packages retrieved in full in `fetched`
+    """
+
+    def __init__(self, packages=()):
+        self.packages = {t["id"]: t for t in packages}
+        self.calls = []
+        self.fetched = []
+
+    def package_search(self, q, include_private, sort, rows, start, fq=None, fl=None):
+        assert sort == "id asc"
+        self.calls.append((q, start))
+        typ = q.split(":", 1)[1]
+        matches = sorted(
+            (t for t in self.packages.values() if t["type"] == typ),
+            key=lambda t: t["id"],
+        )
+        if fq is not None:
+            since = re.match(r"metadata_modified:\[(.*)Z TO \*\]$", fq).group(1)
+            matches = [t for t in matches if t["metadata_modified"] >= since]
+        page = matches[start : start + rows]
+        if fl is not None:
+            page = [{k: t[k] for k in fl.split(",")} for t in page]
+        else:
+            self.fetched += [t["id"] for t in page]
+        return {"count": len(matches), "results": page}
+
+
+class FakeCKAN:
+    address = "https://data.bioplatforms.com"
+
+    def __init__(self, packages=()):
+        self.action = FakeAction(packages)
+
+
+def make_package(i, typ):
+    return {
+        "id": "{}-{:03d}".format(typ, i),
+        "type": typ,
+        "tags": [{"name": "tag"}],
+        "resources": [{"id": "{}-{:03d}-{}".format(typ, i, j)} for j in range(2)],
+    }
+
+
+def test_build_package_cache_paginates(monkeypatch):
+    monkeypatch.setattr(pkgcache, "SEARCH_PAGE_SIZE", 7)
+    packages = [make_package(i, "amd-amplicon") for i in range(50)]
+    packages += [make_package(i, "amd-metagenomics") for i in range(3)]
+    ckan = FakeCKAN(packages)
+
+    cache = pkgcache.build_package_cache(
+        ckan, "amd-amplicon", [{"type": "amd-metagenomics"}]
+    )
+    # eight pages of amplicons, one of metagenomics
+    assert len(ckan.action.calls) == 9
+    assert sorted(cache) == sorted(t["id"] for t in packages)
+    assert cache["amd-amplicon-042"] == packages[42]
+    assert cache.get("missing") is None
+    summary = cache.summary("amd-amplicon-042")
+    assert "resources" not in summary
+    assert summary.copy()["resources"] == packages[42]["resources"]
+
+
+def test_build_resource_cache():
+    packages = [make_package(i, "amd-amplicon") for i in range(5)]
+    cache = pkgcache.build_resource_cache(FakeCKAN(packages), "amd-amplicon", [])
+    assert len(cache) == 10
+    assert cache["amd-amplicon-003-1"] == {"id": "amd-amplicon-003-1"}
+    assert cache.get("amd-amplicon-005-0") is None
@@ -0,0 +1,59 @@
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+
+from .reuploads import LEGACY_DUMP, ReuploadJournal
+
+
+def queue(n):
+    return [({"id": str(i), "url": ""}, "legacy/{}".format(i)) for i in range(n)]
+
+
+def test_journal_replay(tmp_path):
+    path = str(tmp_path / "reupload_resources.jsonl")
+    journal = ReuploadJournal(path, sync_interval=10)
+    journal.reset(queue(100))
+
+    def upload(i):
+        journal.started(str(i))
+        if i % 10 == 0:
+            journal.failed(str(i), Exception("connection reset"))
+        elif i % 10 != 1:
+            journal.completed(str(i))
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(upload, range(100)))
+    journal.close()
+    # a crash part way through writing an event
+    with open(path, "a") as fd:
+        fd.write('{"event":"comp')
+
+    remaining = ReuploadJournal(path).replay()
+    # failed and interrupted uploads remain, in the order queued
+    assert [obj["id"] for obj, _ in remaining] == [
+        str(i) for i in range(100) if i % 10 in (0, 1)
+    ]
+    assert remaining[1] == ({"id": "1", "url": ""}, "legacy/1")
+
+    # compaction leaves only the remaining queue
+    journal = ReuploadJournal(path)
+    journal.reset(remaining)
+    journal.close()
+    with open(path) as fd:
+        assert len(fd.readlines()) == 20
+    assert ReuploadJournal(path).replay() == remaining
+
+
+def test_journal_missing(tmp_path):
+    assert ReuploadJournal(str(tmp_path / "missing.jsonl")).replay() == []
+
+
+def test_journal_imports_legacy_dump(tmp_path):
+    with open(str(tmp_path / LEGACY_DUMP), "wb") as fd:
+        pickle.dump(queue(3), fd)
+    path = str(tmp_path / "reupload_resources.jsonl")
+    assert ReuploadJournal(path).replay() == queue(3)
+
+    # imported once: the journal then takes precedence
+    with open(path, "a") as fd:
+        fd.write('{"event":"completed","id":"0"}\n')
+    assert ReuploadJournal(path).replay() == queue(3)[1:]
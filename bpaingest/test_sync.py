@@ -0,0 +1,300 @@
+import random
+import time
+
+import botocore.exceptions
+import pytest
+
+from . import sync
+from .libs import s3
+from .fingerprints import FingerprintStore
+from .libs.bpa_constants import AUDIT_DELETED
+from .pkgcache import PackageIndex
+
+
+class FakeCKAN:
+    address = "https://data.bioplatforms.com"
+    apikey = "secret"
+
+
+def test_check_resources_preserves_order(monkeypatch):
+    def fake_check_resource(
+        ckan_archive_info, apache_archive_info, current_url, legacy_url, etags
+    ):
+        # jitter so that workers complete out of submission order
+        time.sleep(random.random() / 100)
+        if int(current_url.rsplit("/", 1)[-1]) % 3 == 0:
+            return "wrong-size"
+        return None
+
+    monkeypatch.setattr(sync, "check_resource", fake_check_resource)
+    resources = [
+        {"id": str(i), "url": "https://data.bioplatforms.com/r/{}".format(i)}
+        for i in range(50)
+    ]
+    legacy = {str(i): "https://downloads/{}".format(i) for i in range(50)}
+    listed_sizes = {url: 1024 for url in legacy.values()}
+    to_reupload = sync.check_resources(
+        FakeCKAN(), resources, legacy, ("u", "p"), 8, listed_sizes=listed_sizes
+    )
+    assert [obj["id"] for obj, _ in to_reupload] == [
+        str(i) for i in range(50) if i % 3 == 0
+    ]
+    assert all(legacy[obj["id"]] == url for obj, url in to_reupload)
+
+
+def test_reupload_resources_shared_file_uploaded_once(monkeypatch):
+    uploaded = []
+    updated = []
+
+    def fake_reupload_resource(
+        ckan, ckan_obj, legacy_url, destination, auth, upload_state=None
+    ):
+        time.sleep(random.random() / 100)
+        uploaded.append(ckan_obj["id"])
+
+    def fake_get_or_create_resource(ckan, obj):
+        return dict(obj, url="https://data.bioplatforms.com/shared", size="5")
+
+    def fake_ckan_method(ckan, object_type, method):
+        return lambda **obj: updated.append(obj["id"])
+
+    monkeypatch.setattr(sync, "reupload_resource", fake_reupload_resource)
+    monkeypatch.setattr(sync, "get_or_create_resource", fake_get_or_create_resource)
+    monkeypatch.setattr(sync, "ckan_method", fake_ckan_method)
+
+    to_reupload = [
+        ({"id": "plain-{}".format(i), "url": "", "size": str(i)}, "legacy")
+        for i in range(10)
+    ]
+    to_reupload += [
+        (
+            {
+                "id": "shared-{}".format(i),
+                "url": "",
+                "shared_file": True,
+                "md5": "abc",
+                "name": "x.md5",
+            },
+            "legacy",
+        )
+        for i in range(5)
+    ]
+    shared_resources = {"abc/x.md5": [{"uploaded_resource": None}]}
+    sync.reupload_resources(
+        FakeCKAN(),
+        to_reupload,
+        shared_resources,
+        None,
+        None,
+        num_threads=4,
+        upload_order="largest",
+    )
+    assert to_reupload == []
+    assert sorted(uploaded) == sorted(
+        ["plain-{}".format(i) for i in range(10)] + ["shared-0"]
+    )
+    assert sorted(updated) == ["shared-{}".format(i) for i in range(1, 5)]
+
+
+def test_reupload_order_key():
+    queue = [({"size": "10"}, 1), ({"size": None}, 2), ({"size": "300"}, 3)]
+    assert [t[1] for t in sorted(queue, key=sync.reupload_order_key("largest"))] == [
+        3,
+        1,
+        2,
+    ]
+    assert [t[1] for t in sorted(queue, key=sync.reupload_order_key("smallest"))] == [
+        2,
+        1,
+        3,
+    ]
+    assert sync.reupload_order_key("listed") is None
+
+
+def package_index(packages):
+    index = PackageIndex()
+    for package in packages:
+        index.add(package)
+    return index
+
+
+def test_sync_packages_skips_unchanged(tmp_path, monkeypatch):
+    synced = []
+
+    def fake_sync_package(ckan, obj, cached_obj, mirror=None):
+        synced.append(obj["id"])
+        return obj
+
+    packages = [
+        {"id": str(i), "name": "bpa-{}".format(i), "type": "amd-amplicon"}
+        for i in range(5)
+    ]
+    monkeypatch.setattr(sync, "sync_package", fake_sync_package)
+    monkeypatch.setattr(
+        sync, "build_package_cache", lambda *args, **kwargs: package_index(packages)
+    )
+
+    def run(**kwargs):
+        del synced[:]
+        fingerprints = FingerprintStore(
+            str(tmp_path), FakeCKAN(), "amd-amplicon", **kwargs
+        )
+        ckan_packages = sync.sync_packages(
+            FakeCKAN(),
+            "amd-amplicon",
+            packages,
+            {"id": "org"},
+            None,
+            False,
+            None,
+            False,
+            fingerprints=fingerprints,
+        )
+        fingerprints.save(complete=True)
+        return sorted(t["id"] for t in ckan_packages)
+
+    assert run() == ["0", "1", "2", "3", "4"]
+    assert synced == ["0", "1", "2", "3", "4"]
+    # skipped packages are still handed back, as found in CKAN
+    assert run() == ["0", "1", "2", "3", "4"]
+    assert synced == []
+    packages[2] = dict(packages[2], title="changed")
+    run()
+    assert synced == ["2"]
+    run(force_full_compare=True)
+    assert synced == ["0", "1", "2", "3", "4"]
+    # periodic full comparison
+    run(full_compare_days=-1)
+    assert synced == ["0", "1", "2", "3", "4"]
+
+
+def test_sync_packages_concurrent_order(monkeypatch):
+    def fake_sync_package(ckan, obj, cached_obj, mirror=None):
+        time.sleep(random.random() / 100)
+        return dict(obj, synced=True)
+
+    packages = [
+        {"id": str(i), "name": "bpa-{:02d}".format(i), "type": "amd-amplicon"}
+        for i in random.sample(range(40), 40)
+    ]
+    monkeypatch.setattr(sync, "sync_package", fake_sync_package)
+    monkeypatch.setattr(
+        sync, "build_package_cache", lambda *args, **kwargs: PackageIndex()
+    )
+    ckan_packages = sync.sync_packages(
+        FakeCKAN(),
+        "amd-amplicon",
+        packages,
+        {"id": "org"},
+        None,
+        False,
+        None,
+        False,
+        num_threads=8,
+    )
+    assert [t["name"] for t in ckan_packages] == sorted(t["name"] for t in packages)
+    assert all(t["synced"] and t["owner_org"] == "org" for t in ckan_packages)
+
+
+def test_sync_packages_compares_without_resources(monkeypatch):
+    packages = [
+        {"id": str(i), "name": "bpa-{}".format(i), "type": "amd-amplicon"}
+        for i in range(3)
+    ]
+    index = package_index(
+        dict(t, owner_org="org", tags=[], resources=[{"id": "r" + t["id"]}])
+        for t in packages
+    )
+    decoded = []
+    index_resources = index.resources
+
+    def resources(package_id):
+        decoded.append(package_id)
+        return index_resources(package_id)
+
+    monkeypatch.setattr(index, "resources", resources)
+    monkeypatch.setattr(sync, "build_package_cache", lambda *args, **kwargs: index)
+    ckan_packages = sync.sync_packages(
+        FakeCKAN(), "amd-amplicon", packages, {"id": "org"}, None, False, None, False
+    )
+    # unchanged, so neither patched nor their resources decoded
+    assert decoded == []
+    # the resources are there for the resources sync
+    assert ckan_packages[1]["resources"] == [{"id": "r1"}]
+    assert decoded == ["1"]
+
+
+def test_sync_package_resources_tags_deleted_together(monkeypatch):
+    events = []
+
+    class FakeAction:
+        def resource_delete(self, id):
+            events.append(("delete", id))
+
+        def package_show(self, id):
+            return {"id": id, "resources": []}
+
+    ckan = FakeCKAN()
+    ckan.action = FakeAction()
+    monkeypatch.setattr(
+        sync,
+        "tag_resources",
+        lambda ckan, resource_objs, audit_tag, description: events.append(
+            ("tag", [t["id"] for t in resource_objs], audit_tag)
+        ),
+    )
+    package_obj = {
+        "id": "p",
+        "resources": [{"id": str(i), "package_id": "p"} for i in range(3)],
+    }
+    sync.sync_package_resources(ckan, package_obj, {}, [], None, True)
+    # the objects are tagged in one batch, before the resources are deleted
+    assert events[0] == ("tag", ["0", "1", "2"], AUDIT_DELETED)
+    assert sorted(events[1:]) == [("delete", "0"), ("delete", "1"), ("delete", "2")]
+
+    del events[:]
+    sync.sync_package_resources(ckan, package_obj, {}, [], None, False)
+    assert events == []
+
+
+def test_tag_resources_continues_past_errors(monkeypatch):
+    mock_aws = pytest.importorskip("moto").mock_aws
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setattr(s3, "_s3", None)
+    with mock_aws():
+        client = s3.get_s3_client()
+        client.create_bucket(Bucket="bpa-ckan-test")
+        keys = ["resources/{}/file.fastq.gz".format(i) for i in range(4)]
+        for key in keys:
+            client.put_object(Bucket="bpa-ckan-test", Key=key, Body=b"data")
+
+        get_object_tagging = client.get_object_tagging
+
+        def denied_for_one_key(**kwargs):
+            if kwargs["Key"] == keys[1]:
+                raise botocore.exceptions.ClientError(
+                    {"Error": {"Code": "AccessDenied", "Message": "Access Denied"}},
+                    "GetObjectTagging",
+                )
+            return get_object_tagging(**kwargs)
+
+        monkeypatch.setattr(client, "get_object_tagging", denied_for_one_key)
+        monkeypatch.setattr(sync, "determine_destination", lambda ckan: "bucket")
+        monkeypatch.setattr(
+            sync,
+            "resource_s3_object",
+            lambda ckan, obj, destination=None: ("bpa-ckan-test", obj["key"]),
+        )
+        plan = s3.plan_tag_changes(
+            [("bpa-ckan-test", t) for t in keys], {"audit": "deleted"}
+        )
+        assert plan.failed == [("bpa-ckan-test", keys[1])]
+        assert len(plan.changes) == 3
+
+        sync.tag_resources(FakeCKAN(), [{"key": t} for t in keys], "deleted", "deleted")
+        for key in keys[:1] + keys[2:]:
+            assert get_object_tagging(Bucket="bpa-ckan-test", Key=key)["TagSet"] == [
+                {"Key": "audit", "Value": "deleted"}
+            ]
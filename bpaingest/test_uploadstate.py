@@ -0,0 +1,97 @@
+import hashlib
+import os
+
+import pytest
+
+from .libs import s3, transfer
+from .uploadstate import UploadStateStore
+
+
+PART_SIZE = 8 * (1 << 20)
+BUCKET = "bpa-ckan-test"
+KEY = "prefix/resources/1/file.bam"
+
+
+class FlakySource:
+    def __init__(self, data):
+        self.data = data
+        self.fail_at = None
+        self.reads = []
+
+    def size(self):
+        return len(self.data)
+
+    def read(self, start, length):
+        self.reads.append(start)
+        if start == self.fail_at:
+            raise IOError("connection reset")
+        return self.data[start : start + length]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    mock_aws = pytest.importorskip("moto").mock_aws
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setattr(s3, "_s3", None)
+    monkeypatch.setattr(transfer, "PART_ATTEMPTS", 1)
+    with mock_aws():
+        client = s3.get_s3_client()
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+def test_upload_resumed_from_state(tmp_path, client, monkeypatch):
+    source = FlakySource(os.urandom(2 * PART_SIZE + 12345))
+    source.fail_at = 2 * PART_SIZE
+    store = UploadStateStore(str(tmp_path))
+    upload = store.upload("1", source, BUCKET, KEY)
+    with pytest.raises(IOError):
+        upload.run()
+    store.save("1", upload, force=True)
+
+    # a later run picks up where the failed upload stopped
+    source.fail_at = None
+    uploaded = []
+    upload_part = client.upload_part
+    monkeypatch.setattr(
+        client,
+        "upload_part",
+        lambda **kwargs: uploaded.append(kwargs["PartNumber"]) or upload_part(**kwargs),
+    )
+    upload = UploadStateStore(str(tmp_path)).upload("1", source, BUCKET, KEY)
+    assert sorted(upload.parts) == [1, 2]
+    source.reads = []
+    hashes = upload.run()
+    assert source.reads == [2 * PART_SIZE]
+    assert uploaded == [3]
+    assert hashes["md5"] == hashlib.md5(source.data).hexdigest()
+    store.discard("1")
+    assert os.listdir(str(tmp_path)) == []
+
+    # state for a different file is not resumed
+    store.save("1", upload, force=True)
+    upload = store.upload("1", FlakySource(b"changed"), BUCKET, KEY)
+    assert upload.upload_id is None and upload.parts == {}
+
+
+def test_cleanup_stale_uploads(tmp_path, client):
+    source = FlakySource(os.urandom(2 * PART_SIZE))
+    source.fail_at = PART_SIZE
+    store = UploadStateStore(str(tmp_path))
+    upload = store.upload("1", source, BUCKET, KEY)
+    with pytest.raises(IOError):
+        upload.run()
+    store.save("1", upload, force=True)
+    client.create_multipart_upload(Bucket=BUCKET, Key="prefix/resources/2/untracked")
+
+    # moto reports every upload as initiated in 2010, so the untracked upload is
+    # stale; the tracked upload's age is taken from its state
+    UploadStateStore(str(tmp_path)).cleanup(BUCKET, "prefix/resources/")
+    uploads = client.list_multipart_uploads(Bucket=BUCKET)["Uploads"]
+    assert [t["UploadId"] for t in uploads] == [upload.upload_id]
+
+    UploadStateStore(str(tmp_path), max_age_days=0).cleanup(BUCKET, "prefix/resources/")
+    assert client.list_multipart_uploads(Bucket=BUCKET).get("Uploads", []) == []
+    assert os.listdir(str(tmp_path)) == []
@@ -0,0 +1,183 @@
+import datetime
+import json
+import os
+import threading
+import time
+from urllib.parse import quote
+
+import botocore.exceptions
+
+from .libs.s3 import get_s3_client
+from .libs.transfer import StreamingUpload
+from .util import make_logger
+
+logger = make_logger(__name__)
+
+# the state of an upload in progress is written at most this often (in seconds),
+# and whenever an upload fails
+CHECKPOINT_INTERVAL = 30
+
+
+class UploadStateStore:
+    """
+    the state of the S3 multipart uploads of resources: the upload id, part size
+    and the ETag of each part uploaded. an upload which fails, or is interrupted,
+    is resumed by a later run rather than started again from the first byte.
+
+    each resource has its own state file, replaced atomically, so concurrent
+    upload workers never write to the same file. uploads not completed within
+    `max_age_days` are aborted by `cleanup`, along with their state.
+    """
+
+    def __init__(self, path, max_age_days=7):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.max_age = max_age_days * 86400
+        self._lock = threading.Lock()
+        self._saved = {}
+
+    def _state_path(self, resource_id):
+        return os.path.join(self.path, quote(resource_id, safe="") + ".json")
+
+    def _load(self, resource_id):
+        try:
+            with open(self._state_path(resource_id)) as fd:
+                return json.load(fd)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            logger.warning("discarding corrupt upload state for %s" % (resource_id))
+            return None
+
+    def save(self, resource_id, upload, force=False):
+        "record the state of `upload`. unless `force` is set, this is rate limited"
+        if upload.upload_id is None:
+            return
+        now = time.time()
+        with self._lock:
+            if (
+                not force
+                and now - self._saved.get(resource_id, 0) < CHECKPOINT_INTERVAL
+            ):
+                return
+            self._saved[resource_id] = now
+        state = upload.state()
+        existing = self._load(resource_id)
+        if existing is not None and existing["upload_id"] == state["upload_id"]:
+            state["started"] = existing["started"]
+        else:
+            state["started"] = now
+        fname = self._state_path(resource_id)
+        tmpf = "{}.{}.new".format(fname, threading.get_ident())
+        try:
+            with open(tmpf, "w") as fd:
+                json.dump(state, fd)
+            os.replace(tmpf, fname)
+        except OSError as e:
+            logger.error("unable to save upload state for %s: %s" % (resource_id, e))
+
+    def discard(self, resource_id):
+        with self._lock:
+            self._saved.pop(resource_id, None)
+        try:
+            os.unlink(self._state_path(resource_id))
+        except FileNotFoundError:
+            pass
+
+    def _abort(self, bucket, key, upload_id):
+        try:
+            get_s3_client().abort_multipart_upload(
+                Bucket=bucket, Key=key, UploadId=upload_id
+            )
+        except botocore.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] != "NoSuchUpload":
+                logger.error("unable to abort upload of %s: %s" % (key, e))
+
+    def _upload_exists(self, state):
+        try:
+            get_s3_client().list_parts(
+                Bucket=state["bucket"],
+                Key=state["key"],
+                UploadId=state["upload_id"],
+                MaxParts=1,
+            )
+        except botocore.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] == "NoSuchUpload":
+                return False
+            raise
+        return True
+
+    def upload(self, resource_id, source, bucket, key):
+        """
+        a StreamingUpload of `source` for the resource, resuming the upload
+        recorded for it if there is one for the same object and file size
+        """
+        size = source.size()
+        upload = StreamingUpload(
+            source,
+            bucket,
+            key,
+            size=size,
+            checkpoint=lambda: self.save(resource_id, upload),
+        )
+        state = self._load(resource_id)
+        if state is None:
+            return upload
+        if (
+            (state["bucket"], state["key"], state["size"]) == (bucket, key, size)
+            and time.time() - state["started"] < self.max_age
+            and self._upload_exists(state)
+        ):
+            logger.info(
+                "resuming upload of %s: %d parts already uploaded"
+                % (key, len(state["parts"]))
+            )
+            upload.upload_id = state["upload_id"]
+            upload.part_size = state["part_size"]
+            upload.parts = dict((int(k), v) for k, v in state["parts"].items())
+        else:
+            logger.info("discarding stale upload state for %s" % (key))
+            self._abort(state["bucket"], state["key"], state["upload_id"])
+            self.discard(resource_id)
+        return upload
+
+    def cleanup(self, bucket, prefix):
+        """
+        abort uploads older than `max_age_days`: those recorded in this store,
+        and any others in progress under `prefix` in `bucket`, e.g. left by a
+        run which was killed before it could record them. the age of a recorded
+        upload is taken from its state, so that it is not reset by resuming
+        """
+        now = time.time()
+        aborted = 0
+        tracked = set()
+        for fname in os.listdir(self.path):
+            if not fname.endswith(".json"):
+                continue
+            fpath = os.path.join(self.path, fname)
+            try:
+                with open(fpath) as fd:
+                    state = json.load(fd)
+            except ValueError:
+                os.unlink(fpath)
+                continue
+            if now - state["started"] >= self.max_age:
+                self._abort(state["bucket"], state["key"], state["upload_id"])
+                os.unlink(fpath)
+                aborted += 1
+            else:
+                tracked.add(state["upload_id"])
+
+        cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+            seconds=self.max_age
+        )
+        paginator = get_s3_client().get_paginator("list_multipart_uploads")
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for upload in page.get("Uploads", []):
+                if upload["UploadId"] in tracked:
+                    continue
+                if upload["Initiated"] < cutoff:
+                    self._abort(bucket, upload["Key"], upload["UploadId"])
+                    aborted += 1
+        if aborted:
+            logger.info("aborted %d stale multipart uploads" % (aborted))
@@ -52,8 +52,8 @@ def make_reuploads_cache_path(logger, args):
         )
     reuploads_dir = os.path.join(args.download_path, args.project_name)
     os.makedirs(reuploads_dir, exist_ok=True)
-    reupload_path = os.path.join(reuploads_dir, "reupload_resources.dump")
-    msg_activation = f"Activated reupload cache at {reupload_path} for"
+    reupload_path = os.path.join(reuploads_dir, "reupload_resources.jsonl")
+    msg_activation = f"Activated reuploads journal at {reupload_path} for"
     if args.read_reuploads:
         msg_activation += " reads"
     if args.write_reuploads:
@@ -62,6 +62,26 @@ def make_reuploads_cache_path(logger, args):
     return reupload_path
 
 
+def make_legacy_size_cache_path(logger, args):
+    if not args.legacy_size_cache:
+        return None
+    if not args.download_path:
+        raise Exception(
+            "To use the legacy size cache, download_path arg must also be set."
+        )
+    os.makedirs(args.download_path, exist_ok=True)
+    path = os.path.join(args.download_path, "legacy-sizes.json")
+    logger.info(f"Activated legacy size cache at {path}")
+    return path
+
+
+def make_upload_state_path(reuploads_path):
+    "multipart upload state is kept next to the reuploads cache"
+    if reuploads_path is None:
+        return None
+    return os.path.join(os.path.dirname(reuploads_path), "upload-state")
+
+
 def prune_dict(d, keys):
     if d is None:
         return None
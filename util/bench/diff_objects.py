@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+"""
+micro-benchmark of ops.diff_objects for unchanged packages, comparing the
+fast path with the previous implementation, which sorted and compared every
+field.
+
+usage: diff_objects.py [packages]
+"""
+
+import sys
+import time
+
+from bpaingest.ops import diff_objects
+
+
+def previous_diff_objects(obj1, obj2, desc, skip_differences=None):
+    def sort_if_list(v):
+        if isinstance(v, list):
+            return list(sorted(v, key=lambda v: repr(v)))
+        return v
+
+    differences = []
+    for k in list(obj1.keys()):
+        if skip_differences and k in skip_differences:
+            continue
+        v1 = sort_if_list(obj1.get(k))
+        v2 = sort_if_list(obj2.get(k))
+        if v1 != v2 and str(v1) != str(v2):
+            differences.append((k, v1, v2))
+    return len(differences) > 0
+
+
+def make_package(i):
+    package = {"id": "102.100.100/{}".format(i), "name": "bpa-{}".format(i)}
+    for field in range(120):
+        package["field_{}".format(field)] = "value {} {}".format(i, field)
+    package["tags"] = [{"name": "tag-{}".format(t)} for t in range(5)]
+    package["groups"] = [{"name": "group"}]
+    return package
+
+
+def bench(fn, pairs):
+    start = time.perf_counter()
+    for obj1, obj2 in pairs:
+        assert not fn(obj1, obj2, "package")
+    return time.perf_counter() - start
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    pairs = [(make_package(i), make_package(i)) for i in range(n)]
+    previous = bench(previous_diff_objects, pairs)
+    current = bench(diff_objects, pairs)
+    print("{} unchanged packages".format(n))
+    print("previous:  {:.3f}s".format(previous))
+    print("fast path: {:.3f}s ({:.1f}x)".format(current, previous / current))
+
+
+if __name__ == "__main__":
+    main()
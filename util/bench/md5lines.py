@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+"""
+micro-benchmark of MD5Parser against a synthetic md5 file of raw sequencing
+data, comparing the streaming parser with the previous implementation, which
+tried both md5 line expressions on every line and stored a groupdict for every
+match. reports the time to parse the file and the memory held by its matches.
+
+usage: md5lines.py [lines]
+"""
+
+import os
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from bpaingest.libs.common_resources import bsd_md5_re, linux_md5_re
+from bpaingest.libs.md5lines import MD5Parser
+from bpaingest.libs.raw_matcher import RawParser
+
+FASTQ_RE = re.compile(
+    r"""
+    (?P<library_id>\d{4,6})_
+    (?P<facility>[A-Z]+)_
+    (?P<flowcell_id>\w{9})_
+    (?P<index>[GATC-]+)_
+    (?P<lane>L\d{3})_
+    (?P<read>[RI][12])
+    \.fastq\.gz$
+""",
+    re.VERBOSE,
+)
+SKIP = [re.compile(r"^.*SampleSheet.*"), re.compile(r"^.*_metadata\.xlsx$")]
+
+
+def previous_md5lines(fd):
+    for line in fd:
+        line = line.strip()
+        if line == "":
+            continue
+        m = bsd_md5_re.match(line)
+        if m:
+            path, md5 = m.groups()
+            yield md5, path
+            continue
+        m = linux_md5_re.match(line)
+        if m:
+            md5, path = m.groups()
+            yield md5, path
+            continue
+        raise Exception("Could not parse MD5 line: %s" % line)
+
+
+class PreviousMD5Parser(RawParser):
+    def _parse(self, fname, match, skip):
+        with open(fname) as f:
+            for md5, path in previous_md5lines(f):
+                match_path = self._match_path(path)
+                if skip is not None and self._matching_regexp(skip, match_path):
+                    self.skipped.append(path)
+                    continue
+                m = self._matching_regexp(match, match_path)
+                if not m:
+                    self.no_match.append(path)
+                    continue
+                self.matches.append((path, md5, m.groupdict()))
+
+
+def write_md5_file(fname, lines):
+    with open(fname, "w") as fd:
+        for i in range(lines):
+            library_id = 10000 + i // 32
+            fd.write(
+                "%032x  raw/%d_AGRF_HLCH%dDSXX_ACGT-TGCA_L00%d_R%d.fastq.gz\n"
+                % (i, library_id, i % 7, 1 + i % 4, 1 + i % 2)
+            )
+            if i % 1000 == 0:
+                fd.write("%032x  raw/SampleSheet_%d.csv\n" % (i, i))
+
+
+def bench(parse):
+    "the time taken by `parse`, and the memory held by its result and at peak"
+    start = time.perf_counter()
+    parse()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    result = parse()
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, held, peak, result
+
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fname = os.path.join(tmpdir, "raw.md5")
+        write_md5_file(fname, lines)
+        previous, previous_held, _, previous_matches = bench(
+            lambda: PreviousMD5Parser(fname, [FASTQ_RE], SKIP).matches
+        )
+        streaming, _, streaming_peak, _ = bench(
+            lambda: sum(1 for _ in MD5Parser(fname, [FASTQ_RE], SKIP))
+        )
+        stored, stored_held, _, stored_matches = bench(
+            lambda: MD5Parser(fname, [FASTQ_RE], SKIP).matches
+        )
+    assert previous_matches == [tuple(t) for t in stored_matches]
+    print("{} md5 lines".format(lines))
+    print("previous:  {:.3f}s, {:.1f} MiB held".format(previous, previous_held / 2**20))
+    print(
+        "streaming: {:.3f}s ({:.1f}x), {:.1f} MiB peak".format(
+            streaming, previous / streaming, streaming_peak / 2**20
+        )
+    )
+    print(
+        "stored:    {:.3f}s, {:.1f} MiB held ({:.1f}x less)".format(
+            stored, stored_held / 2**20, previous_held / stored_held
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+"""
+micro-benchmark of the compiled PatternMatcher used by RawParser / MD5Parser,
+comparing it with the previous implementation, which matched every expression
+against every filename. for each project, the expressions defined in its
+files.py are matched against the filenames found in all the projects' tests,
+and the results of the two implementations are checked to be identical.
+
+usage: raw_matcher.py [repeat]
+"""
+
+import ast
+import glob
+import importlib
+import os
+import re
+import sys
+import time
+
+from bpaingest.libs.raw_matcher import PatternMatcher
+
+PROJECTS = os.path.join(os.path.dirname(__file__), "../../bpaingest/projects")
+
+
+def previous_matching_regexp(regexps, s):
+    matches = [t for t in [regexp.match(s) for regexp in regexps] if t]
+    if not matches:
+        return None
+    return matches[0]
+
+
+def pattern_sets():
+    for fname in sorted(glob.glob(os.path.join(PROJECTS, "*/files.py"))):
+        project = os.path.basename(os.path.dirname(fname))
+        module = importlib.import_module("bpaingest.projects.%s.files" % (project))
+        regexps = [t for t in vars(module).values() if isinstance(t, re.Pattern)]
+        if regexps:
+            yield project, regexps
+
+
+def test_filenames():
+    filenames = set()
+    for fname in glob.glob(os.path.join(PROJECTS, "*/test_*.py")):
+        with open(fname) as fd:
+            tree = ast.parse(fd.read())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Constant) and isinstance(node.value, str):
+                if "." in node.value and " " not in node.value:
+                    filenames.add(node.value)
+    return sorted(filenames)
+
+
+def bench(fn, filenames, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for s in filenames:
+            fn(s)
+    return time.perf_counter() - start
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    filenames = test_filenames()
+    print("{} filenames, {} repeats".format(len(filenames), repeat))
+    total_previous = total_compiled = 0
+    for project, regexps in pattern_sets():
+        matcher = PatternMatcher(regexps)
+        for s in filenames:
+            m1 = previous_matching_regexp(regexps, s)
+            m2 = matcher.match(s)
+            assert (m1 and (m1.re, m1.groupdict())) == (m2 and (m2.re, m2.groupdict()))
+        previous = bench(
+            lambda s: previous_matching_regexp(regexps, s), filenames, repeat
+        )
+        compiled = bench(matcher.match, filenames, repeat)
+        total_previous += previous
+        total_compiled += compiled
+        print(
+            "{:<22} {:>3} patterns  previous: {:.3f}s  compiled: {:.3f}s ({:.1f}x)".format(
+                project, len(regexps), previous, compiled, previous / compiled
+            )
+        )
+    print(
+        "total: previous {:.3f}s, compiled {:.3f}s ({:.1f}x)".format(
+            total_previous, total_compiled, total_previous / total_compiled
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
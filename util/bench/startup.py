@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+
+"""
+benchmark of bpa-ingest start up: the time for a fresh interpreter to import
+the CLI and list the project slugs, as `bpa-ingest --help` does, compared with
+also importing every project's ingest class, as was done before the project
+registry was made lazy.
+
+usage: startup.py [runs]
+"""
+
+import statistics
+import subprocess
+import sys
+import time
+
+LAZY = "from bpaingest import cli; sorted(cli.project_cli_options)"
+EAGER = LAZY + "; [t['cls'] for t in cli.project_info.metadata_info]"
+
+
+def bench(code, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.check_call([sys.executable, "-c", code])
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    eager = bench(EAGER, runs)
+    lazy = bench(LAZY, runs)
+    print("median of {} runs".format(runs))
+    print("all projects imported: {:.3f}s".format(eager))
+    print("lazy registry:         {:.3f}s ({:.1f}x)".format(lazy, eager / lazy))
+
+
+if __name__ == "__main__":
+    main()